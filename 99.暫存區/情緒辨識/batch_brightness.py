@@ -0,0 +1,189 @@
+# batch_brightness.py
+# 批次產生亮度 / 對比變化的影片 (擴增訓練資料)
+#
+# 調整影片亮度.py 一次只能用 Tk 視窗挑一支影片，每幀 BGR->HSV 後轉 float32 相乘、clip 再轉回 uint8。
+# 這裡改成不需要視窗的批次工具：
+#   - 整個資料夾 (可含子資料夾) 一次處理，每支影片交給一個子行程 (ProcessPoolExecutor)，速度隨核心數成長
+#   - 亮度 / 對比預先算成 256 格查表，以 cv2.LUT 只改 V 通道，不做浮點運算
+#   - 每幀只解碼、轉 HSV 一次，所有變化版本在同一輪寫出
+#   - 輸出檔已存在且比來源新時略過 (--overwrite 強制重做)
+# 亮度 1.5 / 0.5 的結果與原本的 adjust_brightness() 完全相同。
+#
+# 用法：
+#   python batch_brightness.py                                   # raw_videos -> processed_videos，bright / dark
+#   python batch_brightness.py D:\videos --output D:\aug --recursive --workers 8 \
+#       --variants bright:1.5 dark:0.5 flat:1.0:0.6 punchy:1.1:1.3
+# 變化格式：名稱:亮度[:對比]，對比以 V=128 為中心縮放，再乘上亮度
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+PROJECT_DIR = r"C:\MicroExpressionProject"
+VIDEO_DIR = os.path.join(PROJECT_DIR, "data", "raw_videos")
+OUTPUT_DIR = os.path.join(PROJECT_DIR, "data", "processed_videos")
+VIDEO_EXTS = (".mp4", ".avi", ".mov", ".mkv")
+DEFAULT_VARIANTS = ["bright:1.5", "dark:0.5"]
+
+
+def parse_variant(spec: str):
+    """"名稱:亮度[:對比]" -> (名稱, 亮度, 對比)"""
+    parts = spec.split(":")
+    if len(parts) not in (2, 3) or not parts[0]:
+        raise argparse.ArgumentTypeError(f"變化格式應為 名稱:亮度[:對比]，收到 {spec!r}")
+    try:
+        brightness = float(parts[1])
+        contrast = float(parts[2]) if len(parts) == 3 else 1.0
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"亮度 / 對比必須是數字: {spec!r}")
+    return parts[0], brightness, contrast
+
+
+def build_lut(brightness: float = 1.0, contrast: float = 1.0) -> np.ndarray:
+    """V 通道的 256 格查表 (與 float32 相乘、clip、astype(uint8) 的結果相同)"""
+    v = np.arange(256, dtype=np.float32)
+    v = ((v - 128) * contrast + 128) * brightness
+    return v.clip(0, 255).astype(np.uint8)
+
+
+def _open_writer(path: str, fourcc: int, fps: float, size):
+    writer = cv2.VideoWriter(path, fourcc, fps, size)
+    if not writer.isOpened():
+        # 來源的編碼不一定能寫進 .mp4，改用 mp4v
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    if not writer.isOpened():
+        raise RuntimeError(f"無法寫入影片: {path}")
+    return writer
+
+
+def process_video(video_path: str, outputs: dict, variants: list) -> dict:
+    """
+    (子行程) 解碼一次，寫出所有變化版本
+
+    outputs：{變化名稱: 輸出路徑}，variants：[(名稱, 亮度, 對比)]
+    """
+    cv2.setNumThreads(1)  # 平行度由行程數提供
+    t0 = time.perf_counter()
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"無法開啟影片: {video_path}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+
+    luts = [(name, build_lut(b, c)) for name, b, c in variants]
+    writers = {}
+    frames = 0
+    completed = False
+    try:
+        for name, _ in luts:
+            writers[name] = _open_writer(outputs[name], fourcc, fps, (w, h))
+
+        # 每幀共用的 buffer：HSV 只轉一次，各版本只換 V 通道
+        hsv = v_out = merged = out = None
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=hsv)
+            hue, sat, val = cv2.split(hsv)
+            for name, lut in luts:
+                v_out = cv2.LUT(val, lut, dst=v_out)
+                merged = cv2.merge((hue, sat, v_out), dst=merged)
+                out = cv2.cvtColor(merged, cv2.COLOR_HSV2BGR, dst=out)
+                writers[name].write(out)
+            frames += 1
+        completed = True
+    finally:
+        cap.release()
+        for writer in writers.values():
+            writer.release()
+        if not completed:
+            # 不留下寫到一半的檔案 (否則下次會被當成已完成而略過)
+            for name in writers:
+                try:
+                    os.remove(outputs[name])
+                except OSError:
+                    pass
+
+    return {"frames": frames, "seconds": time.perf_counter() - t0}
+
+
+def collect_videos(paths: list, recursive: bool):
+    """回傳 [(影片路徑, 相對於輸入資料夾的子資料夾)]"""
+    videos = []
+    for path in paths:
+        if os.path.isfile(path):
+            videos.append((path, ""))
+            continue
+        for root, dirs, files in os.walk(path):
+            if not recursive:
+                dirs.clear()
+            rel = os.path.relpath(root, path)
+            for name in sorted(files):
+                if name.lower().endswith(VIDEO_EXTS):
+                    videos.append((os.path.join(root, name), "" if rel == "." else rel))
+    return videos
+
+
+def _is_up_to_date(src: str, dst: str) -> bool:
+    return os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批次產生亮度 / 對比變化的影片")
+    parser.add_argument("inputs", nargs="*", default=[VIDEO_DIR], help="影片檔或資料夾 (預設 raw_videos)")
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    parser.add_argument("--variants", nargs="+", type=parse_variant, default=[parse_variant(v) for v in DEFAULT_VARIANTS],
+                        help="名稱:亮度[:對比] (預設 bright:1.5 dark:0.5)")
+    parser.add_argument("--recursive", action="store_true", help="包含子資料夾 (輸出保留相同的資料夾結構)")
+    parser.add_argument("--workers", type=int, default=0, help="子行程數 (預設 CPU 核心數)")
+    parser.add_argument("--overwrite", action="store_true", help="輸出已存在時也重新產生")
+    args = parser.parse_args()
+
+    tasks = []
+    for video_path, rel in collect_videos(args.inputs, args.recursive):
+        out_dir = os.path.join(args.output, rel)
+        stem = os.path.splitext(os.path.basename(video_path))[0]
+        outputs = {name: os.path.join(out_dir, f"{stem}_{name}.mp4") for name, _, _ in args.variants}
+        variants = [v for v in args.variants if args.overwrite or not _is_up_to_date(video_path, outputs[v[0]])]
+        if variants:
+            os.makedirs(out_dir, exist_ok=True)
+            tasks.append((video_path, outputs, variants))
+
+    if not tasks:
+        print("✅ 沒有需要處理的影片")
+        return
+
+    workers = min(len(tasks), args.workers or os.cpu_count() or 1)
+    print(f"🚀 處理 {len(tasks)} 支影片 ({workers} 個行程)，變化: {', '.join(v[0] for v in args.variants)}")
+    t0 = time.perf_counter()
+    total_frames, failed = 0, 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_video, *task): task[0] for task in tasks}
+        for i, future in enumerate(as_completed(futures), 1):
+            video_path = futures[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"  ❌ [{i}/{len(tasks)}] {os.path.basename(video_path)}: {e}")
+                continue
+            total_frames += stats["frames"]
+            print(f"  ✅ [{i}/{len(tasks)}] {os.path.basename(video_path)}: {stats['frames']} 幀, "
+                  f"{stats['frames'] / max(stats['seconds'], 1e-9):.0f} fps")
+
+    elapsed = time.perf_counter() - t0
+    print(f"🎉 完成：{total_frames} 幀，{elapsed:.1f}s ({total_frames / max(elapsed, 1e-9):.0f} fps 總計)"
+          + (f"，{failed} 支失敗" if failed else ""))
+    print(f"📁 輸出資料夾: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# face_crop_cache.py
+# 訓練用的人臉裁切快取
+#
+# 原本的 VideoFrameDataset 每次執行都重新解碼 test_videos 裡所有影片、跑 Haar，
+# 並把每張原尺寸的人臉裁切都放在 self.data (RAM) 裡，影片一多啟動就要好幾分鐘、記憶體也跟著漲。
+# 這裡改成：
+#   1. build_cache()：每支影片交給一個子行程 (ProcessPoolExecutor) 解碼 + 偵測 + 縮放到 224x224，
+#      每 SHARD_SIZE 張存成一個 shard：<cache>/shards/<影片檔名>_<k>.npy (uint8, RGB, N x 224 x 224 x 3)
+#      index.json 記錄每個 shard 的標籤 / 張數，以及來源影片的大小與修改時間
+#      再次執行時只處理新增或修改過的影片，沒變的影片直接沿用 (啟動幾乎不花時間)
+#   2. FaceCropDataset：以 np.load(mmap_mode="r") 讀 shard，只有用到的畫面才會從磁碟載入，
+#      RAM 不隨資料量成長；DataLoader 的每個 worker 各自開啟 memmap
+#
+# 單獨執行：python face_crop_cache.py [影片資料夾] [快取資料夾] [--workers N]
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+from PIL import Image
+from torch.utils.data import Dataset
+
+CROP_SIZE = 224
+SHARD_SIZE = 256  # 每個 shard 約 38 MB；也是每個子行程最多暫存在 RAM 的張數
+INDEX_VERSION = 1
+VIDEO_EXTS = (".mp4", ".avi")
+
+
+def label_of(video_path: str) -> str:
+    """影片檔名的第一段就是標籤 (例如 nervous_001.mp4 -> nervous)"""
+    return os.path.basename(video_path).split("_")[0]
+
+
+def _video_key(video_path: str) -> dict:
+    stat = os.stat(video_path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def _extract_video(video_path: str, shard_dir: str, haar_path: str, size: int, shard_size: int) -> list:
+    """(子行程) 解碼一支影片，把人臉裁切分批寫成 shard，回傳 [{"file", "count"}]"""
+    cv2.setNumThreads(1)  # 平行度由行程數提供，避免每個行程再開滿 OpenCV 線程
+    face_cascade = cv2.CascadeClassifier(haar_path)
+    # 含副檔名，a.mp4 與 a.avi 不會互相覆蓋
+    stem = os.path.basename(video_path)
+
+    # 先清掉這支影片舊的 shard (影片被修改過，或上次萃取到一半中斷)
+    for name in os.listdir(shard_dir):
+        if name.rsplit("_", 1)[0] == stem:
+            os.remove(os.path.join(shard_dir, name))
+
+    buffer = np.empty((shard_size, size, size, 3), dtype=np.uint8)
+    shards, count = [], 0
+
+    def flush():
+        nonlocal count
+        if count == 0:
+            return
+        name = f"{stem}_{len(shards)}.npy"
+        np.save(os.path.join(shard_dir, name), buffer[:count])
+        shards.append({"file": name, "count": count})
+        count = 0
+
+    cap = cv2.VideoCapture(video_path)
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5)
+        if len(faces) == 0:
+            continue
+        x, y, w, h = faces[0]
+        face_crop = frame[y:y+h, x:x+w]
+        interpolation = cv2.INTER_AREA if (w > size or h > size) else cv2.INTER_LINEAR
+        # 直接寫進 shard buffer：縮放 + BGR->RGB，不另外配置
+        cv2.resize(face_crop, (size, size), dst=buffer[count], interpolation=interpolation)
+        cv2.cvtColor(buffer[count], cv2.COLOR_BGR2RGB, dst=buffer[count])
+        count += 1
+        if count == shard_size:
+            flush()
+    cap.release()
+    flush()
+    return shards
+
+
+def _load_index(cache_dir: str) -> dict:
+    try:
+        with open(os.path.join(cache_dir, "index.json"), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION:
+            return index
+    except (OSError, ValueError):
+        pass
+    return {"version": INDEX_VERSION, "videos": {}}
+
+
+def _save_index(cache_dir: str, index: dict):
+    path = os.path.join(cache_dir, "index.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def build_cache(video_dir: str, cache_dir: str, haar_path: str, workers: int = 0,
+                size: int = CROP_SIZE, shard_size: int = SHARD_SIZE) -> dict:
+    """
+    建立 / 更新人臉裁切快取，回傳 index
+
+    只處理新增或修改過的影片；已經不存在的影片會從 index 與 shard 中移除
+    """
+    shard_dir = os.path.join(cache_dir, "shards")
+    os.makedirs(shard_dir, exist_ok=True)
+    index = _load_index(cache_dir)
+    if index.get("size") != size:
+        index = {"version": INDEX_VERSION, "size": size, "videos": {}}
+
+    videos = sorted(f for f in os.listdir(video_dir) if f.endswith(VIDEO_EXTS))
+    for name in set(index["videos"]) - set(videos):
+        for shard in index["videos"].pop(name)["shards"]:
+            try:
+                os.remove(os.path.join(shard_dir, shard["file"]))
+            except OSError:
+                pass
+
+    todo = []
+    for name in videos:
+        key = _video_key(os.path.join(video_dir, name))
+        entry = index["videos"].get(name)
+        if entry is None or entry["size"] != key["size"] or entry["mtime"] != key["mtime"]:
+            todo.append(name)
+
+    if todo:
+        t0 = time.perf_counter()
+        workers = min(len(todo), workers or os.cpu_count() or 1)
+        print(f"🎞️ 萃取 {len(todo)} 支影片的人臉 ({workers} 個行程)，其餘 {len(videos) - len(todo)} 支沿用快取")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_extract_video, os.path.join(video_dir, name), shard_dir, haar_path, size, shard_size): name
+                for name in todo
+            }
+            for i, future in enumerate(as_completed(futures), 1):
+                name = futures[future]
+                shards = future.result()
+                index["videos"][name] = {
+                    **_video_key(os.path.join(video_dir, name)),
+                    "label": label_of(name),
+                    "shards": shards,
+                }
+                # 每支影片完成就寫入 index，中斷後重跑不必從頭開始
+                _save_index(cache_dir, index)
+                print(f"  [{i}/{len(todo)}] {name}: {sum(s['count'] for s in shards)} 張人臉")
+        print(f"✅ 人臉快取更新完成 ({time.perf_counter() - t0:.1f}s)")
+    else:
+        print(f"✅ 人臉快取已是最新 ({len(videos)} 支影片)")
+
+    _save_index(cache_dir, index)
+    return index
+
+
+class FaceCropDataset(Dataset):
+    """
+    從 build_cache() 的 shard 讀取人臉 (224x224 RGB)
+
+    與 VideoFrameDataset 相同的介面：classes / class_to_idx，__getitem__ 回傳 (transform(PIL 圖片), 標籤 index)
+    """
+
+    def __init__(self, cache_dir: str, transform=None):
+        self.shard_dir = os.path.join(cache_dir, "shards")
+        self.transform = transform
+        index = _load_index(cache_dir)
+
+        entries = [v for _, v in sorted(index["videos"].items())]
+        self.classes = sorted({v["label"] for v in entries if any(s["count"] for s in v["shards"])})
+        self.class_to_idx = {cls_name: i for i, cls_name in enumerate(self.classes)}
+
+        # 每個 shard 一筆：檔名、標籤、第一張的全域 index
+        self.files, labels, counts = [], [], []
+        for v in entries:
+            for shard in v["shards"]:
+                if shard["count"]:
+                    self.files.append(shard["file"])
+                    labels.append(self.class_to_idx[v["label"]])
+                    counts.append(shard["count"])
+        self.shard_labels = np.array(labels, dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+        self._arrays = {}
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def _shard(self, i: int):
+        array = self._arrays.get(i)
+        if array is None:
+            array = np.load(os.path.join(self.shard_dir, self.files[i]), mmap_mode="r")
+            self._arrays[i] = array
+        return array
+
+    def __getstate__(self):
+        # DataLoader worker (Windows 為 spawn) 不複製已開啟的 memmap，各自重新開啟
+        state = self.__dict__.copy()
+        state["_arrays"] = {}
+        return state
+
+    def __getitem__(self, idx):
+        i = int(np.searchsorted(self.offsets, idx, side="right")) - 1
+        img = Image.fromarray(np.asarray(self._shard(i)[idx - self.offsets[i]]))
+        if self.transform:
+            img = self.transform(img)
+        return img, int(self.shard_labels[i])
+
+
+def main():
+    project_dir = r"C:\MicroExpressionProject"
+    parser = argparse.ArgumentParser(description="建立訓練用的人臉裁切快取")
+    parser.add_argument("video_dir", nargs="?", default=os.path.join(project_dir, "data", "test_videos"))
+    parser.add_argument("cache_dir", nargs="?", default=os.path.join(project_dir, "data", "face_cache"))
+    parser.add_argument("--haar", default=os.path.join(project_dir, "data", "haarcascade_frontalface_default.xml"))
+    parser.add_argument("--workers", type=int, default=0, help="子行程數 (預設 CPU 核心數)")
+    args = parser.parse_args()
+
+    build_cache(args.video_dir, args.cache_dir, args.haar, args.workers)
+    dataset = FaceCropDataset(args.cache_dir)
+    print(f"📦 共 {len(dataset)} 張人臉，類別: {dataset.classes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,93 @@
 # emotion.py
 # 情緒分析 API 路由
 
-from fastapi import APIRouter, UploadFile, File, Form, Request
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, UploadFile, File, Form, Request, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import FileResponse
+from starlette.requests import ClientDisconnect
 from app.services.emotion_service import (
     analyze_video, 
     analyze_portfolio, 
     get_video_storage_dir
 )
 from app.services.question_generator import analyze_pdf_and_generate_questions
+from app.services.stream_analyzer import StreamSession
+from app.services.live_analyzer import LiveSession
+from app.services.result_cache import HashingWriter
+from app.services.timeline import get_timeline_store
+from app.core import metrics
+from app.core.upload_stream import RequestBodyReader, BodyStreamingResponse
+import asyncio
+import json
 import uuid
 import os
 
 router = APIRouter()
 
+# 上傳影片時每次讀取的大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def save_uploaded_video(video: UploadFile):
+    """儲存上傳的影片，回傳 (影片路徑, 內容 sha256)"""
+    video_dir = get_video_storage_dir()
+    filename = f"{uuid.uuid4()}.mp4"
+    video_path = os.path.join(video_dir, filename)
+    
+    # 分段讀取上傳內容，邊寫檔邊計算 hash (給結果快取用)
+    with metrics.span("upload_write"):
+        writer = HashingWriter(video_path)
+        try:
+            while True:
+                chunk = await video.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+        finally:
+            content_hash = writer.close()
+    
+    print(f"📥 收到影片，已存檔至: {video_path}")
+    return video_path, content_hash
+
+
+async def save_uploaded_pdf(pdf: UploadFile, prefix: str = "") -> str:
+    """儲存上傳的 PDF 到 static 目錄，回傳路徑"""
+    video_dir = get_video_storage_dir()
+    parent_dir = os.path.dirname(video_dir)
+    pdf_filename = f"{prefix}{uuid.uuid4()}.pdf"
+    pdf_path = os.path.join(parent_dir, pdf_filename)
+    
+    with metrics.span("upload_write"):
+        content = await pdf.read()
+        with open(pdf_path, "wb") as f:
+            f.write(content)
+    return pdf_path
+
 
 @router.post("/analyze")
 async def api_analyze_video(
     video: UploadFile = File(...),
-    save_video: str = Form(default="true")
+    save_video: str = Form(default="true"),
+    max_points: int = Form(default=-1),
+    user_id: str = Form(default="")
 ):
     """
     分析影片情緒
     
     - **video**: 上傳的影片檔案 (MP4)
     - **save_video**: 是否保存影片 ("true" / "false")
+    - **max_points**: timeline 最多幾個點 (預設 EMOTION_TIMELINE_MAX_POINTS，0 = 不限制)
+    - **user_id**: 學生 id (選填)，有個人化分類頭時使用
     
     Returns:
-        情緒分析結果，包含 emotions, timeline, ai_analysis, video_url
+        情緒分析結果，包含 emotions, timeline, timeline_id, ai_analysis, video_url
     """
     # 儲存上傳的影片
-    video_dir = get_video_storage_dir()
-    filename = f"{uuid.uuid4()}.mp4"
-    video_path = os.path.join(video_dir, filename)
-    
-    content = await video.read()
-    with open(video_path, "wb") as f:
-        f.write(content)
-    
-    print(f"📥 收到影片，已存檔至: {video_path}")
+    video_path, content_hash = await save_uploaded_video(video)
     
     # 分析影片
     save_flag = save_video.lower() == "true"
-    result = await analyze_video(video_path, save_flag)
+    result = await analyze_video(video_path, save_flag, content_hash=content_hash,
+                                 max_points=max_points if max_points >= 0 else None, user_id=user_id or None)
     
     if "error" in result:
         return result, 400 if "No face" in result.get("error", "") else 500
@@ -50,6 +95,202 @@ async def api_analyze_video(
     return result
 
 
+@router.get("/timeline/{timeline_id}")
+def api_timeline_window(timeline_id: str, start: float = 0, end: float = None, max_points: int = 0):
+    """
+    取得某段時間的完整解析度 timeline
+
+    - **timeline_id**: 分析結果中的 timeline_id
+    - **start** / **end**: 時間範圍 (秒)，預設整段
+    - **max_points**: 大於 0 時同樣以 LTTB 降取樣
+    """
+    points = get_timeline_store().window(timeline_id, start, end, max_points)
+    if points is None:
+        raise HTTPException(status_code=404, detail="timeline not found or expired")
+    return {"timeline_id": timeline_id, "start": start, "end": end, "points": points}
+
+
+async def _cancel_task(task):
+    """取消並等待背景 task 結束 (task 可能是 None 或已經結束)"""
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/analyze_stream")
+async def api_analyze_stream(request: Request, fps: float = 0, save_video: str = "false"):
+    """
+    邊上傳邊分析影片 (Server-Sent Events)
+
+    - 請求內容直接是影片串流 (fragmented MP4，或 moov 在開頭的 MP4)，以 chunked 方式上傳
+    - **fps**: 每秒分析幾幀 (預設 EMOTION_STREAM_FPS)
+    - **save_video**: 是否保存影片 ("true" / "false")
+
+    Returns:
+        text/event-stream：分析中持續送出 partial (新的 timeline 點與目前平均)，
+        結束時送出 result (格式同 /analyze) 或 error
+    """
+    session = StreamSession("fmp4", fps, save_video.lower() == "true")
+    # 回應開始前就開始讀取請求內容 (在 generator 裡才讀會被 StreamingResponse 的斷線偵測搶走)
+    body = RequestBodyReader(request)
+
+    async def feed():
+        async for chunk in body.chunks():
+            await session.push(chunk)
+
+    async def events():
+        finished = False
+        feeder = None
+        try:
+            await session.start()
+            feeder = asyncio.create_task(feed())
+            async for update in session.partials_while(feeder):
+                yield sse_event("partial", update)
+            update = session.poll(force=True)
+            if update:
+                yield sse_event("partial", update)
+            result = await session.finish()
+            finished = True
+            yield sse_event("error" if "error" in result else "result", result)
+        except ClientDisconnect:
+            print("📡 [Stream] 前端中斷上傳")
+        except Exception as e:
+            print(f"❌ [Stream] 串流分析錯誤: {e}")
+            yield sse_event("error", {"error": f"Error: {str(e)}"})
+        finally:
+            # 包含前端離開、回應被取消的情況
+            await _cancel_task(feeder)
+            if not finished:
+                await session.abort()
+            await body.close()
+
+    return BodyStreamingResponse(events(), body, media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.websocket("/stream")
+async def ws_stream_analyze(websocket: WebSocket, format: str = "fmp4", fps: float = 0, save_video: str = "false"):
+    """
+    邊錄邊分析 (WebSocket)
+
+    - 連線參數：?format=fmp4|jpeg&fps=10&save_video=false
+    - 前端送 binary：fmp4 為影片片段，jpeg 為一張畫面；送文字 "end" 表示結束
+    - 後端送 JSON：{"type": "partial", ...}，最後 {"type": "result", ...} 或 {"type": "error", ...}
+    """
+    await websocket.accept()
+    try:
+        session = StreamSession(format, fps, save_video.lower() == "true")
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "error": str(e)})
+        await websocket.close()
+        return
+
+    async def feed():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect()
+            if message.get("bytes"):
+                await session.push(message["bytes"])
+            elif message.get("text", "").strip() == "end":
+                return
+
+    feeder = None
+    try:
+        await session.start()
+        # 接收在 feeder task 中進行；這裡定時送出部分結果 (只有這裡呼叫 send_json)
+        feeder = asyncio.create_task(feed())
+        async for update in session.partials_while(feeder):
+            await websocket.send_json(update)
+
+        update = session.poll(force=True)
+        if update:
+            await websocket.send_json(update)
+        result = await session.finish()
+        result["type"] = "error" if "error" in result else "result"
+        await websocket.send_json(result)
+        await websocket.close()
+    except WebSocketDisconnect:
+        print("📡 [Stream] 前端中斷連線")
+        await _cancel_task(feeder)
+        await session.abort()
+    except Exception as e:
+        print(f"❌ [Stream] 串流分析錯誤: {e}")
+        await _cancel_task(feeder)
+        await session.abort()
+        await websocket.send_json({"type": "error", "error": f"Error: {str(e)}"})
+        await websocket.close()
+
+
+@router.websocket("/live")
+async def ws_live_emotion(websocket: WebSocket, format: str = "jpeg", width: int = 0, height: int = 0,
+                          rate: float = 0):
+    """
+    即時情緒辨識 (WebSocket)
+
+    - 連線參數：?format=jpeg|bgr|rgba&width=&height=&rate=5 (未壓縮畫面需提供 width / height)
+    - 前端持續送 binary 畫面；後端約每 1/rate 秒回傳一次最新畫面的結果：
+      {"type": "emotion", "face": true, "emotions": {...}, "top": "...", "latency_ms": 40, "dropped": 3}
+    - 來不及處理的舊畫面會被丟棄 (dropped)，不會排隊造成延遲
+    """
+    await websocket.accept()
+    try:
+        session = LiveSession(format, width, height, rate)
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "error": str(e)})
+        await websocket.close()
+        return
+
+    async def send_updates():
+        while True:
+            try:
+                update = await session.next_update()
+            except Exception as e:
+                print(f"❌ [Live] 辨識錯誤: {e}")
+                update = {"type": "error", "error": f"Error: {str(e)}"}
+            await websocket.send_json(update)
+
+    sender = asyncio.create_task(send_updates())
+    print(f"🎥 [Live] 即時辨識開始 (格式: {format})")
+    disconnected = False
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                disconnected = True
+                break
+            if message.get("bytes"):
+                session.offer(message["bytes"])
+            elif message.get("text", "").strip() == "end":
+                break
+    except WebSocketDisconnect:
+        disconnected = True
+    finally:
+        # 先停止送出結果 (等 task 真正結束，避免在關閉後還呼叫 send_json)，再關閉連線
+        sender.cancel()
+        try:
+            await sender
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"⚠️ [Live] 結果送出中斷: {e}")
+        if not disconnected:
+            try:
+                await websocket.close()
+            except RuntimeError:
+                # 前端已經先關閉
+                pass
+        print(f"🎥 [Live] 即時辨識結束：收到 {session.received} 張，處理 {session.processed} 張，丟棄 {session.dropped} 張")
+
+
 @router.post("/analyze_portfolio")
 async def api_analyze_portfolio(pdf: UploadFile = File(...)):
     """
@@ -61,14 +302,7 @@ async def api_analyze_portfolio(pdf: UploadFile = File(...)):
         學習歷程分析結果
     """
     # 儲存上傳的 PDF
-    video_dir = get_video_storage_dir()
-    parent_dir = os.path.dirname(video_dir)
-    pdf_filename = f"{uuid.uuid4()}.pdf"
-    pdf_path = os.path.join(parent_dir, pdf_filename)
-    
-    content = await pdf.read()
-    with open(pdf_path, "wb") as f:
-        f.write(content)
+    pdf_path = await save_uploaded_pdf(pdf)
     
     print(f"📄 收到 PDF: {pdf.filename}")
     
@@ -96,14 +330,7 @@ async def api_generate_questions(
         生成的面試問題列表
     """
     # 儲存上傳的 PDF
-    video_dir = get_video_storage_dir()
-    parent_dir = os.path.dirname(video_dir)
-    pdf_filename = f"questions_{uuid.uuid4()}.pdf"
-    pdf_path = os.path.join(parent_dir, pdf_filename)
-    
-    content = await pdf.read()
-    with open(pdf_path, "wb") as f:
-        f.write(content)
+    pdf_path = await save_uploaded_pdf(pdf, prefix="questions_")
     
     print(f"📄 收到問題生成請求: {pdf.filename} (類型: {interview_type})")
     
@@ -111,9 +338,10 @@ async def api_generate_questions(
     result = await analyze_pdf_and_generate_questions(pdf_path, interview_type)
     
     # 刪除暫存 PDF
-    try:
-        os.remove(pdf_path)
-    except:
-        pass
+    with metrics.span("file_cleanup"):
+        try:
+            os.remove(pdf_path)
+        except:
+            pass
     
     return result
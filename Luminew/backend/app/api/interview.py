@@ -6,6 +6,7 @@ from app.services.minimax_tts import MinimaxTTSWS
 from app.services.yating_stt import YatingSTT
 from app.services.InterviewManager import InterviewManager
 from app.services.professor_persona import get_professor_persona
+from app.core import metrics
 from fastapi import APIRouter
 from app.services.InterviewManager import InterviewManager
 
@@ -21,6 +22,7 @@ app = FastAPI(title="Luminew Interview API")
 
 # 連接 WebSocket 的每個 client 都會有自己的 InterviewManager
 clients = {}
+metrics.register_sessions("interview", lambda: len(clients))
 
 
 @router.websocket("/ws/{client_id}")
@@ -0,0 +1,145 @@
+# jobs.py
+# 非同步工作 API：上傳後立即回傳 job id，前端輪詢 GET /jobs/{id} 或訂閱 /jobs/{id}/events
+
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse
+from app.api.emotion import save_uploaded_video, save_uploaded_pdf, sse_event
+from app.services.emotion_service import analyze_video, analyze_portfolio
+from app.services.question_generator import analyze_pdf_and_generate_questions
+from app.services.calibration import calibrate
+from app.services.personal_heads import valid_user_id
+from app.services.job_manager import get_job_manager, FINISHED
+from app.core import metrics
+import os
+
+router = APIRouter()
+
+
+def _accepted(job: dict) -> dict:
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['id']}",
+        "events_url": f"/jobs/{job['id']}/events",
+    }
+
+
+def _remove_file(path: str):
+    def cleanup():
+        with metrics.span("file_cleanup"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return cleanup
+
+
+@router.post("/analyze", status_code=202)
+async def job_analyze_video(
+    video: UploadFile = File(...),
+    save_video: str = Form(default="true"),
+    max_points: int = Form(default=-1),
+    user_id: str = Form(default="")
+):
+    """同 /emotion/analyze，但立即回傳 job id；結果見 GET /jobs/{id}"""
+    video_path, content_hash = await save_uploaded_video(video)
+    save_flag = save_video.lower() == "true"
+
+    async def run(on_stage):
+        return await analyze_video(video_path, save_flag, content_hash=content_hash, on_stage=on_stage,
+                                   max_points=max_points if max_points >= 0 else None, user_id=user_id or None)
+
+    return _accepted(get_job_manager().submit("analyze", run, cleanup=_remove_file(video_path)))
+
+
+@router.post("/analyze_portfolio", status_code=202)
+async def job_analyze_portfolio(pdf: UploadFile = File(...)):
+    """同 /emotion/analyze_portfolio，但立即回傳 job id"""
+    pdf_path = await save_uploaded_pdf(pdf)
+    print(f"📄 收到 PDF: {pdf.filename}")
+
+    async def run(on_stage):
+        on_stage("analyzing")
+        return await analyze_portfolio(pdf_path)
+
+    return _accepted(get_job_manager().submit("analyze_portfolio", run, cleanup=_remove_file(pdf_path)))
+
+
+@router.post("/generate_questions", status_code=202)
+async def job_generate_questions(
+    pdf: UploadFile = File(...),
+    interview_type: str = Form(default="通用型")
+):
+    """同 /emotion/generate_questions，但立即回傳 job id"""
+    pdf_path = await save_uploaded_pdf(pdf, prefix="questions_")
+    print(f"📄 收到問題生成請求: {pdf.filename} (類型: {interview_type})")
+
+    async def run(on_stage):
+        on_stage("generating")
+        try:
+            return await analyze_pdf_and_generate_questions(pdf_path, interview_type)
+        finally:
+            _remove_file(pdf_path)()
+
+    return _accepted(get_job_manager().submit("generate_questions", run))
+
+
+@router.post("/calibrate", status_code=202)
+async def job_calibrate(
+    user_id: str = Form(...),
+    video: UploadFile = File(default=None)
+):
+    """
+    個人校準：以學生的 relaxed_baseline 影片微調個人化分類頭，完成後 /analyze 帶 user_id 即套用
+
+    - **user_id**: 學生 id (文字 / 數字 / 底線 / 連字號)
+    - **video**: relaxed_baseline 影片；省略時以先前上傳影片的特徵重新訓練
+    """
+    if not valid_user_id(user_id):
+        raise HTTPException(status_code=400, detail="invalid user_id")
+
+    video_path, content_hash = (None, "")
+    if video is not None:
+        video_path, content_hash = await save_uploaded_video(video)
+
+    async def run(on_stage):
+        try:
+            return await calibrate(user_id, video_path, content_hash, on_stage=on_stage)
+        finally:
+            if video_path:
+                _remove_file(video_path)()
+
+    return _accepted(get_job_manager().submit("calibrate", run))
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    """
+    查詢工作狀態
+
+    Returns:
+        {"id", "kind", "status": queued|running|done|error, "stage", "result", "error", ...}
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str):
+    """以 Server-Sent Events 推送工作狀態變化，工作結束 (done / error) 後關閉"""
+    if get_job_manager().get(job_id) is None:
+        raise HTTPException(status_code=404, detail="job not found")
+
+    async def events():
+        sent = False
+        async for job in get_job_manager().subscribe(job_id):
+            sent = True
+            yield sse_event(job["status"] if job["status"] in FINISHED else "progress", job)
+        if not sent:
+            # 檢查存在之後、開始推送之前工作剛好過期被清除
+            yield sse_event("error", {"id": job_id, "error": "job not found"})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
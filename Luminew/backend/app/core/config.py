@@ -9,3 +9,103 @@ YATING_API_KEY = os.getenv("YATING_API_KEY")
 ASR_WS_URL = "wss://asr.api.yating.tw/ws/v1/"
 TTS_URL = "https://tts.api.yating.tw/v2/speeches/short"
 OPENAI_URL = "https://api.openai.com/v1/responses"
+
+# === Emotion Analysis ===
+# 每批送進 ResNet18 的人臉張數 (CPU 上批次越大吞吐越高，但單批延遲也越長)
+EMOTION_BATCH_SIZE = int(os.getenv("EMOTION_BATCH_SIZE", "16"))
+
+# 解碼 / 偵測 / 推論 管線
+# 預設關閉 (單線程逐幀處理)；設為 1 開啟
+EMOTION_PIPELINE = os.getenv("EMOTION_PIPELINE", "0") == "1"
+# 人臉偵測線程數
+EMOTION_DETECT_WORKERS = int(os.getenv("EMOTION_DETECT_WORKERS", "2"))
+# 管線中每段佇列的上限 (幀數)
+EMOTION_QUEUE_SIZE = int(os.getenv("EMOTION_QUEUE_SIZE", "32"))
+
+# 每秒影片要分析幾幀 (0 = 固定每 3 幀取 1 幀)
+EMOTION_SAMPLE_FPS = float(os.getenv("EMOTION_SAMPLE_FPS", "0"))
+
+# 人臉追蹤：只在上一個人臉框附近偵測，每 N 個取樣幀 (或追蹤遺失時) 才掃整張畫面
+# 預設關閉 (每幀都掃整張畫面，結果與原本相同)；設為 1 開啟
+EMOTION_FACE_TRACKING = os.getenv("EMOTION_FACE_TRACKING", "0") == "1"
+EMOTION_TRACK_REDETECT = int(os.getenv("EMOTION_TRACK_REDETECT", "15"))
+# 搜尋區域在人臉框四周各外擴的比例
+EMOTION_TRACK_PADDING = float(os.getenv("EMOTION_TRACK_PADDING", "0.5"))
+
+# 人臉偵測後端："haar" / "ssd" (OpenCV DNN res10 SSD) / "yunet" (cv2.FaceDetectorYN)
+EMOTION_FACE_DETECTOR = os.getenv("EMOTION_FACE_DETECTOR", "haar")
+# DNN 偵測器的信心門檻
+EMOTION_DNN_CONFIDENCE = float(os.getenv("EMOTION_DNN_CONFIDENCE", "0.6"))
+
+# 情緒模型精度："fp32" / "int8" (int8 僅 CPU，轉換結果快取在 checkpoint 旁)
+EMOTION_MODEL_PRECISION = os.getenv("EMOTION_MODEL_PRECISION", "fp32")
+# INT8 靜態量化的校準人臉圖片資料夾 (未設定時改用 dynamic 量化)
+EMOTION_INT8_CALIB_DIR = os.getenv("EMOTION_INT8_CALIB_DIR", "")
+
+# 推論引擎："torch" / "torchscript" / "onnx" (後兩者需先執行 python -m app.services.export_model)
+EMOTION_ENGINE = os.getenv("EMOTION_ENGINE", "torch")
+# onnxruntime 的 intra-op 線程數 (0 = CPU 核心數)
+EMOTION_ONNX_THREADS = int(os.getenv("EMOTION_ONNX_THREADS", "0"))
+
+# 服務啟動時在背景載入模型並跑一次假推論 (/ready 在完成前回 503)
+EMOTION_WARMUP = os.getenv("EMOTION_WARMUP", "1") == "1"
+
+# 影片分析的執行方式："thread" (共用 ThreadPoolExecutor) / "process" (每個子行程各自載入模型)
+EMOTION_EXECUTOR = os.getenv("EMOTION_EXECUTOR", "thread")
+# process 模式的子行程數 (0 = 可用核心數的一半)；可用核心數 = CPU 核心數 - EMOTION_LIVE_WORKERS (保留給父行程的即時辨識)，
+# 每個子行程分到 可用核心數 // 子行程數 個推論線程
+EMOTION_PROCESS_WORKERS = int(os.getenv("EMOTION_PROCESS_WORKERS", "0"))
+
+# 串流分析 (邊上傳邊分析)：ffmpeg 解碼後每秒送出的幀數，以及部分結果的最短推送間隔 (秒)
+EMOTION_STREAM_FPS = float(os.getenv("EMOTION_STREAM_FPS", "10"))
+EMOTION_STREAM_PUSH_INTERVAL = float(os.getenv("EMOTION_STREAM_PUSH_INTERVAL", "0.5"))
+# ffmpeg 執行檔 (串流上傳 fMP4 時使用)
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+
+# 即時辨識 (/emotion/live)：每秒回傳幾次結果，以及專用的推論線程數 (不與影片分析共用)
+EMOTION_LIVE_RATE = float(os.getenv("EMOTION_LIVE_RATE", "5"))
+EMOTION_LIVE_WORKERS = int(os.getenv("EMOTION_LIVE_WORKERS", "2"))
+
+# 影片分析結果快取 (依影片內容 hash + 模型版本)：重複上傳同一支影片時直接回傳，不再重新分析 / 呼叫 OpenAI
+EMOTION_CACHE = os.getenv("EMOTION_CACHE", "1") == "1"
+# 快取資料夾 (預設 backend/cache/results)
+EMOTION_CACHE_DIR = os.getenv("EMOTION_CACHE_DIR", "")
+EMOTION_CACHE_MAX_ENTRIES = int(os.getenv("EMOTION_CACHE_MAX_ENTRIES", "500"))
+EMOTION_CACHE_TTL_HOURS = float(os.getenv("EMOTION_CACHE_TTL_HOURS", "168"))
+# 手動指定模型版本 (預設由 checkpoint 內容與分析設定計算)
+EMOTION_MODEL_VERSION = os.getenv("EMOTION_MODEL_VERSION", "")
+
+# 非同步工作 (/jobs)：狀態與結果存放的資料夾 (預設 backend/cache/jobs)，以及完成後保留多久
+EMOTION_JOB_DIR = os.getenv("EMOTION_JOB_DIR", "")
+EMOTION_JOB_TTL_HOURS = float(os.getenv("EMOTION_JOB_TTL_HOURS", "72"))
+
+# 回傳給前端的 timeline 最多幾個點 (超過時以 LTTB 降取樣；0 = 不限制)
+EMOTION_TIMELINE_MAX_POINTS = int(os.getenv("EMOTION_TIMELINE_MAX_POINTS", "300"))
+# 完整解析度 timeline 的存放資料夾 (預設 backend/cache/timelines，保留時間同 EMOTION_CACHE_TTL_HOURS)
+EMOTION_TIMELINE_DIR = os.getenv("EMOTION_TIMELINE_DIR", "")
+
+# 跨請求動態批次：所有分析任務的人臉合併成同一批推論
+# 預設關閉 (每個任務各自推論)；設為 1 開啟
+EMOTION_BATCH_SERVER = os.getenv("EMOTION_BATCH_SERVER", "0") == "1"
+# 合併後一批最多幾張人臉，以及第一個請求最多等待其他請求加入的時間 (毫秒)
+EMOTION_BATCH_MAX_SIZE = int(os.getenv("EMOTION_BATCH_MAX_SIZE", "32"))
+EMOTION_BATCH_MAX_WAIT_MS = float(os.getenv("EMOTION_BATCH_MAX_WAIT_MS", "5"))
+
+# 影片解碼方式："opencv" (cv2.VideoCapture) / "ffmpeg" (ffmpeg 子行程在解碼時完成取樣與縮放)
+VIDEO_DECODER = os.getenv("VIDEO_DECODER", "opencv")
+# ffmpeg 解碼輸出的畫面寬度 (不會放大)
+EMOTION_DECODE_WIDTH = int(os.getenv("EMOTION_DECODE_WIDTH", "640"))
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+
+# 個人化分類頭：所有學生共用同一個 backbone，每人只存一個 Linear (每人約 8 KB，見 personal_heads.py)
+EMOTION_PERSONAL_HEADS = os.getenv("EMOTION_PERSONAL_HEADS", "1") == "1"
+# 分類頭存放資料夾 (預設 backend/models/personal_heads/<user_id>.npz)，以及記憶體中最多保留幾個
+EMOTION_PERSONAL_HEAD_DIR = os.getenv("EMOTION_PERSONAL_HEAD_DIR", "")
+EMOTION_PERSONAL_HEAD_CACHE = int(os.getenv("EMOTION_PERSONAL_HEAD_CACHE", "256"))
+
+# 個人校準 (/jobs/calibrate)：relaxed_baseline 影片的 backbone 特徵存放資料夾 (預設 backend/cache/calibration)
+EMOTION_CALIB_DIR = os.getenv("EMOTION_CALIB_DIR", "")
+# 只訓練分類頭：最多幾步、學習率，以及校準影片的 relaxed 平均機率達到多少就停止 (避免把所有表情都判成 relaxed)
+EMOTION_CALIB_STEPS = int(os.getenv("EMOTION_CALIB_STEPS", "300"))
+EMOTION_CALIB_LR = float(os.getenv("EMOTION_CALIB_LR", "0.01"))
+EMOTION_CALIB_TARGET = float(os.getenv("EMOTION_CALIB_TARGET", "0.6"))
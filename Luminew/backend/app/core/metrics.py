@@ -0,0 +1,140 @@
+# metrics.py
+# 各階段耗時與服務狀態的 Prometheus 指標 (GET /metrics)
+#
+# - luminew_stage_seconds{stage=...}：histogram，以 span("decode") 等包住要量測的區段
+#     upload_write / decode / detect / preprocess / infer / aggregate / file_cleanup
+#     llm_feedback / llm_portfolio / llm_questions / pdf_extract
+#   decode、detect、preprocess 為每幀 (或每張人臉) 一筆，infer 為每個 forward 批次一筆
+# - luminew_executor_queue_depth{executor=...}：各 executor 排隊中的工作數
+# - luminew_active_sessions{kind=...}：進行中的連線數 (目前為面試 WebSocket)
+#   gauge 在 /metrics 被抓取時才呼叫各模組註冊的函式計算，平常沒有額外成本
+#
+# prometheus_client 沒安裝時所有量測都是 no-op，/metrics 回 503。
+# EMOTION_EXECUTOR=process 時影片分析在子行程執行，子行程的 span 要透過 prometheus_client 的
+# multiprocess 模式彙整：啟動前把 PROMETHEUS_MULTIPROC_DIR 設為一個空資料夾 (每次啟動前清空)。
+
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    from prometheus_client import Histogram, CollectorRegistry, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:
+    Histogram = None
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_stage_seconds = None
+if Histogram is not None:
+    _stage_seconds = Histogram(
+        "luminew_stage_seconds", "Latency of each processing stage in seconds",
+        ["stage"], buckets=STAGE_BUCKETS,
+    )
+
+# 名稱 -> 回傳目前數值的函式
+_queue_sources = {}
+_session_sources = {}
+
+
+def enabled() -> bool:
+    return _stage_seconds is not None
+
+
+def observe(stage: str, seconds: float):
+    if _stage_seconds is not None:
+        _stage_seconds.labels(stage).observe(seconds)
+
+
+@contextmanager
+def span(stage: str):
+    """量測 with 區塊的耗時 (發生例外時同樣記錄)"""
+    if _stage_seconds is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage_seconds.labels(stage).observe(time.perf_counter() - t0)
+
+
+def timed_iter(stage: str, iterable):
+    """逐項量測取得下一個元素的耗時 (用於解碼等 generator)"""
+    if _stage_seconds is None:
+        yield from iterable
+        return
+    child = _stage_seconds.labels(stage)
+    it = iter(iterable)
+    while True:
+        t0 = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        child.observe(time.perf_counter() - t0)
+        yield item
+
+
+def executor_queue_depth(executor) -> int:
+    """
+    concurrent.futures executor 中尚未完成的工作數
+
+    ThreadPoolExecutor 為還沒開始執行的工作數；ProcessPoolExecutor 無法區分，包含執行中的工作
+    """
+    if executor is None:
+        return 0
+    work_queue = getattr(executor, "_work_queue", None)
+    if work_queue is not None:
+        return work_queue.qsize()
+    return len(getattr(executor, "_pending_work_items", ()))
+
+
+def register_queue(name: str, depth_fn):
+    """註冊一個佇列，/metrics 時以 depth_fn() 取得排隊數"""
+    _queue_sources[name] = depth_fn
+
+
+def register_sessions(kind: str, count_fn):
+    """註冊一種連線，/metrics 時以 count_fn() 取得進行中的數量"""
+    _session_sources[kind] = count_fn
+
+
+class _StateCollector:
+    """抓取時才計算的 gauge (不經過 multiprocess 的 mmap 檔，只反映主行程)"""
+
+    def collect(self):
+        yield self._family("luminew_executor_queue_depth", "Jobs waiting in each executor",
+                           "executor", _queue_sources)
+        yield self._family("luminew_active_sessions", "Active client sessions", "kind", _session_sources)
+
+    @staticmethod
+    def _family(name: str, doc: str, label: str, sources: dict):
+        family = GaugeMetricFamily(name, doc, labels=[label])
+        for key, fn in list(sources.items()):
+            try:
+                family.add_metric([key], float(fn()))
+            except Exception:
+                continue
+        return family
+
+
+_state_registry = None
+
+
+def render():
+    """回傳 (內容, Content-Type)；prometheus_client 沒安裝時回傳 None"""
+    global _state_registry
+    if _stage_seconds is None:
+        return None
+    if _state_registry is None:
+        _state_registry = CollectorRegistry()
+        _state_registry.register(_StateCollector())
+
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(_state_registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,74 @@
+# upload_stream.py
+# 邊接收請求內容邊送出回應 (POST /emotion/analyze_stream 的 SSE)
+#
+# StreamingResponse 在 ASGI spec < 2.4 的伺服器 (uvicorn 目前為 2.3) 上會另外跑 listen_for_disconnect()，
+# 持續呼叫 receive() 等待斷線；若在回應的 generator 裡才讀 request.stream()，
+# 請求內容的訊息會被它搶走，generator 只收到 0 bytes。這裡改成：
+#   - RequestBodyReader：在 handler 中 (回應開始前) 就啟動 task 讀取請求內容，放進有上限的 asyncio.Queue
+#     (佇列滿時暫停讀取，上傳端自然被 TCP 流量控制擋住)
+#   - BodyStreamingResponse：斷線偵測改為等待 RequestBodyReader 回報，不再自己呼叫 receive()
+
+import asyncio
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+
+# 最多暫存幾段尚未處理的請求內容
+BODY_QUEUE_SIZE = 16
+
+
+class RequestBodyReader:
+    """在背景讀取請求內容；以 async for chunk in reader.chunks() 取用，用完呼叫 close()"""
+
+    def __init__(self, request: Request, max_chunks: int = BODY_QUEUE_SIZE):
+        self.request = request
+        self.received = 0
+        # 前端中斷連線 (上傳途中或內容送完之後) 時設定
+        self.disconnected = asyncio.Event()
+        self._queue = asyncio.Queue(maxsize=max_chunks)
+        self._task = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for chunk in self.request.stream():
+                if chunk:
+                    self.received += len(chunk)
+                    await self._queue.put(chunk)
+            await self._queue.put(None)
+            # 內容讀完後繼續等待，分析途中前端離開也能發現
+            while (await self.request.receive())["type"] != "http.disconnect":
+                pass
+        except ClientDisconnect as e:
+            await self._queue.put(e)
+        self.disconnected.set()
+
+    async def chunks(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    async def close(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """搭配 RequestBodyReader 的 StreamingResponse：不和 reader 搶 receive()"""
+
+    def __init__(self, content, reader: RequestBodyReader, **kwargs):
+        super().__init__(content, **kwargs)
+        self.reader = reader
+
+    async def __call__(self, scope, receive, send):
+        async def wait_for_disconnect():
+            await self.reader.disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        await super().__call__(scope, wait_for_disconnect, send)
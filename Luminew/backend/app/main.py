@@ -1,7 +1,12 @@
 # main.py
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
-from app.api import interview, llm, tts, emotion  # 不 import stt
+from app.api import interview, llm, tts, emotion, jobs  # 不 import stt
+from app.core.config import EMOTION_WARMUP
+from app.core import metrics
+from app.services import emotion_service
+import asyncio
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -18,8 +23,39 @@ app.include_router(interview.router, prefix="/interview", tags=["Interview"])
 app.include_router(llm.router, prefix="/llm", tags=["LLM"])
 app.include_router(tts.router, prefix="/tts", tags=["TTS"])
 app.include_router(emotion.router, prefix="/emotion", tags=["Emotion"])
+app.include_router(jobs.router, prefix="/jobs", tags=["Jobs"])
 app.include_router(interview.router, prefix="/interview", tags=["Interview"])
 
 @app.get("/")
 def root():
-    return {"message": "Luminew 即時語音練習 API 正在運行"}
\ No newline at end of file
+    return {"message": "Luminew 即時語音練習 API 正在運行"}
+
+@app.on_event("startup")
+async def start_emotion_warmup():
+    """背景載入情緒模型並跑一次假推論，不阻塞其他 API；完成前 /ready 回 503"""
+    if not EMOTION_WARMUP:
+        return
+    loop = asyncio.get_event_loop()
+    future = loop.run_in_executor(emotion_service.executor, emotion_service.warmup)
+
+    def _on_done(f):
+        if f.exception() is not None:
+            print(f"❌ 情緒模型 warmup 失敗: {f.exception()}")
+
+    future.add_done_callback(_on_done)
+
+@app.get("/ready")
+def ready():
+    """readiness probe：模型載入並 warmup 完成才回 200，滾動重啟時避免把流量導到冷的 worker (EMOTION_WARMUP=0 時一律 200)"""
+    if emotion_service.is_ready():
+        return {"ready": True}
+    return JSONResponse(status_code=503, content={"ready": False})
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus 指標：各階段耗時 histogram、executor 排隊數、進行中的面試連線 (見 app/core/metrics.py)"""
+    rendered = metrics.render()
+    if rendered is None:
+        return JSONResponse(status_code=503, content={"error": "prometheus_client is not installed"})
+    body, content_type = rendered
+    return Response(content=body, media_type=content_type)
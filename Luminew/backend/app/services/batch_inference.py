@@ -0,0 +1,147 @@
+# batch_inference.py
+# 跨請求的動態批次推論
+#
+# 多個學生同時上傳時，每個分析任務各自對共用模型做小批次 forward，彼此搶 CPU。
+# BatchInferenceServer 用一個推論線程接收所有任務送來的人臉，合併成一個大批次再 forward：
+#
+#   [任務 A] --\
+#   [任務 B] ----> request queue --> [推論線程] 合併 -> forward -> 依來源切回各自的 Future
+#   [即時辨識] -/
+#
+# 合併策略：
+#   - 收到第一個請求後，最多再等 max_wait_ms 讓其他請求加入 (已經排隊夠久的請求不再等待)
+#   - 合併後的人臉數達到 max_batch_size 就立即執行；放不下的請求留到下一批
+# 負載低時只多 max_wait_ms 延遲，負載高時批次自然變大、吞吐提高。
+# 推論失敗 (含 BaseException) 或推論線程結束時，等待中的呼叫端都會收到例外；
+# 呼叫端最多等待 timeout 秒，不會永遠卡住。
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+# 呼叫端等待結果的上限 (秒)
+DEFAULT_TIMEOUT = 60
+
+
+class _InferRequest:
+    __slots__ = ("faces", "future", "enqueued")
+
+    def __init__(self, faces: list):
+        self.faces = faces
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class BatchInferenceServer:
+    """
+    在單一線程中合併多個呼叫端的推論請求
+
+    - infer_fn(faces) -> (N, C) 機率：實際執行 forward 的函式 (只會在推論線程中呼叫)
+    - infer(faces)：給任意線程呼叫，阻塞直到這批人臉的結果回來 (最多 timeout 秒)
+    """
+
+    def __init__(self, infer_fn, max_batch_size: int = 32, max_wait_ms: float = 5,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.timeout = timeout
+        # 推論線程結束的原因 (None = 仍在執行)
+        self._stopped = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="batch-inference", daemon=True)
+        self._thread.start()
+        # 統計
+        self.batches = 0
+        self.requests = 0
+        self.faces = 0
+        self.max_seen = 0
+
+    def infer(self, faces: list):
+        if not faces:
+            raise ValueError("empty batch")
+        if self._stopped is not None:
+            raise RuntimeError(f"batch inference thread stopped: {self._stopped!r}")
+        request = _InferRequest(faces)
+        self._queue.put(request)
+        try:
+            return request.future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise TimeoutError(f"batch inference did not answer within {self.timeout}s") from None
+
+    def _loop(self):
+        try:
+            self._serve()
+        except BaseException as e:
+            # 推論線程結束：佇列中還沒處理的請求全部失敗，之後的 infer() 立即拋出例外
+            self._stopped = e
+            while True:
+                try:
+                    request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                _fail([request], e)
+            raise
+
+    def _serve(self):
+        carry = None
+        while True:
+            first = carry or self._queue.get()
+            carry = None
+            batch, size = [first], len(first.faces)
+            deadline = first.enqueued + self.max_wait
+
+            while size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if size + len(request.faces) > self.max_batch_size:
+                    carry = request
+                    break
+                batch.append(request)
+                size += len(request.faces)
+
+            try:
+                self._run(batch, size)
+            except BaseException as e:
+                # 還在等待的請求 (含留到下一批的) 也要收到例外
+                _fail(batch + ([carry] if carry else []), e)
+                raise
+
+    def _run(self, batch: list, size: int):
+        faces = batch[0].faces if len(batch) == 1 else [f for r in batch for f in r.faces]
+        try:
+            probs = self.infer_fn(faces)
+        except Exception as e:
+            _fail(batch, e)
+            return
+
+        offset = 0
+        for request in batch:
+            n = len(request.faces)
+            request.future.set_result(probs[offset:offset + n])
+            offset += n
+
+        self.batches += 1
+        self.requests += len(batch)
+        self.faces += size
+        self.max_seen = max(self.max_seen, size)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "faces": self.faces,
+            "avg_batch": round(self.faces / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_seen,
+            "queued": self._queue.qsize(),
+        }
+
+
+def _fail(requests: list, error: BaseException):
+    for request in requests:
+        if not request.future.done():
+            request.future.set_exception(error)
@@ -0,0 +1,201 @@
+# calibration.py
+# 個人校準：用學生的 relaxed_baseline 影片微調個人化分類頭 (/jobs/calibrate)
+#
+# 原本的桌面流程 (個人化校準.py + 執行即時微調.py) 每次都重新解碼校準影片、用固定參數的 Haar 偵測，
+# 人臉全部放在 Python list 裡，再以 lr=1e-5 訓練整個 ResNet18 並另存一份完整模型。這裡改成：
+#   1. 特徵萃取 (每支影片只做一次)：沿用分析時的解碼器 / 人臉偵測 / 前處理，
+#      以共用 backbone 算出 512 維特徵，存成 <EMOTION_CALIB_DIR>/<user_id>.npz；
+#      同一支影片 (內容 hash) 且模型版本相同時直接重用
+#   2. 訓練：backbone 不動，只以 numpy 訓練 Linear(512, 4)，從通用模型的 fc 出發，
+#      加上拉回通用權重的 L2 項；校準影片的 relaxed 平均機率達到 EMOTION_CALIB_TARGET 就停止
+#      (校準影片只有 relaxed 一種標籤，訓練過頭會把所有表情都判成 relaxed)
+#   3. 發佈：寫入 personal_heads 的分類頭快取，之後的分析立即使用，不需要重啟
+
+import os
+import time
+import traceback
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+import cv2
+import numpy as np
+
+from app.core.config import EMOTION_CALIB_DIR, EMOTION_CALIB_STEPS, EMOTION_CALIB_LR, EMOTION_CALIB_TARGET
+from app.services.emotion_model import PROJECT_DIR, CLASSES
+from app.services.inference_engine import _softmax
+from app.services.personal_heads import PersonalHead, valid_user_id, load_base_head, get_head_cache
+from app.services.preprocess import resize_face
+from app.services.result_cache import model_version
+from app.services import emotion_service
+
+CALIBRATION_LABEL = "relaxed"
+# 至少要有幾張人臉才訓練
+MIN_SAMPLES = 10
+# 拉回通用分類頭的 L2 強度
+ANCHOR_WEIGHT = 0.01
+FEATURE_BATCH_SIZE = 32
+
+
+def embeddings_path(user_id: str) -> str:
+    calib_dir = EMOTION_CALIB_DIR or os.path.join(PROJECT_DIR, "cache", "calibration")
+    os.makedirs(calib_dir, exist_ok=True)
+    return os.path.join(calib_dir, f"{user_id}.npz")
+
+
+def load_embeddings(user_id: str):
+    """回傳 {"features", "content_hash", "version"}；沒有時回傳 None"""
+    try:
+        with np.load(embeddings_path(user_id)) as data:
+            return {
+                "features": data["features"],
+                "content_hash": str(data["content_hash"]),
+                "version": str(data["version"]),
+            }
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_embeddings(user_id: str, features: np.ndarray, content_hash: str, version: str):
+    path = embeddings_path(user_id)
+    tmp_path = path[:-4] + ".tmp.npz"
+    np.savez(tmp_path, features=features.astype(np.float32), content_hash=content_hash, version=version)
+    os.replace(tmp_path, path)
+
+
+def extract_embeddings_sync(user_id: str, video_path: str, content_hash: str = "") -> dict:
+    """解碼校準影片並存下每張人臉的 backbone 特徵 (在 video executor 中執行)"""
+    version = model_version()
+    existing = load_embeddings(user_id)
+    if (existing is not None and content_hash and existing["content_hash"] == content_hash
+            and existing["version"] == version):
+        print(f"♻️ 重用 {user_id} 的校準特徵 ({len(existing['features'])} 張人臉)")
+        return {"samples": len(existing["features"]), "reused": True}
+
+    if not emotion_service.get_engine().supports_features:
+        return {"error": "目前的推論引擎無法輸出 backbone 特徵，請重新執行 python -m app.services.export_model"}
+
+    t0 = time.perf_counter()
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return {"error": "Could not open video"}
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+
+    read_state = {"frames": 0}
+    detect_faces = emotion_service._make_face_detector()
+    features, pending = [], []
+    try:
+        for _, frame in emotion_service._open_frames(video_path, cap, read_state, fps):
+            face_crop = emotion_service._detect_face_crop(frame, detect_faces)
+            if face_crop is None:
+                continue
+            try:
+                pending.append(resize_face(face_crop))
+            except Exception:
+                continue
+            if len(pending) >= FEATURE_BATCH_SIZE:
+                features.append(emotion_service._features_direct(pending))
+                pending.clear()
+        if pending:
+            features.append(emotion_service._features_direct(pending))
+    finally:
+        cap.release()
+
+    samples = sum(len(f) for f in features)
+    if samples < MIN_SAMPLES:
+        return {"error": f"校準影片中只辨識到 {samples} 張人臉 (至少需要 {MIN_SAMPLES} 張)，請正對鏡頭重新錄製"}
+
+    _save_embeddings(user_id, np.concatenate(features), content_hash, version)
+    elapsed = time.perf_counter() - t0
+    print(f"🧬 {user_id} 校準特徵萃取完成：{read_state['frames']} 幀，{samples} 張人臉，{elapsed:.2f}s")
+    return {"samples": samples, "reused": False, "seconds": round(elapsed, 3)}
+
+
+def train_head(features: np.ndarray, label_index: int, base: PersonalHead,
+               steps: int = EMOTION_CALIB_STEPS, lr: float = EMOTION_CALIB_LR,
+               target: float = EMOTION_CALIB_TARGET):
+    """
+    以 Adam 訓練分類頭 (全部樣本一個 batch)，回傳 (PersonalHead, 統計)
+
+    loss = cross entropy (label_index) + ANCHOR_WEIGHT / 2 * ||W - W_base||²
+    """
+    x = features.astype(np.float64)
+    n = len(x)
+    w0, b0 = base.weight.astype(np.float64), base.bias.astype(np.float64)
+    params = [w0.copy(), b0.copy()]
+    anchors = [w0, b0]
+    m = [np.zeros_like(p) for p in params]
+    v = [np.zeros_like(p) for p in params]
+    y = np.zeros((n, len(CLASSES)))
+    y[:, label_index] = 1
+
+    before = float(_softmax(x @ w0.T + b0)[:, label_index].mean())
+    steps_run = 0
+    for step in range(1, max(1, steps) + 1):
+        probs = _softmax(x @ params[0].T + params[1])
+        if probs[:, label_index].mean() >= target:
+            break
+        grad = (probs - y) / n
+        grads = [grad.T @ x, grad.sum(axis=0)]
+        for i, (p, g) in enumerate(zip(params, grads)):
+            g = g + ANCHOR_WEIGHT * (p - anchors[i])
+            m[i] = 0.9 * m[i] + 0.1 * g
+            v[i] = 0.999 * v[i] + 0.001 * g * g
+            p -= lr * (m[i] / (1 - 0.9 ** step)) / (np.sqrt(v[i] / (1 - 0.999 ** step)) + 1e-8)
+        steps_run = step
+
+    head = PersonalHead(params[0], params[1])
+    after = float(head.predict(features)[:, label_index].mean())
+    return head, {"steps": steps_run, f"{CALIBRATION_LABEL}_before": round(before, 4),
+                  f"{CALIBRATION_LABEL}_after": round(after, 4)}
+
+
+def train_and_publish_sync(user_id: str) -> dict:
+    """以存下的特徵訓練分類頭並發佈 (在 video executor 中執行)"""
+    embeddings = load_embeddings(user_id)
+    if embeddings is None:
+        return {"error": f"找不到 {user_id} 的校準特徵，請上傳 relaxed_baseline 影片"}
+    if embeddings["version"] != model_version():
+        return {"error": "模型已更新，請重新上傳 relaxed_baseline 影片"}
+
+    t0 = time.perf_counter()
+    head, stats = train_head(embeddings["features"], CLASSES.index(CALIBRATION_LABEL), load_base_head())
+    get_head_cache().publish(user_id, head)
+    elapsed = time.perf_counter() - t0
+    print(f"👤 {user_id} 個人化分類頭已發佈 ({stats}, {elapsed:.2f}s)")
+    return {**stats, "samples": len(embeddings["features"]), "head_bytes": head.nbytes,
+            "seconds": round(elapsed, 3)}
+
+
+async def calibrate(user_id: str, video_path: str = None, content_hash: str = "", on_stage=None) -> dict:
+    """
+    個人校準：萃取特徵 (有上傳影片時) -> 訓練分類頭 -> 發佈
+    - 沒有上傳影片時，以先前存下的特徵重新訓練
+    - on_stage：進入各階段時呼叫 on_stage("extracting" / "training")
+    """
+    if not valid_user_id(user_id):
+        return {"error": f"invalid user id: {user_id!r}"}
+    loop = asyncio.get_event_loop()
+    report = on_stage or (lambda stage: None)
+    video_executor = emotion_service.get_video_executor()
+
+    try:
+        extraction = None
+        if video_path:
+            report("extracting")
+            extraction = await loop.run_in_executor(video_executor, extract_embeddings_sync,
+                                                    user_id, video_path, content_hash)
+            if "error" in extraction:
+                return extraction
+
+        report("training")
+        result = await loop.run_in_executor(video_executor, train_and_publish_sync, user_id)
+    except BrokenProcessPool as e:
+        print(f"❌ 校準子行程異常結束: {e}")
+        emotion_service._reset_video_executor(video_executor)
+        return {"error": "Error: calibration worker crashed"}
+    except Exception as e:
+        traceback.print_exc()
+        return {"error": f"Error: {str(e)}"}
+
+    if extraction is not None and "error" not in result:
+        result["reused_embeddings"] = extraction["reused"]
+    return {"user_id": user_id, **result}
@@ -0,0 +1,79 @@
+# emotion_model.py
+# 情緒辨識模型 (ResNet18, 4 類) 的建立與載入
+#
+# EMOTION_MODEL_PRECISION 決定 PyTorch 引擎載入哪一種：
+#   - fp32：原本的 PyTorch 模型 (有 CUDA 時放到 GPU)
+#   - int8：量化後的 CPU 模型，轉換結果快取在原始 checkpoint 旁邊 (見 quantize_model.py)
+#
+# torch / torchvision 只在函式內 import，使用 onnxruntime 引擎時完全不會載入
+
+import os
+from app.core.config import EMOTION_MODEL_PRECISION
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MODEL_PATH = os.path.join(PROJECT_DIR, "models", "test_best_.pth")
+CLASSES = ['confidence', 'nervous', 'passion', 'relaxed']
+
+
+def onnx_path(model_path: str = MODEL_PATH) -> str:
+    """匯出的 ONNX 檔 (test_best_.pth -> test_best_.onnx)"""
+    return os.path.splitext(model_path)[0] + ".onnx"
+
+
+def torchscript_path(model_path: str = MODEL_PATH) -> str:
+    """匯出的 TorchScript 檔 (test_best_.pth -> test_best_.ts.pt)"""
+    return os.path.splitext(model_path)[0] + ".ts.pt"
+
+
+def build_fp32_model(model_path: str = MODEL_PATH, device=None):
+    """建立 ResNet18 並載入 checkpoint (fc 層依 checkpoint 結構決定是否帶 Dropout)"""
+    import torch
+    import torch.nn as nn
+    from torchvision import models
+
+    device = device or torch.device("cpu")
+    model = models.resnet18(pretrained=False)
+    try:
+        checkpoint = torch.load(model_path, map_location=device)
+        state_dict = checkpoint["state_dict"] if "state_dict" in checkpoint else checkpoint
+
+        fc_keys = [k for k in state_dict.keys() if k.startswith("fc.")]
+        use_sequential = any(k.startswith("fc.1.") for k in fc_keys)
+
+        if use_sequential:
+            model.fc = nn.Sequential(nn.Dropout(0.3), nn.Linear(model.fc.in_features, len(CLASSES)))
+        else:
+            model.fc = nn.Linear(model.fc.in_features, len(CLASSES))
+
+        model.load_state_dict(state_dict, strict=False)
+        print("✅ 情緒辨識模型載入成功")
+    except Exception as e:
+        print(f"❌ 模型載入失敗: {e}")
+        model.fc = nn.Linear(model.fc.in_features, len(CLASSES))
+
+    model = model.to(device)
+    model.eval()
+    return model
+
+
+def load_emotion_model(precision: str = None):
+    """
+    依精度載入模型，回傳 (model, device)
+
+    int8 模型只能在 CPU 上執行；轉換或載入失敗時退回 fp32
+    """
+    import torch
+
+    precision = (precision or EMOTION_MODEL_PRECISION).lower()
+
+    if precision == "int8":
+        try:
+            from app.services.quantize_model import load_or_quantize
+            model = load_or_quantize(MODEL_PATH)
+            print("✅ 使用 INT8 量化模型 (CPU)")
+            return model, torch.device("cpu")
+        except Exception as e:
+            print(f"⚠️ INT8 模型載入失敗 ({e})，改用 fp32")
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    return build_fp32_model(MODEL_PATH, device), device
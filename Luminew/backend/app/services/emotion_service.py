@@ -3,10 +3,7 @@
 
 import os
 import cv2
-import torch
-import torch.nn as nn
-from torchvision import transforms, models
-from PIL import Image
+import numpy as np
 import httpx
 from dotenv import load_dotenv
 import traceback
@@ -14,7 +11,46 @@ from collections import deque
 import uuid
 import json
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import math
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.core.config import (
+    EMOTION_BATCH_SIZE,
+    EMOTION_PIPELINE,
+    EMOTION_DETECT_WORKERS,
+    EMOTION_QUEUE_SIZE,
+    EMOTION_SAMPLE_FPS,
+    EMOTION_FACE_TRACKING,
+    EMOTION_TRACK_REDETECT,
+    EMOTION_TRACK_PADDING,
+    EMOTION_ENGINE,
+    EMOTION_MODEL_PRECISION,
+    EMOTION_EXECUTOR,
+    EMOTION_PROCESS_WORKERS,
+    EMOTION_LIVE_WORKERS,
+    EMOTION_TIMELINE_MAX_POINTS,
+    EMOTION_BATCH_SERVER,
+    EMOTION_BATCH_MAX_SIZE,
+    EMOTION_BATCH_MAX_WAIT_MS,
+    VIDEO_DECODER,
+    EMOTION_DECODE_WIDTH,
+    EMOTION_WARMUP,
+)
+from app.core import metrics
+from app.services.emotion_model import CLASSES
+from app.services.face_detector import create_face_detector
+from app.services.face_tracker import FaceTracker
+from app.services.inference_engine import create_engine
+from app.services.batch_inference import BatchInferenceServer
+from app.services.preprocess import resize_face, get_thread_buffer
+from app.services.video_decoder import iter_sampled_frames, FfmpegFileDecoder
+from app.services.video_pipeline import VideoAnalysisPipeline
+from app.services.result_cache import get_result_cache, model_version
+from app.services.personal_heads import get_personal_head
+from app.services.timeline import get_timeline_store, downsample, points_to_series
 
 # 載入環境變數
 load_dotenv()
@@ -23,7 +59,6 @@ load_dotenv()
 # 全域設定
 # ---------------------------
 PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-MODEL_PATH = os.path.join(PROJECT_DIR, "models", "test_best_.pth")
 VIDEO_STORAGE_DIR = os.path.join(PROJECT_DIR, "static", "videos")
 os.makedirs(VIDEO_STORAGE_DIR, exist_ok=True)
 
@@ -36,63 +71,477 @@ if OPENAI_API_KEY:
 else:
     print("⚠️ 警告：找不到 OPENAI_API_KEY，AI 評語功能將使用本地評語")
 
-# 載入人臉辨識器
-HAAR_PATH = os.path.join(PROJECT_DIR, "haarcascade_frontalface_default.xml")
-if not os.path.exists(HAAR_PATH):
-    print(f"⚠️ 本地找不到 {HAAR_PATH}，嘗試使用 OpenCV 內建路徑...")
-    HAAR_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-
-print(f"📂 正在載入人臉辨識檔：{HAAR_PATH}")
-face_cascade = cv2.CascadeClassifier(HAAR_PATH)
-
-if face_cascade.empty():
-    print("❌ 嚴重錯誤：無法載入人臉辨識器 (xml 檔案損毀或路徑錯誤)")
-
-# 載入情緒模型 (ResNet18)
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-CLASSES = ['confidence', 'nervous', 'passion', 'relaxed']
-
-model = models.resnet18(pretrained=False)
-try:
-    checkpoint = torch.load(MODEL_PATH, map_location=device)
-    state_dict = checkpoint["state_dict"] if "state_dict" in checkpoint else checkpoint
-    
-    fc_keys = [k for k in state_dict.keys() if k.startswith("fc.")]
-    use_sequential = any(k.startswith("fc.1.") for k in fc_keys)
-    
-    if use_sequential:
-        model.fc = nn.Sequential(nn.Dropout(0.3), nn.Linear(model.fc.in_features, len(CLASSES)))
-    else:
-        model.fc = nn.Linear(model.fc.in_features, len(CLASSES))
-        
-    model.load_state_dict(state_dict, strict=False)
-    print("✅ 情緒辨識模型載入成功")
-except Exception as e:
-    print(f"❌ 模型載入失敗: {e}")
-    model.fc = nn.Linear(model.fc.in_features, len(CLASSES))
-
-model = model.to(device)
-model.eval()
-
-# 影像預處理
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.5]*3, [0.5]*3)
-])
+# 情緒模型推論引擎 (EMOTION_ENGINE: torch / torchscript / onnx)
+# 不在 import 時載入：第一次使用 (或啟動時的 warmup) 才建立，見 get_engine()
+_engine = None
+_engine_lock = threading.Lock()
+_ready = False
+# 跨請求合併推論 (見 get_batch_server())；個人化分類頭使用的 backbone 特徵另有一個 (見 get_feature_server())
+_batch_server = None
+_feature_server = None
 
 # ★★★ 建立共用的 ThreadPoolExecutor ★★★
 # 最多同時處理 4 個影片任務
 executor = ThreadPoolExecutor(max_workers=4)
 
+# EMOTION_EXECUTOR=process 時，影片分析改在子行程執行 (見 get_video_executor())
+# 子行程各自持有 warmup 過的模型，並固定推論線程數，避免多個任務搶同一個 GIL / 互搶 CPU
+_video_executor = None
+_video_executor_lock = threading.Lock()
+# 子行程中由 initializer 設定：此行程可用的推論線程數 (0 = 不限制)
+_thread_budget = 0
+_in_worker_process = False
+
+# /metrics：各 executor 與批次推論的排隊數
+metrics.register_queue("emotion", lambda: metrics.executor_queue_depth(executor))
+metrics.register_queue("emotion_process", lambda: metrics.executor_queue_depth(_video_executor))
+metrics.register_queue("batch_inference", lambda: _batch_server.stats()["queued"] if _batch_server else 0)
+metrics.register_queue("batch_features", lambda: _feature_server.stats()["queued"] if _feature_server else 0)
+
 
 def get_video_storage_dir():
     """取得影片儲存目錄"""
     return VIDEO_STORAGE_DIR
 
 
-def _analyze_video_sync(video_path: str, save_video: bool) -> dict:
-    """同步處理影片的核心邏輯 (在獨立線程中執行)"""
+def process_thread_budget():
+    """
+    計算 process 模式的 (子行程數, 每個子行程的推論線程數)
+
+    父行程保留 EMOTION_LIVE_WORKERS 個核心給 /live、/stream 的推論 (見 _limit_parent_threads())，
+    子行程數 x 線程數 不超過剩下的核心數
+    """
+    cores = os.cpu_count() or 1
+    available = max(1, cores - max(1, EMOTION_LIVE_WORKERS))
+    workers = EMOTION_PROCESS_WORKERS or max(1, available // 2)
+    workers = max(1, min(workers, available))
+    return workers, max(1, available // workers)
+
+
+def _init_worker_process(threads: int):
+    """ProcessPoolExecutor 的 initializer：固定此子行程的線程預算，並先載入模型跑一次 warmup"""
+    global _thread_budget, _in_worker_process
+    _thread_budget = threads
+    _in_worker_process = True
+    # OpenMP / MKL 在 torch 第一次 import 時讀取，必須在 warmup 之前設定
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    # 偵測線程的 cv2 運算不再各自開線程池，CPU 留給推論
+    cv2.setNumThreads(1)
+    if EMOTION_ENGINE.lower() != "onnx":
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    try:
+        warmup()
+    except Exception as e:
+        # initializer 拋出例外會讓整個 pool 變成 broken；warmup 失敗時改為第一個任務才載入模型
+        print(f"❌ 子行程 {os.getpid()} warmup 失敗: {e}")
+
+
+def _limit_parent_threads():
+    """process 模式的父行程 (/live、/stream 仍在這裡推論)：每次推論只用 1 個線程，不與子行程搶 CPU"""
+    global _thread_budget
+    _thread_budget = 1
+    if EMOTION_ENGINE.lower() != "onnx":
+        import torch
+        torch.set_num_threads(1)
+
+
+def _prepare_int8_cache():
+    """
+    process 模式啟動子行程前，先在父行程產生 INT8 模型快取
+
+    否則所有子行程會在快取不存在時同時量化並寫同一個檔案
+    """
+    if EMOTION_MODEL_PRECISION.lower() != "int8" or EMOTION_ENGINE.lower() in ("onnx", "torchscript"):
+        return
+    try:
+        from app.services.emotion_model import MODEL_PATH
+        from app.services.quantize_model import load_or_quantize
+        load_or_quantize(MODEL_PATH)
+    except Exception as e:
+        print(f"⚠️ INT8 模型快取產生失敗 ({e})，子行程將各自處理")
+
+
+def get_video_executor():
+    """取得執行影片分析的 executor (thread 模式直接共用 executor)"""
+    global _video_executor
+    if EMOTION_EXECUTOR.lower() != "process":
+        return executor
+    if _video_executor is None or getattr(_video_executor, "_broken", False):
+        with _video_executor_lock:
+            if _video_executor is not None and getattr(_video_executor, "_broken", False):
+                # 子行程異常結束 (例如 OOM 被砍) 後 pool 無法再使用，重新建立
+                print("⚠️ 影片分析子行程異常結束，重新建立 process pool")
+                _video_executor.shutdown(wait=False)
+                _video_executor = None
+            if _video_executor is None:
+                workers, threads = process_thread_budget()
+                _limit_parent_threads()
+                _prepare_int8_cache()
+                # 用 spawn 而不是 fork：父行程已有多個線程，fork 後 torch / OpenMP 可能卡死
+                _video_executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker_process,
+                    initargs=(threads,),
+                )
+                print(f"🧩 影片分析使用 {workers} 個子行程，每個子行程 {threads} 個推論線程"
+                      f" (保留 {max(1, EMOTION_LIVE_WORKERS)} 個核心給即時辨識)")
+    return _video_executor
+
+
+def _reset_video_executor(broken):
+    """子行程異常結束後 ProcessPoolExecutor 無法再使用，下次呼叫時重新建立"""
+    global _video_executor
+    with _video_executor_lock:
+        if _video_executor is broken:
+            _video_executor = None
+    broken.shutdown(wait=False)
+
+
+def get_engine():
+    """取得推論引擎 (第一次呼叫時才載入 torch / 模型 checkpoint)"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(threads=_thread_budget or None)
+    return _engine
+
+
+def get_batch_server() -> BatchInferenceServer:
+    """取得跨請求批次推論服務 (第一次呼叫時啟動推論線程)"""
+    global _batch_server
+    if _batch_server is None:
+        with _engine_lock:
+            if _batch_server is None:
+                _batch_server = BatchInferenceServer(_infer_direct, EMOTION_BATCH_MAX_SIZE, EMOTION_BATCH_MAX_WAIT_MS)
+    return _batch_server
+
+
+def get_feature_server() -> BatchInferenceServer:
+    """取得 backbone 特徵的跨請求批次服務 (不同學生的人臉合併成一批，各自套用分類頭)"""
+    global _feature_server
+    if _feature_server is None:
+        with _engine_lock:
+            if _feature_server is None:
+                _feature_server = BatchInferenceServer(_features_direct, EMOTION_BATCH_MAX_SIZE, EMOTION_BATCH_MAX_WAIT_MS)
+    return _feature_server
+
+
+def is_ready() -> bool:
+    """
+    模型是否已載入並完成 warmup
+
+    EMOTION_WARMUP=0 表示刻意延後到第一個請求才載入模型，此時一律視為就緒 (否則 /ready 永遠是 503)
+    """
+    return _ready or not EMOTION_WARMUP
+
+
+def warmup() -> dict:
+    """
+    載入模型與人臉偵測器，並跑一次假推論 (同步，請在 executor 中執行)
+
+    第一次 forward 會配置記憶體 / 初始化 kernel，先跑掉可以避免第一個使用者變慢
+    process 模式下另外啟動子行程，由各子行程的 initializer 完成 warmup
+    """
+    global _ready
+    if EMOTION_EXECUTOR.lower() == "process" and not _in_worker_process:
+        return _warmup_process_pool()
+
+    info = _warmup_local()
+    _ready = True
+    return info
+
+
+def _warmup_local() -> dict:
+    t0 = time.perf_counter()
+    engine = get_engine()
+    detector = create_face_detector()
+    detector.detect(np.zeros((480, 640, 3), dtype=np.uint8))
+    _infer_batch([np.zeros((224, 224, 3), dtype=np.uint8)])
+    elapsed = time.perf_counter() - t0
+    print(f"🔥 情緒模型 warmup 完成 (引擎: {engine.name}, 偵測器: {detector.name}, {elapsed:.2f}s)")
+    return {"engine": engine.name, "detector": detector.name, "seconds": round(elapsed, 3)}
+
+
+# 等待所有子行程都拿到 warmup 確認任務的上限 (秒)，包含子行程啟動與載入模型的時間
+WARMUP_BARRIER_TIMEOUT = 600
+
+
+def _worker_warmup_status(barrier) -> tuple:
+    """(子行程) 回傳 (pid, 是否完成 warmup)；barrier 讓每個子行程剛好處理一個，不會被同一個子行程全部拿走"""
+    barrier.wait(WARMUP_BARRIER_TIMEOUT)
+    return os.getpid(), _ready
+
+
+def _warmup_process_pool() -> dict:
+    """
+    啟動全部子行程並確認各自的 warmup 結果，同時 warmup 父行程
+
+    /live、/stream 與個人化特徵仍在父行程推論，父行程的模型也要先載入才算就緒
+    """
+    global _ready
+    t0 = time.perf_counter()
+    pool = get_video_executor()
+    workers, threads = process_thread_budget()
+    with multiprocessing.get_context("spawn").Manager() as manager:
+        barrier = manager.Barrier(workers)
+        futures = [pool.submit(_worker_warmup_status, barrier) for _ in range(workers)]
+        parent = _warmup_local()
+        statuses = []
+        for future in futures:
+            try:
+                statuses.append(future.result())
+            except Exception as e:
+                print(f"⚠️ 無法確認子行程 warmup 狀態: {e}")
+    warmed = sum(1 for _, ok in statuses if ok)
+    elapsed = time.perf_counter() - t0
+    _ready = True
+    print(f"🔥 情緒模型 warmup 完成 (父行程 + {warmed}/{workers} 個子行程, {elapsed:.2f}s)")
+    return {"engine": parent["engine"], "detector": parent["detector"], "processes": workers,
+            "processes_warmed": warmed, "threads_per_process": threads, "seconds": round(elapsed, 3)}
+
+
+class _EmotionAccumulator:
+    """
+    依畫面順序累積每幀機率：平滑、記錄逐幀結果與 timeline
+
+    - 逐幀 (平滑後) 結果存在預先配置的 (N, len(CLASSES)) 陣列，不夠時容量加倍
+    - 平滑用長度 SMOOTH_WINDOW 的環狀 buffer + running sum，每幀 O(1)、不配置新物件
+    - timeline 只記錄是哪幾列，需要時 (timeline_since) 才一次轉成 JSON 格式
+    """
+
+    SMOOTH_WINDOW = 5
+
+    def __init__(self, fps: float, frame_interval: int, timeline_period: float = None, capacity: int = 1024):
+        self.fps = fps
+        self.frame_interval = frame_interval
+        # 依時間取樣時，改以「每 timeline_period 秒一個點」決定 timeline
+        self.timeline_period = timeline_period
+        self._last_timeline_bucket = -1
+
+        n_classes = len(CLASSES)
+        self._history = np.empty((max(1, capacity), n_classes), dtype=np.float64)
+        self._frames = np.empty(max(1, capacity), dtype=np.int64)
+        self.count = 0
+        # 平滑後機率的逐欄總和 (隨時可得目前平均)
+        self.totals = np.zeros(n_classes, dtype=np.float64)
+
+        self._window = np.zeros((self.SMOOTH_WINDOW, n_classes), dtype=np.float64)
+        self._window_sum = np.zeros(n_classes, dtype=np.float64)
+        self._window_len = 0
+        self._window_pos = 0
+
+        self._timeline_frames = []
+        self._timeline_rows = []
+
+    def add(self, frame_count: int, probs: np.ndarray):
+        slot = self._window_pos
+        if self._window_len == self.SMOOTH_WINDOW:
+            self._window_sum -= self._window[slot]
+        else:
+            self._window_len += 1
+        self._window[slot] = probs
+        self._window_sum += self._window[slot]
+        self._window_pos = (slot + 1) % self.SMOOTH_WINDOW
+        if self._window_pos == 0:
+            # 每繞一圈重新加總一次，避免長影片的加減累積浮點誤差
+            self._window[:self._window_len].sum(axis=0, out=self._window_sum)
+
+        if self.count == len(self._history):
+            self._history = np.concatenate([self._history, np.empty_like(self._history)])
+            self._frames = np.concatenate([self._frames, np.empty_like(self._frames)])
+        self._frames[self.count] = frame_count
+        row = self._history[self.count]
+        np.divide(self._window_sum, self._window_len, out=row)
+        self.totals += row
+
+        if self._is_timeline_frame(frame_count):
+            self._timeline_frames.append(frame_count)
+            self._timeline_rows.append(self.count)
+        self.count += 1
+
+    @property
+    def history(self) -> np.ndarray:
+        """(已累積幀數, len(CLASSES)) 的平滑後機率 (view，不複製)"""
+        return self._history[:self.count]
+
+    def series(self):
+        """完整解析度序列：(每個分析幀的秒數, 平滑後機率)"""
+        return self._frames[:self.count] / self.fps, self.history
+
+    @property
+    def timeline_count(self) -> int:
+        return len(self._timeline_rows)
+
+    @property
+    def timeline_data(self) -> list:
+        return self.timeline_since(0)
+
+    def timeline_since(self, start: int) -> list:
+        """第 start 個之後的 timeline 點 ({"t", "c", "n", "p", "r"}，分數為 0-100 整數)"""
+        rows = self._timeline_rows[start:]
+        if not rows:
+            return []
+        percents = (self._history[rows] * 100).astype(np.int64)
+        c, n, p, r = (CLASSES.index(cls) for cls in ('confidence', 'nervous', 'passion', 'relaxed'))
+        return [
+            {
+                "t": round(frame_count / self.fps, 1),
+                "c": int(pct[c]),
+                "n": int(pct[n]),
+                "p": int(pct[p]),
+                "r": int(pct[r])
+            }
+            for frame_count, pct in zip(self._timeline_frames[start:], percents)
+        ]
+
+    def _is_timeline_frame(self, frame_count: int) -> bool:
+        if not self.timeline_period:
+            return frame_count % self.frame_interval == 0
+        bucket = int((frame_count / self.fps) / self.timeline_period)
+        if bucket == self._last_timeline_bucket:
+            return False
+        self._last_timeline_bucket = bucket
+        return True
+
+
+def _infer_batch(resized_faces: list) -> np.ndarray:
+    """
+    推論整批人臉 (resize_face 的結果)，回傳 (N, len(CLASSES)) 的機率
+
+    EMOTION_BATCH_SERVER 開啟時交給 BatchInferenceServer，與其他同時進行的分析合併成一批
+    """
+    if EMOTION_BATCH_SERVER:
+        return get_batch_server().infer(resized_faces)
+    return _infer_direct(resized_faces)
+
+
+def _infer_direct(resized_faces: list) -> np.ndarray:
+    """在目前線程直接做一次 forward"""
+    engine = get_engine()
+    buffer = get_thread_buffer(len(resized_faces), use_torch=engine.uses_torch)
+    with metrics.span("preprocess"):
+        batch = buffer.load(resized_faces)
+    with metrics.span("infer"):
+        return engine.predict(batch)
+
+
+def _features_direct(resized_faces: list) -> np.ndarray:
+    """在目前線程計算 backbone 特徵 (N, 512)"""
+    engine = get_engine()
+    buffer = get_thread_buffer(len(resized_faces), use_torch=engine.uses_torch)
+    with metrics.span("preprocess"):
+        batch = buffer.load(resized_faces)
+    with metrics.span("infer"):
+        return engine.features(batch)
+
+
+def _make_infer_fn(user_id: str = None):
+    """
+    回傳這次分析使用的推論函式
+
+    user_id 有個人化分類頭時：共用 backbone 算特徵，再套用該學生的分類頭；否則使用通用模型
+    """
+    head = get_personal_head(user_id)
+    if head is None:
+        return _infer_batch
+    if not get_engine().supports_features:
+        print(f"⚠️ 目前的推論引擎無法輸出 backbone 特徵，{user_id} 改用通用模型 (請重新執行 export_model)")
+        return _infer_batch
+    print(f"👤 使用 {user_id} 的個人化分類頭")
+
+    def infer(resized_faces: list) -> np.ndarray:
+        if EMOTION_BATCH_SERVER:
+            features = get_feature_server().infer(resized_faces)
+        else:
+            features = _features_direct(resized_faces)
+        return head.predict(features)
+
+    return infer
+
+
+def _make_face_detector():
+    """建立一組人臉偵測函式 (獨立的偵測器實例，開啟追蹤時包一層 FaceTracker)"""
+    detect = create_face_detector().detect
+    if EMOTION_FACE_TRACKING:
+        tracker = FaceTracker(detect, redetect_every=EMOTION_TRACK_REDETECT, padding=EMOTION_TRACK_PADDING)
+        return tracker.detect
+    return detect
+
+
+def _detect_face_crop(frame, detect_faces):
+    """在畫面中找最大的人臉並回傳原解析度的裁切，找不到回傳 None"""
+    with metrics.span("detect"):
+        return _find_largest_face(frame, detect_faces)
+
+
+def _find_largest_face(frame, detect_faces):
+    # 縮小圖片以加快偵測速度
+    h_orig, w_orig = frame.shape[:2]
+    if w_orig > 640:
+        scale = 640 / w_orig
+        frame_small = cv2.resize(frame, (640, int(h_orig * scale)))
+    else:
+        frame_small = frame
+
+    faces = detect_faces(frame_small)
+
+    if len(faces) == 0:
+        return None
+
+    if w_orig > 640:
+        scale_inv = w_orig / 640
+        faces = [(int(x*scale_inv), int(y*scale_inv), int(w*scale_inv), int(h*scale_inv)) for (x,y,w,h) in faces]
+
+    (x, y, w, h) = max(faces, key=lambda f: f[2] * f[3])
+    return frame[y:y+h, x:x+w]
+
+
+def _make_pipeline_detector():
+    """管線的偵測線程各自載入一份偵測器與追蹤狀態 (不共用實例)"""
+    detect_faces = _make_face_detector()
+
+    def detect(frame):
+        face_crop = _detect_face_crop(frame, detect_faces)
+        if face_crop is None:
+            return None
+        try:
+            with metrics.span("preprocess"):
+                return resize_face(face_crop)
+        except Exception:
+            return None
+
+    return detect
+
+
+def _open_frames(video_path: str, cap, read_state: dict, fps: float):
+    """依 VIDEO_DECODER 選擇解碼方式；ffmpeg 無法使用時退回 cv2.VideoCapture"""
+    if VIDEO_DECODER.lower() == "ffmpeg":
+        try:
+            decoder = FfmpegFileDecoder(
+                video_path, fps, sample_fps=EMOTION_SAMPLE_FPS, width=EMOTION_DECODE_WIDTH,
+                # 管線佇列 + 偵測線程 + 解碼線程手上的畫面都不能被覆寫
+                pool_size=EMOTION_QUEUE_SIZE + EMOTION_DETECT_WORKERS + 4,
+            )
+            print(f"🎞️ 使用 ffmpeg 解碼 ({decoder.size[0]}x{decoder.size[1]}, {decoder.rate:.2f} fps)")
+            return metrics.timed_iter("decode", decoder.frames(read_state))
+        except Exception as e:
+            print(f"⚠️ ffmpeg 解碼器無法使用 ({e})，改用 OpenCV")
+    return metrics.timed_iter("decode", iter_sampled_frames(cap, read_state, fps, sample_fps=EMOTION_SAMPLE_FPS))
+
+
+def _analyze_video_sync(video_path: str, save_video: bool, batch_size: int = None, user_id: str = None) -> dict:
+    """同步處理影片的核心邏輯 (在獨立線程中執行)
+
+    人臉裁切會先收集成 batch_size 張一批再做一次 forward，
+    推論完依原本的畫面順序做平滑，結果與逐張推論相同。
+    EMOTION_PIPELINE 開啟時，解碼 / 偵測 / 推論改由 VideoAnalysisPipeline 並行處理。
+    user_id 有個人化分類頭時改用該學生的分類頭 (見 personal_heads.py)。
+    """
     try:
         print(f"🎬 [Worker] 開始處理影片: {video_path}")
         cap = cv2.VideoCapture(video_path)
@@ -100,133 +549,163 @@ def _analyze_video_sync(video_path: str, save_video: bool) -> dict:
         if not cap.isOpened():
             return {"error": "Could not open video"}
 
-        timeline_data = []
         fps = cap.get(cv2.CAP_PROP_FPS)
         if fps == 0 or fps is None:
             fps = 30
         frame_interval = max(1, int(fps / 3))
+        batch_size = max(1, batch_size or EMOTION_BATCH_SIZE)
 
-        session_history = []
-        frame_count = 0
+        read_state = {"frames": 0}
         detected_count = 0
         
         orig_w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         orig_h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        print(f"🎥 原始影片尺寸: {orig_w} x {orig_h}, FPS: {fps}")
-
-        smooth_queue = deque(maxlen=5)
-
-        with torch.no_grad():
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                
-                frame_count += 1
-                if frame_count % 3 != 0:
+        print(f"🎥 原始影片尺寸: {orig_w} x {orig_h}, FPS: {fps}, Batch: {batch_size}, 取樣: {EMOTION_SAMPLE_FPS or '每 3 幀'}")
+
+        timeline_period = None
+        if EMOTION_SAMPLE_FPS > 0:
+            # 與固定跳幀模式相同的 timeline 密度 (每 lcm(3, frame_interval) 幀一點)
+            timeline_period = (3 * frame_interval // math.gcd(3, frame_interval)) / fps
+        # 依影片長度預估會分析的幀數，逐幀結果陣列一次配置到位
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        if EMOTION_SAMPLE_FPS > 0:
+            expected = int(total_frames / fps * EMOTION_SAMPLE_FPS) + 1
+        else:
+            expected = total_frames // 3 + 1
+        accumulator = _EmotionAccumulator(fps, frame_interval, timeline_period, capacity=max(expected, 64))
+        frames = _open_frames(video_path, cap, read_state, fps)
+        infer_batch = _make_infer_fn(user_id)
+
+        if EMOTION_PIPELINE:
+            pipeline = VideoAnalysisPipeline(
+                frames=frames,
+                make_detector=_make_pipeline_detector,
+                infer_batch=infer_batch,
+                on_result=accumulator.add,
+                batch_size=batch_size,
+                detect_workers=EMOTION_DETECT_WORKERS,
+                queue_size=EMOTION_QUEUE_SIZE,
+            )
+            pipeline.run()
+            detected_count = pipeline.faces_detected
+            print(f"🧵 [Worker] 管線統計: {pipeline.stats()}")
+        else:
+            # 等待推論的 (frame_count, 224x224 人臉)，保持畫面順序
+            pending = []
+
+            def flush_pending():
+                if not pending:
+                    return
+                probs = infer_batch([t for _, t in pending])
+                for (idx, _), p in zip(pending, probs):
+                    accumulator.add(idx, p)
+                pending.clear()
+
+            detect_faces = _make_face_detector()
+            for frame_count, frame in frames:
+                face_crop = _detect_face_crop(frame, detect_faces)
+                if face_crop is None:
                     continue
 
-                # 縮小圖片以加快偵測速度
-                h_orig, w_orig = frame.shape[:2]
-                if w_orig > 640:
-                    scale = 640 / w_orig
-                    frame_small = cv2.resize(frame, (640, int(h_orig * scale)))
-                else:
-                    frame_small = frame
-                    
-                gray = cv2.cvtColor(frame_small, cv2.COLOR_BGR2GRAY)
-                faces = face_cascade.detectMultiScale(gray, 1.1, 8)
-                
-                found_face_info = None
-                if len(faces) > 0:
-                     if w_orig > 640:
-                        scale_inv = w_orig / 640
-                        faces = [(int(x*scale_inv), int(y*scale_inv), int(w*scale_inv), int(h*scale_inv)) for (x,y,w,h) in faces]
-                        found_face_info = (frame, faces)
-                     else:
-                        found_face_info = (frame, faces)
-
-                if found_face_info is None:
+                detected_count += 1
+                try:
+                    with metrics.span("preprocess"):
+                        pending.append((frame_count, resize_face(face_crop)))
+                except Exception:
                     continue
 
-                detected_count += 1
-                correct_frame, faces = found_face_info
-                (x, y, w, h) = max(faces, key=lambda f: f[2] * f[3])
+                if len(pending) >= batch_size:
+                    flush_pending()
 
-                face_crop = correct_frame[y:y+h, x:x+w]
+            flush_pending()
 
-                try:
-                    img = cv2.cvtColor(face_crop, cv2.COLOR_BGR2RGB)
-                    img = Image.fromarray(img)
-                    img_tensor = transform(img).unsqueeze(0).to(device)
-
-                    outputs = model(img_tensor)
-                    probs = torch.softmax(outputs, dim=1)[0]
-                    
-                    smooth_queue.append(probs.cpu())
-                    avg_probs = torch.stack(list(smooth_queue), dim=0).mean(dim=0)
-
-                    current_emotions = {}
-                    for i, cls in enumerate(CLASSES):
-                        current_emotions[cls] = avg_probs[i].item()
-                    
-                    session_history.append(current_emotions)
-
-                    if frame_count % frame_interval == 0:
-                        timeline_entry = {
-                            "t": round(frame_count / fps, 1),
-                            "c": int(current_emotions['confidence'] * 100),
-                            "n": int(current_emotions['nervous'] * 100),
-                            "p": int(current_emotions['passion'] * 100),
-                            "r": int(current_emotions['relaxed'] * 100)
-                        }
-                        timeline_data.append(timeline_entry)
+        if _batch_server is not None:
+            print(f"🧮 [Worker] 批次推論統計 (累計): {_batch_server.stats()}")
+        if _feature_server is not None:
+            print(f"🧮 [Worker] 特徵批次統計 (累計): {_feature_server.stats()}")
 
-                except Exception:
-                    pass
+        frame_count = read_state["frames"]
 
         cap.release()
         print(f"📊 [Worker] 分析完成：共 {frame_count} 幀，辨識 {detected_count} 幀")
-        
-        if not session_history:
-            return {"error": "No face detected. Please fetch camera directly to your face."}
 
+        return _build_video_result(accumulator, video_path, save_video)
+
+    except Exception as e:
+        print(f"❌ [Worker] 分析錯誤: {e}")
+        traceback.print_exc()
+        return {"error": f"Error: {str(e)}"}
+
+
+def _build_video_result(accumulator: _EmotionAccumulator, video_path: str, save_video: bool) -> dict:
+    """
+    由累積的逐幀結果計算平均分數並處理影片檔 (上傳分析與串流分析共用)
+
+    完整解析度的序列存進 TimelineStore，回傳的 timeline 是原本的取樣點，
+    之後由 limit_timeline() 依前端要求的點數降取樣
+    """
+    history = accumulator.history
+    if len(history) == 0:
+        return {"error": "No face detected. Please fetch camera directly to your face."}
+
+    with metrics.span("aggregate"):
         # 計算平均分數
-        avg_scores = {cls: 0.0 for cls in CLASSES}
-        for entry in session_history:
-            for cls in CLASSES:
-                avg_scores[cls] += entry[cls]
-                
-        final_scores_float = {}
-        for cls in CLASSES:
-            final_scores_float[cls] = (avg_scores[cls] / len(session_history)) * 100
+        avg_scores = history.mean(axis=0) * 100
+        final_scores_float = {cls: float(avg_scores[i]) for i, cls in enumerate(CLASSES)}
         
         final_scores_int = {k: int(v) for k, v in final_scores_float.items()}
         print(f"📈 結果: {final_scores_int}")
 
-        # 處理影片 URL (先回傳，AI 評語稍後處理)
-        video_url = None
-        if save_video:
-            filename = os.path.basename(video_path)
-            video_url = f"http://10.0.2.2:8000/static/videos/{filename}"
-        else:
+        timeline_id = None
+        try:
+            timeline_id = get_timeline_store().save(*accumulator.series())
+        except Exception as e:
+            print(f"⚠️ 完整 timeline 保存失敗: {e}")
+        timeline = accumulator.timeline_data
+
+    # 處理影片 URL (先回傳，AI 評語稍後處理)
+    video_url = _finalize_video_file(video_path, save_video)
+
+    return {
+        "emotions": final_scores_int,
+        "timeline": timeline,
+        "timeline_id": timeline_id,
+        "final_scores_float": final_scores_float,
+        "video_url": video_url
+    }
+
+
+def limit_timeline(result: dict, max_points: int = None) -> dict:
+    """
+    timeline 超過 max_points 個點時，以 LTTB 從完整序列降取樣 (預設 EMOTION_TIMELINE_MAX_POINTS)
+
+    完整序列已過期時，改從原本的 timeline 點降取樣
+    """
+    max_points = EMOTION_TIMELINE_MAX_POINTS if max_points is None else max_points
+    timeline = result.get("timeline") or []
+    if not max_points or len(timeline) <= max_points:
+        return result
+
+    series = get_timeline_store().load(result["timeline_id"]) if result.get("timeline_id") else None
+    if series is None:
+        series = points_to_series(timeline)
+    result["timeline"] = downsample(*series, max_points)
+    return result
+
+
+def _finalize_video_file(video_path: str, save_video: bool):
+    """保存影片時回傳 URL，否則刪除暫存影片；串流分析沒有存影片時 video_path 為 None"""
+    if save_video and video_path:
+        filename = os.path.basename(video_path)
+        return f"http://10.0.2.2:8000/static/videos/{filename}"
+    if video_path:
+        with metrics.span("file_cleanup"):
             try:
                 os.remove(video_path)
                 print(f"🗑️ 已刪除暫存影片")
             except:
                 pass
-
-        return {
-            "emotions": final_scores_int,
-            "timeline": timeline_data,
-            "final_scores_float": final_scores_float,
-            "video_url": video_url
-        }
-
-    except Exception as e:
-        print(f"❌ [Worker] 分析錯誤: {e}")
-        traceback.print_exc()
-        return {"error": f"Error: {str(e)}"}
+    return None
 
 
 def _generate_ai_feedback_sync(final_scores_float: dict) -> dict:
@@ -285,7 +764,7 @@ def _generate_ai_feedback_sync(final_scores_float: dict) -> dict:
         print("🤖 呼叫 OpenAI 生成評語 (同步，在獨立線程中)...")
         
         # ★★★ 使用同步 httpx ★★★
-        with httpx.Client(timeout=30.0) as client:
+        with metrics.span("llm_feedback"), httpx.Client(timeout=30.0) as client:
             resp = client.post(url, headers=headers, json=payload)
         
         if resp.status_code == 200:
@@ -315,33 +794,84 @@ def _generate_ai_feedback_sync(final_scores_float: dict) -> dict:
         return {
             "overall_score": calc_score,
             "comment": f"你的自信程度為 {c}%，整體表現{'良好' if c >= 50 else '尚可'}。{'熱忱度足夠，能感受到你對這次面試的重視。' if p >= 40 else '建議展現更多熱忱。'}{'但緊張程度較高，可能影響發揮。' if n >= 50 else '情緒控制穩定。'}建議多練習模擬面試以提升表現。",
-            "suggestion": "面試前做 3 次深呼吸放鬆；練習對鏡子回答問題；準備 2-3 個自己的故事案例"
+            "suggestion": "面試前做 3 次深呼吸放鬆；練習對鏡子回答問題；準備 2-3 個自己的故事案例",
+            # 內部標記：救援評語不寫入結果快取 (回傳前會移除)
+            "_fallback": True,
         }
 
 
-async def analyze_video(video_path: str, save_video: bool = True) -> dict:
+def _result_cache_version(user_id: str = None) -> str:
+    """結果快取的版本：模型版本，使用個人化分類頭時再加上分類頭版本"""
+    head = get_personal_head(user_id)
+    return model_version() if head is None else f"{model_version()}_{head.version}"
+
+
+async def analyze_video(video_path: str, save_video: bool = True, content_hash: str = None,
+                        on_stage=None, max_points: int = None, user_id: str = None) -> dict:
     """
     非同步分析影片
-    - 影片處理：在 ThreadPoolExecutor 中執行（不阻塞主線程）
+    - 影片處理：在 ThreadPoolExecutor 中執行（不阻塞主線程）；EMOTION_EXECUTOR=process 時改在子行程執行
     - AI 評語：也在 ThreadPoolExecutor 中執行
+    - content_hash：影片內容的 sha256，有提供時先查結果快取，命中就不再分析
+    - on_stage：進入各階段時呼叫 on_stage("analyzing" / "ai_feedback") (給 /jobs 回報進度)
+    - max_points：timeline 最多回傳幾個點 (預設 EMOTION_TIMELINE_MAX_POINTS，0 = 不限制)
+    - user_id：學生 id，有個人化分類頭時使用 (見 personal_heads.py)
     """
     loop = asyncio.get_event_loop()
+    report = on_stage or (lambda stage: None)
+
+    cache = get_result_cache() if content_hash else None
+    if cache:
+        version = await loop.run_in_executor(executor, _result_cache_version, user_id)
+        cached = await loop.run_in_executor(executor, cache.get, content_hash, version)
+        if cached is not None:
+            print(f"♻️ 命中分析結果快取: {content_hash[:12]}")
+            cached["video_url"] = _finalize_video_file(video_path, save_video)
+            cached["cached"] = True
+            return limit_timeline(cached, max_points)
     
     # ★★★ 使用 ThreadPoolExecutor 執行影片分析 ★★★
     # 這樣即使影片處理崩潰，也不會影響主程式
-    video_result = await loop.run_in_executor(executor, _analyze_video_sync, video_path, save_video)
+    report("analyzing")
+    video_executor = get_video_executor()
+    try:
+        video_result = await loop.run_in_executor(video_executor, _analyze_video_sync, video_path, save_video,
+                                                  None, user_id)
+    except BrokenProcessPool as e:
+        print(f"❌ 影片分析子行程異常結束: {e}")
+        _reset_video_executor(video_executor)
+        return {"error": "Error: video analysis worker crashed"}
     
     if "error" in video_result:
         return video_result
-    
+
+    report("ai_feedback")
+    result, from_openai = await _attach_ai_feedback(video_result)
+    if cache and from_openai:
+        # 快取存未降取樣的 timeline，之後不同 max_points 的請求都能使用
+        await loop.run_in_executor(executor, cache.put, content_hash, result, version)
+    return limit_timeline(result, max_points)
+
+
+async def attach_ai_feedback(video_result: dict) -> dict:
+    """把 _build_video_result 的結果補上 AI 評語 (上傳分析與串流分析共用)"""
+    result, _ = await _attach_ai_feedback(video_result)
+    return result
+
+
+async def _attach_ai_feedback(video_result: dict):
+    """回傳 (結果, 評語是否來自 OpenAI)"""
+    loop = asyncio.get_event_loop()
+
     # 提取分析結果
     final_scores_float = video_result.pop("final_scores_float", {})
     
     # ★★★ 在獨立線程中呼叫 OpenAI ★★★
     ai_feedback = await loop.run_in_executor(executor, _generate_ai_feedback_sync, final_scores_float)
     
+    from_openai = not ai_feedback.pop("_fallback", False)
     video_result["ai_analysis"] = ai_feedback
-    return video_result
+    return video_result, from_openai
 
 
 def _analyze_portfolio_sync(pdf_path: str) -> dict:
@@ -352,11 +882,12 @@ def _analyze_portfolio_sync(pdf_path: str) -> dict:
             from PyPDF2 import PdfReader
             text_content = ""
             
-            reader = PdfReader(pdf_path)
-            for page in reader.pages:
-                t = page.extract_text()
-                if t:
-                    text_content += t + "\n"
+            with metrics.span("pdf_extract"):
+                reader = PdfReader(pdf_path)
+                for page in reader.pages:
+                    t = page.extract_text()
+                    if t:
+                        text_content += t + "\n"
             
             print(f"📖 提取到 {len(text_content)} 字")
             
@@ -427,7 +958,7 @@ def _analyze_portfolio_sync(pdf_path: str) -> dict:
         }
         
         # ★★★ 使用同步 httpx ★★★
-        with httpx.Client(timeout=60.0) as client:
+        with metrics.span("llm_portfolio"), httpx.Client(timeout=60.0) as client:
             resp = client.post(url, headers=headers, json=payload)
         
         if resp.status_code == 200:
@@ -0,0 +1,95 @@
+# export_model.py
+# 把情緒模型匯出成 ONNX 與 TorchScript，供 inference_engine 的 onnx / torchscript 引擎使用
+#
+# 指令 (在 Luminew/backend 目錄下)：
+#   python -m app.services.export_model                # 兩種都匯出
+#   python -m app.services.export_model --format onnx --check
+# 輸出放在 checkpoint 旁邊：test_best_.onnx / test_best_.ts.pt
+# 兩者都輸出 (logits, features)：features 是 fc 層之前的 512 維特徵，給個人化分類頭使用
+
+import argparse
+import numpy as np
+import torch
+
+from app.services.emotion_model import MODEL_PATH, build_fp32_model, onnx_path, torchscript_path
+
+ONNX_OPSET = 17
+
+
+class WithFeatures(torch.nn.Module):
+    """ResNet18 forward，多回傳 fc 層的輸入"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        m = self.model
+        x = m.maxpool(m.relu(m.bn1(m.conv1(x))))
+        x = m.layer4(m.layer3(m.layer2(m.layer1(x))))
+        features = torch.flatten(m.avgpool(x), 1)
+        return m.fc(features), features
+
+
+def export_onnx(model, path: str):
+    example = torch.randn(1, 3, 224, 224)
+    torch.onnx.export(
+        WithFeatures(model).eval(), example, path,
+        input_names=["input"],
+        output_names=["logits", "features"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}, "features": {0: "batch"}},
+        opset_version=ONNX_OPSET,
+        do_constant_folding=True,
+        # 新版 torch 預設改用 dynamo 匯出器 (需要 onnxscript)；dynamic_axes / opset_version 是舊匯出器的參數
+        dynamo=False,
+    )
+    print(f"💾 ONNX 已匯出: {path}")
+
+
+def export_torchscript(model, path: str):
+    with torch.no_grad():
+        scripted = torch.jit.trace(WithFeatures(model).eval(), torch.randn(1, 3, 224, 224))
+    scripted = torch.jit.freeze(scripted.eval())
+    torch.jit.save(scripted, path)
+    print(f"💾 TorchScript 已匯出: {path}")
+
+
+def check_exports(model, model_path: str, formats, batch_size: int = 8):
+    """用隨機輸入比較匯出結果與原模型的 logits"""
+    x = torch.randn(batch_size, 3, 224, 224)
+    with torch.no_grad():
+        expected = model(x).numpy()
+
+    if "torchscript" in formats:
+        ts = torch.jit.load(torchscript_path(model_path))
+        with torch.no_grad():
+            diff = np.abs(ts(x)[0].numpy() - expected).max()
+        print(f"🔍 TorchScript 最大誤差: {diff:.2e}")
+
+    if "onnx" in formats:
+        import onnxruntime as ort
+        session = ort.InferenceSession(onnx_path(model_path), providers=["CPUExecutionProvider"])
+        got = session.run(None, {session.get_inputs()[0].name: x.numpy()})[0]
+        print(f"🔍 ONNX 最大誤差: {np.abs(got - expected).max():.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="匯出情緒模型 (ONNX / TorchScript)")
+    parser.add_argument("--model", default=MODEL_PATH, help="fp32 checkpoint 路徑")
+    parser.add_argument("--format", choices=["onnx", "torchscript", "all"], default="all")
+    parser.add_argument("--check", action="store_true", help="匯出後與原模型比對輸出")
+    args = parser.parse_args()
+
+    formats = ["onnx", "torchscript"] if args.format == "all" else [args.format]
+    model = build_fp32_model(args.model)
+
+    if "onnx" in formats:
+        export_onnx(model, onnx_path(args.model))
+    if "torchscript" in formats:
+        export_torchscript(model, torchscript_path(args.model))
+    if args.check:
+        check_exports(model, args.model, formats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# face_detector.py
+# 人臉偵測後端：Haar / OpenCV DNN (SSD) / YuNet
+#
+# 所有後端都實作 detect(image_bgr) -> [(x, y, w, h), ...]，座標以傳入影像為準。
+# 由環境變數 EMOTION_FACE_DETECTOR 選擇 ("haar" / "ssd" / "yunet")；
+# DNN 模型檔不存在時自動退回 Haar，服務不會因此無法啟動。
+#
+# 注意：cv2.CascadeClassifier / cv2.dnn.Net 都不保證線程安全，
+# 每個線程請各自呼叫 create_face_detector() 取得自己的實例。
+#
+# Flask 分析器 (frontend/backend/face_detector.py) 以檔案路徑載入同一份程式，
+# 那裡沒有 app 套件：模組層級不能 import app.*，設定只在呼叫端沒有傳入時才讀 app.core.config。
+
+import os
+import cv2
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MODELS_DIR = os.path.join(PROJECT_DIR, "models")
+
+HAAR_PATH = os.path.join(PROJECT_DIR, "haarcascade_frontalface_default.xml")
+if not os.path.exists(HAAR_PATH):
+    print(f"⚠️ 本地找不到 {HAAR_PATH}，嘗試使用 OpenCV 內建路徑...")
+    HAAR_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+# OpenCV DNN 模型檔 (需自行下載放到 models/，可用環境變數覆寫路徑)
+SSD_PROTOTXT_PATH = os.getenv("SSD_PROTOTXT_PATH", os.path.join(MODELS_DIR, "deploy.prototxt"))
+SSD_MODEL_PATH = os.getenv("SSD_MODEL_PATH", os.path.join(MODELS_DIR, "res10_300x300_ssd_iter_140000.caffemodel"))
+YUNET_MODEL_PATH = os.getenv("YUNET_MODEL_PATH", os.path.join(MODELS_DIR, "face_detection_yunet_2023mar.onnx"))
+
+BACKENDS = ("haar", "ssd", "yunet")
+
+
+class FaceDetector:
+    """人臉偵測器介面"""
+
+    name = "base"
+
+    def detect(self, image):
+        """BGR 影像 -> [(x, y, w, h), ...]"""
+        raise NotImplementedError
+
+
+class HaarFaceDetector(FaceDetector):
+    """OpenCV Haar Cascade (與原本的參數 1.1, 8 相同)"""
+
+    name = "haar"
+
+    def __init__(self, path: str = HAAR_PATH, scale_factor: float = 1.1, min_neighbors: int = 8):
+        self.cascade = cv2.CascadeClassifier(path)
+        if self.cascade.empty():
+            raise RuntimeError(f"無法載入人臉辨識器: {path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+
+    def detect(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        faces = self.cascade.detectMultiScale(gray, self.scale_factor, self.min_neighbors)
+        return [tuple(int(v) for v in f) for f in faces]
+
+
+class SsdFaceDetector(FaceDetector):
+    """OpenCV DNN ResNet-10 SSD (res10_300x300)，暗光與側臉比 Haar 穩定"""
+
+    name = "ssd"
+
+    def __init__(self, prototxt: str = SSD_PROTOTXT_PATH, model_path: str = SSD_MODEL_PATH,
+                 confidence: float = 0.6):
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, model_path)
+        self.confidence = confidence
+
+    def detect(self, image):
+        h, w = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, (300, 300), (104.0, 177.0, 123.0))
+        self.net.setInput(blob)
+        detections = self.net.forward()
+
+        faces = []
+        for i in range(detections.shape[2]):
+            score = float(detections[0, 0, i, 2])
+            if score < self.confidence:
+                continue
+            x0 = max(0, int(detections[0, 0, i, 3] * w))
+            y0 = max(0, int(detections[0, 0, i, 4] * h))
+            x1 = min(w, int(detections[0, 0, i, 5] * w))
+            y1 = min(h, int(detections[0, 0, i, 6] * h))
+            if x1 > x0 and y1 > y0:
+                faces.append((x0, y0, x1 - x0, y1 - y0))
+        return faces
+
+
+class YuNetFaceDetector(FaceDetector):
+    """OpenCV YuNet (cv2.FaceDetectorYN)，速度快且支援任意輸入尺寸"""
+
+    name = "yunet"
+
+    def __init__(self, model_path: str = YUNET_MODEL_PATH, confidence: float = 0.6):
+        self.detector = cv2.FaceDetectorYN.create(model_path, "", (320, 320), confidence)
+        self._input_size = None
+
+    def detect(self, image):
+        h, w = image.shape[:2]
+        if self._input_size != (w, h):
+            self.detector.setInputSize((w, h))
+            self._input_size = (w, h)
+
+        _, detections = self.detector.detect(image)
+        if detections is None:
+            return []
+
+        faces = []
+        for d in detections:
+            x, y, fw, fh = (int(v) for v in d[:4])
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(w, x + fw), min(h, y + fh)
+            if x1 > x0 and y1 > y0:
+                faces.append((x0, y0, x1 - x0, y1 - y0))
+        return faces
+
+
+def create_face_detector(backend: str = None, confidence: float = None) -> FaceDetector:
+    """
+    依名稱建立偵測器；DNN 模型缺少時退回 Haar
+
+    backend / confidence 沒有傳入時讀 EMOTION_FACE_DETECTOR / EMOTION_DNN_CONFIDENCE
+    """
+    if backend is None or confidence is None:
+        from app.core.config import EMOTION_FACE_DETECTOR, EMOTION_DNN_CONFIDENCE
+        backend = backend or EMOTION_FACE_DETECTOR
+        confidence = EMOTION_DNN_CONFIDENCE if confidence is None else confidence
+    backend = backend.lower()
+    if backend not in BACKENDS:
+        print(f"⚠️ 未知的人臉偵測後端 '{backend}'，改用 haar")
+        backend = "haar"
+
+    try:
+        if backend == "ssd":
+            return SsdFaceDetector(confidence=confidence)
+        if backend == "yunet":
+            return YuNetFaceDetector(confidence=confidence)
+    except Exception as e:
+        print(f"⚠️ 無法載入 {backend} 人臉偵測模型 ({e})，改用 haar")
+
+    return HaarFaceDetector()
@@ -0,0 +1,64 @@
+# face_tracker.py
+# 人臉追蹤：面試影片通常只有一張幾乎不動的臉，
+# 不必每幀都掃整張畫面，只要在上一個人臉框附近找即可。
+#
+# - 每 redetect_every 幀 (或追蹤遺失時) 才做一次全畫面偵測
+# - 其他幀只在「上一個框 + padding」的小區域內偵測
+# - 小區域找不到時，同一幀立刻改做全畫面偵測，不會因此漏幀
+
+
+class FaceTracker:
+    """
+    包裝任意人臉偵測函式 detect(image_bgr) -> [(x, y, w, h), ...]，
+    提供與原函式相同介面的 detect(frame)，座標以傳入的 frame 為準
+    """
+
+    def __init__(self, detect, redetect_every: int = 15, padding: float = 0.5):
+        self._detect = detect
+        self.redetect_every = max(1, redetect_every)
+        self.padding = padding
+        self.last_box = None
+        self.frames_since_full = 0
+        # 統計：全畫面 / 區域偵測次數
+        self.full_detections = 0
+        self.roi_detections = 0
+
+    def reset(self):
+        self.last_box = None
+        self.frames_since_full = 0
+
+    def detect(self, frame):
+        if self.last_box is not None and self.frames_since_full < self.redetect_every:
+            faces = self._detect_in_roi(frame)
+            if faces:
+                self.frames_since_full += 1
+                self._update(faces)
+                return faces
+
+        faces = [tuple(int(v) for v in f) for f in self._detect(frame)]
+        self.full_detections += 1
+        self.frames_since_full = 0
+        self._update(faces)
+        return faces
+
+    def _update(self, faces):
+        if faces:
+            self.last_box = max(faces, key=lambda f: f[2] * f[3])
+        else:
+            self.last_box = None
+
+    def _detect_in_roi(self, frame):
+        x, y, w, h = self.last_box
+        pad_w = int(w * self.padding)
+        pad_h = int(h * self.padding)
+        frame_h, frame_w = frame.shape[:2]
+        x0 = max(0, x - pad_w)
+        y0 = max(0, y - pad_h)
+        x1 = min(frame_w, x + w + pad_w)
+        y1 = min(frame_h, y + h + pad_h)
+        if x1 <= x0 or y1 <= y0:
+            return []
+
+        self.roi_detections += 1
+        roi = frame[y0:y1, x0:x1]
+        return [(int(fx) + x0, int(fy) + y0, int(fw), int(fh)) for (fx, fy, fw, fh) in self._detect(roi)]
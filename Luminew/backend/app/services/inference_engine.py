@@ -0,0 +1,175 @@
+# inference_engine.py
+# 情緒模型推論引擎
+#
+# 所有引擎都實作 predict(batch) -> numpy (N, len(CLASSES)) 機率，
+# 輸入為 FaceBatchBuffer.load() 的結果 (torch 引擎拿到 Tensor，onnx 引擎拿到 numpy)。
+#
+# EMOTION_ENGINE：
+#   - torch：PyTorch eager (依 EMOTION_MODEL_PRECISION 載入 fp32 / int8)
+#   - torchscript：export_model.py 匯出的 TorchScript (不需要 torchvision)
+#   - onnx：export_model.py 匯出的 ONNX，以 onnxruntime 執行 (不需要 torch / torchvision)
+# 匯出檔不存在或載入失敗時退回 torch 引擎
+#
+# features(batch) 回傳分類層之前的 backbone 特徵 (N, 512)，給個人化分類頭使用 (見 personal_heads.py)：
+#   - torch：在 fc 層掛 forward hook 取得輸入
+#   - torchscript / onnx：匯出檔帶有第二個輸出 features (舊的匯出檔請重新執行 export_model)
+
+import os
+import threading
+import numpy as np
+from app.core.config import EMOTION_ENGINE, EMOTION_ONNX_THREADS
+from app.services.emotion_model import MODEL_PATH, onnx_path, torchscript_path
+
+ENGINES = ("torch", "torchscript", "onnx")
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    e = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+class InferenceEngine:
+    """推論引擎介面"""
+
+    name = "base"
+    # 前處理 buffer 是否要配置成 torch.Tensor
+    uses_torch = False
+    # 是否能輸出 backbone 特徵
+    supports_features = False
+
+    def predict(self, batch) -> np.ndarray:
+        raise NotImplementedError
+
+    def features(self, batch) -> np.ndarray:
+        raise NotImplementedError(f"{self.name} 引擎無法輸出 backbone 特徵")
+
+
+def _find_classifier(model):
+    """找出 ResNet 的 fc 層 (量化模型可能包在 QuantWrapper.module 底下)"""
+    fc = getattr(model, "fc", None)
+    if fc is not None:
+        return fc
+    try:
+        for name, module in model.named_modules():
+            if name.split(".")[-1] == "fc":
+                return module
+    except Exception:
+        pass
+    return None
+
+
+class TorchEngine(InferenceEngine):
+    """PyTorch 模型 (eager / int8 量化 / TorchScript 皆可)"""
+
+    name = "torch"
+    uses_torch = True
+
+    def __init__(self, model, device, feature_output: bool = False):
+        import torch
+        self._torch = torch
+        self.model = model
+        self.device = device
+        # feature_output：模型本身回傳 (logits, features) (匯出的 TorchScript)
+        self.feature_output = feature_output
+        self._captured = threading.local()
+        self.supports_features = feature_output
+        if not feature_output:
+            fc = _find_classifier(model)
+            try:
+                fc.register_forward_hook(self._capture_features)
+                self.supports_features = True
+            except Exception:
+                # 找不到 fc 或不支援 hook (舊的 TorchScript 匯出檔)
+                pass
+
+    def _capture_features(self, module, inputs, output):
+        # hook 在呼叫 forward 的線程中執行，各線程分開存放
+        self._captured.features = inputs[0]
+
+    def _forward(self, batch):
+        torch = self._torch
+        if not isinstance(batch, torch.Tensor):
+            batch = torch.from_numpy(batch)
+        outputs = self.model(batch.to(self.device, non_blocking=True))
+        if isinstance(outputs, (tuple, list)):
+            return outputs[0], outputs[1]
+        return outputs, getattr(self._captured, "features", None)
+
+    def predict(self, batch) -> np.ndarray:
+        torch = self._torch
+        with torch.inference_mode():
+            logits, _ = self._forward(batch)
+            return torch.softmax(logits, dim=1).cpu().numpy()
+
+    def features(self, batch) -> np.ndarray:
+        if not self.supports_features:
+            return super().features(batch)
+        with self._torch.inference_mode():
+            _, features = self._forward(batch)
+            if features.is_quantized:
+                features = features.dequantize()
+            return features.flatten(1).float().cpu().numpy()
+
+
+class OnnxEngine(InferenceEngine):
+    """onnxruntime CPU 推論"""
+
+    name = "onnx"
+
+    def __init__(self, path: str, threads: int = EMOTION_ONNX_THREADS):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = max(1, threads or os.cpu_count() or 1)
+        options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        outputs = [o.name for o in self.session.get_outputs()]
+        self.output_name = outputs[0]
+        self.supports_features = "features" in outputs
+
+    def predict(self, batch) -> np.ndarray:
+        logits = self.session.run([self.output_name], {self.input_name: np.ascontiguousarray(batch)})[0]
+        return _softmax(logits)
+
+    def features(self, batch) -> np.ndarray:
+        if not self.supports_features:
+            return super().features(batch)
+        return self.session.run(["features"], {self.input_name: np.ascontiguousarray(batch)})[0]
+
+
+def _torch_engine() -> TorchEngine:
+    from app.services.emotion_model import load_emotion_model
+    model, device = load_emotion_model()
+    return TorchEngine(model, device)
+
+
+def create_engine(name: str = None, model_path: str = MODEL_PATH, threads: int = None) -> InferenceEngine:
+    """依名稱 (預設讀 EMOTION_ENGINE) 建立推論引擎；threads 可覆寫 onnxruntime 的線程數"""
+    name = (name or EMOTION_ENGINE).lower()
+    if name not in ENGINES:
+        print(f"⚠️ 未知的推論引擎 '{name}'，改用 torch")
+        name = "torch"
+
+    try:
+        if name == "onnx":
+            engine = OnnxEngine(onnx_path(model_path), threads or EMOTION_ONNX_THREADS)
+            print(f"✅ 使用 onnxruntime 引擎 (threads={engine.session.get_session_options().intra_op_num_threads})")
+            return engine
+        if name == "torchscript":
+            import torch
+            model = torch.jit.load(torchscript_path(model_path), map_location="cpu").eval()
+            # 新版匯出檔回傳 (logits, features)
+            with torch.inference_mode():
+                feature_output = isinstance(model(torch.zeros(1, 3, 224, 224)), (tuple, list))
+            print("✅ 使用 TorchScript 引擎")
+            engine = TorchEngine(model, torch.device("cpu"), feature_output=feature_output)
+            engine.name = "torchscript"
+            return engine
+    except Exception as e:
+        print(f"⚠️ 無法載入 {name} 引擎 ({e})，改用 torch；請先執行 python -m app.services.export_model")
+
+    return _torch_engine()
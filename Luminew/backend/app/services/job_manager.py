@@ -0,0 +1,187 @@
+# job_manager.py
+# 非同步工作 (/jobs)：POST 立即回傳 job id，實際分析在背景執行
+#
+# 分析與 LLM 呼叫仍然使用原本的 executor (analyze_video / analyze_portfolio / question_generator)，
+# 這裡只負責記錄狀態：
+#   queued -> running (stage: analyzing / ai_feedback ...) -> done | error
+# 每次狀態改變都寫成 <job_dir>/<id>.json，服務重啟後已完成的結果仍可查詢；
+# 重啟時還在 queued / running 的工作無法接續，標記為 error (interrupted)。
+# 寫檔交給單一的背景線程 (依序寫入，較新的狀態不會被較舊的覆蓋)，不在 event loop 上做磁碟 I/O；
+# 第一次呼叫 get_job_manager() 時才建立資料夾並讀回舊紀錄，import 時不碰磁碟。
+
+import asyncio
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.config import EMOTION_JOB_DIR, EMOTION_JOB_TTL_HOURS
+from app.services.emotion_model import PROJECT_DIR
+
+FINISHED = ("done", "error")
+
+
+class JobManager:
+    """記錄背景工作狀態、持久化到磁碟，並通知訂閱進度的連線"""
+
+    def __init__(self, job_dir: str, ttl_seconds: float = 72 * 3600):
+        self.job_dir = job_dir
+        self.ttl_seconds = ttl_seconds
+        self._jobs = {}
+        self._subscribers = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        os.makedirs(job_dir, exist_ok=True)
+        self._load()
+
+    # ---------------------------
+    # 持久化
+    # ---------------------------
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.job_dir, f"{job_id}.json")
+
+    def _save(self, job: dict):
+        """寫入一筆工作 (在寫檔線程中執行；job 必須是不會再被修改的快照)"""
+        tmp_path = self._path(job["id"]) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(job["id"]))
+
+    def _remove(self, job_id: str):
+        try:
+            os.remove(self._path(job_id))
+        except OSError:
+            pass
+
+    def _load(self):
+        """讀回先前的工作；過期的刪除，未完成的標記為中斷 (建立時同步執行，此時還沒有其他線程)"""
+        now = time.time()
+        for name in os.listdir(self.job_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.job_dir, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            if now - job.get("updated_at", 0) > self.ttl_seconds:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+
+            if job.get("status") not in FINISHED:
+                job.update(status="error", error="interrupted by server restart", updated_at=now)
+                self._save(job)
+            self._jobs[job["id"]] = job
+        if self._jobs:
+            print(f"📋 已載入 {len(self._jobs)} 筆工作紀錄")
+
+    def _prune(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["status"] in FINISHED and now - job["updated_at"] > self.ttl_seconds]
+        for job_id in expired:
+            del self._jobs[job_id]
+            self._writer.submit(self._remove, job_id)
+
+    # ---------------------------
+    # 狀態
+    # ---------------------------
+    def get(self, job_id: str):
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields, updated_at=time.time())
+            snapshot = dict(job)
+            self._writer.submit(self._save, snapshot)
+        for queue in self._subscribers.get(job_id, []):
+            queue.put_nowait(snapshot)
+
+    def submit(self, kind: str, run, cleanup=None) -> dict:
+        """
+        建立工作並在背景執行 (需在 event loop 中呼叫)
+
+        - run(on_stage)：回傳結果 dict 的 coroutine function，可呼叫 on_stage(stage) 回報進度
+        - cleanup()：工作失敗時清除輸入檔案
+        結果含 "error" 時工作狀態為 error
+        """
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": "queued",
+            "stage": None,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        with self._lock:
+            self._prune()
+            self._jobs[job["id"]] = job
+            self._writer.submit(self._save, dict(job))
+
+        task = asyncio.ensure_future(self._run(job["id"], run, cleanup))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        print(f"📋 建立工作 {job['id']} ({kind})")
+        return dict(job)
+
+    async def _run(self, job_id: str, run, cleanup):
+        self._update(job_id, status="running")
+        try:
+            result = await run(lambda stage: self._update(job_id, stage=stage))
+        except Exception as e:
+            traceback.print_exc()
+            result = {"error": f"Error: {str(e)}"}
+            if cleanup:
+                cleanup()
+
+        if isinstance(result, dict) and "error" in result:
+            self._update(job_id, status="error", error=result["error"], result=result)
+        else:
+            self._update(job_id, status="done", result=result)
+        print(f"📋 工作 {job_id} 結束: {self._jobs[job_id]['status']}")
+
+    async def subscribe(self, job_id: str):
+        """依序產出工作狀態 (先送目前狀態)，工作結束後停止；工作不存在 (或已被清除) 時不產出任何狀態"""
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        try:
+            job = self.get(job_id)
+            if job is None:
+                return
+            yield job
+            while job["status"] not in FINISHED:
+                job = await queue.get()
+                yield job
+        finally:
+            self._subscribers[job_id].remove(queue)
+            if not self._subscribers[job_id]:
+                del self._subscribers[job_id]
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """取得 JobManager (第一次呼叫時建立資料夾並讀回先前的工作)"""
+    global _job_manager
+    if _job_manager is None:
+        with _job_manager_lock:
+            if _job_manager is None:
+                _job_manager = JobManager(EMOTION_JOB_DIR or os.path.join(PROJECT_DIR, "cache", "jobs"),
+                                          EMOTION_JOB_TTL_HOURS * 3600)
+    return _job_manager
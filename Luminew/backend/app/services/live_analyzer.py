@@ -0,0 +1,115 @@
+# live_analyzer.py
+# 即時情緒辨識 (/emotion/live)：前端持續送攝影機畫面，後端以固定頻率回傳平滑後的機率
+#
+# 低延遲的關鍵是「只處理最新的一張」：
+#   - 收到的畫面只放進一個 slot，還沒處理的舊畫面直接被覆蓋 (計入 dropped)，不排隊
+#   - 每個連線同時最多只有一張畫面在推論，伺服器忙時自然降低回傳頻率，而不是延遲越積越多
+#   - 推論使用專用的 live_executor，不會被排在整段影片分析的任務後面
+# 平滑方式與 即時辨識_個人化.py 相同：最近 5 次結果取平均。
+
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+from app.core import metrics
+from app.core.config import EMOTION_LIVE_RATE, EMOTION_LIVE_WORKERS
+from app.services.emotion_model import CLASSES
+from app.services.emotion_service import _detect_face_crop, _infer_batch, _make_face_detector
+from app.services.preprocess import resize_face
+
+LIVE_FORMATS = ("jpeg", "bgr", "rgba")
+SMOOTH_WINDOW = 5
+
+live_executor = ThreadPoolExecutor(max_workers=EMOTION_LIVE_WORKERS)
+metrics.register_queue("live", lambda: metrics.executor_queue_depth(live_executor))
+
+
+class LiveSession:
+    """
+    一個 /emotion/live 連線的狀態
+
+    - format="jpeg"：每個訊息一張 JPEG
+    - format="bgr" / "rgba"：每個訊息一張未壓縮畫面，需提供 width / height
+    """
+
+    def __init__(self, fmt: str = "jpeg", width: int = 0, height: int = 0, rate: float = 0):
+        if fmt not in LIVE_FORMATS:
+            raise ValueError(f"format 必須是 {LIVE_FORMATS} 其中之一")
+        if fmt != "jpeg" and (width <= 0 or height <= 0):
+            raise ValueError("未壓縮畫面需要提供 width 與 height")
+        self.fmt = fmt
+        self.width = width
+        self.height = height
+        self.period = 1.0 / (rate or EMOTION_LIVE_RATE)
+        self.smooth_queue = deque(maxlen=SMOOTH_WINDOW)
+        self._detect_faces = None
+        self._latest = None
+        self._latest_at = 0.0
+        self._has_frame = asyncio.Event()
+        self._last_start = 0.0
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+
+    def offer(self, data: bytes):
+        """收到一張畫面：覆蓋尚未處理的舊畫面"""
+        self.received += 1
+        if self._latest is not None:
+            self.dropped += 1
+        self._latest = data
+        self._latest_at = time.monotonic()
+        self._has_frame.set()
+
+    async def next_update(self) -> dict:
+        """等到下一個回傳時間點，處理當時最新的畫面並回傳結果"""
+        wait = self._last_start + self.period - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await self._has_frame.wait()
+
+        data, received_at = self._latest, self._latest_at
+        self._latest = None
+        self._has_frame.clear()
+        self._last_start = time.monotonic()
+
+        loop = asyncio.get_event_loop()
+        update = await loop.run_in_executor(live_executor, self._process, data)
+        self.processed += 1
+        update["latency_ms"] = int((time.monotonic() - received_at) * 1000)
+        update["dropped"] = self.dropped
+        return update
+
+    def _decode(self, data: bytes):
+        if self.fmt == "jpeg":
+            return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        channels = 3 if self.fmt == "bgr" else 4
+        if len(data) != self.width * self.height * channels:
+            return None
+        frame = np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, channels)
+        return frame if self.fmt == "bgr" else cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR)
+
+    def _process(self, data: bytes) -> dict:
+        """解碼 + 偵測 + 推論 + 平滑 (在 live_executor 中執行，同一連線一次只有一個)"""
+        if self._detect_faces is None:
+            self._detect_faces = _make_face_detector()
+
+        frame = self._decode(data)
+        if frame is None:
+            return {"type": "error", "error": "無法解碼畫面"}
+
+        face_crop = _detect_face_crop(frame, self._detect_faces)
+        if face_crop is None:
+            return {"type": "emotion", "face": False, "emotions": None}
+
+        probs = _infer_batch([resize_face(face_crop)])[0]
+        self.smooth_queue.append(probs)
+        avg_probs = np.mean(self.smooth_queue, axis=0)
+        return {
+            "type": "emotion",
+            "face": True,
+            "emotions": {cls: round(float(avg_probs[i]), 4) for i, cls in enumerate(CLASSES)},
+            "top": CLASSES[int(np.argmax(avg_probs))],
+        }
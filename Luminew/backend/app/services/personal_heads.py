@@ -0,0 +1,153 @@
+# personal_heads.py
+# 個人化分類頭
+#
+# 原本的個人化流程 (執行即時微調.py / 即時辨識_個人化.py) 替每位學生存一份完整的 ResNet18
+# ({username}_model.pth，約 45 MB)，服務端無法同時載入多人。這裡改成：
+#   - 所有人共用同一個凍結的 backbone (推論引擎的 features()，512 維)
+#   - 每位學生只有一個 Linear(512, 4)：weight / bias 存成 <EMOTION_PERSONAL_HEAD_DIR>/<user_id>.npz (約 8 KB)
+#   - 分析時依 user_id 載入到 LRU 快取 (最多 EMOTION_PERSONAL_HEAD_CACHE 個)；
+#     每次取得時比對檔案修改時間，微調後覆寫檔案 (或呼叫 publish) 不需要重啟服務
+# 沒有個人化分類頭的學生照常使用通用模型。
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from app.core.config import EMOTION_PERSONAL_HEADS, EMOTION_PERSONAL_HEAD_DIR, EMOTION_PERSONAL_HEAD_CACHE
+from app.services.emotion_model import PROJECT_DIR, MODEL_PATH, CLASSES
+from app.services.inference_engine import _softmax
+
+# user_id 只允許文字 / 數字 / 底線 / 連字號 (會直接當成檔名)
+_USER_ID_RE = re.compile(r"[\w\-]{1,64}")
+
+
+def valid_user_id(user_id: str) -> bool:
+    return bool(user_id) and _USER_ID_RE.fullmatch(user_id) is not None
+
+
+class PersonalHead:
+    """一位學生的分類頭：probs = softmax(features @ weight.T + bias)"""
+
+    def __init__(self, weight: np.ndarray, bias: np.ndarray):
+        self.weight = np.ascontiguousarray(weight, dtype=np.float32)
+        self.bias = np.ascontiguousarray(bias, dtype=np.float32)
+        if self.weight.shape[0] != len(CLASSES) or self.bias.shape != (len(CLASSES),):
+            raise ValueError(f"head shape {self.weight.shape} does not match {len(CLASSES)} classes")
+        # 給結果快取分辨不同版本的分類頭
+        self.version = hashlib.sha256(self.weight.tobytes() + self.bias.tobytes()).hexdigest()[:12]
+
+    @property
+    def nbytes(self) -> int:
+        return self.weight.nbytes + self.bias.nbytes
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        return _softmax(features @ self.weight.T + self.bias)
+
+    @classmethod
+    def load(cls, path: str) -> "PersonalHead":
+        with np.load(path) as data:
+            classes = [str(c) for c in data["classes"]]
+            if classes != CLASSES:
+                raise ValueError(f"head classes {classes} do not match {CLASSES}")
+            return cls(data["weight"], data["bias"])
+
+    def save(self, path: str):
+        # 先寫暫存檔再改名 (np.savez 會自動補 .npz，暫存檔名也要以 .npz 結尾)
+        tmp_path = path[:-4] + ".tmp.npz"
+        np.savez(tmp_path, weight=self.weight, bias=self.bias, classes=np.array(CLASSES))
+        os.replace(tmp_path, path)
+
+
+class PersonalHeadCache:
+    """依 user_id 載入分類頭的 LRU 快取 (多線程安全；沒有分類頭的 user_id 也會記住，避免每次讀檔)"""
+
+    def __init__(self, head_dir: str, max_entries: int = 256):
+        self.head_dir = head_dir
+        self.max_entries = max(1, max_entries)
+        self._heads = OrderedDict()  # user_id -> (檔案修改時間, PersonalHead 或 None)
+        self._lock = threading.Lock()
+        os.makedirs(head_dir, exist_ok=True)
+
+    def path(self, user_id: str) -> str:
+        return os.path.join(self.head_dir, f"{user_id}.npz")
+
+    def get(self, user_id: str):
+        """取得分類頭；沒有 (或 user_id 不合法) 時回傳 None"""
+        if not valid_user_id(user_id):
+            return None
+        path = self.path(user_id)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        with self._lock:
+            entry = self._heads.get(user_id)
+            if entry is not None and entry[0] == mtime:
+                self._heads.move_to_end(user_id)
+                return entry[1]
+
+        head = None
+        if mtime is not None:
+            try:
+                head = PersonalHead.load(path)
+                print(f"👤 載入 {user_id} 的個人化分類頭 ({head.nbytes / 1024:.1f} KB)")
+            except Exception as e:
+                print(f"⚠️ {user_id} 的個人化分類頭無法載入: {e}")
+        self._remember(user_id, mtime, head)
+        return head
+
+    def publish(self, user_id: str, head: PersonalHead):
+        """保存新的分類頭並立即生效"""
+        if not valid_user_id(user_id):
+            raise ValueError(f"invalid user id: {user_id!r}")
+        path = self.path(user_id)
+        head.save(path)
+        self._remember(user_id, os.stat(path).st_mtime_ns, head)
+
+    def _remember(self, user_id: str, mtime, head):
+        with self._lock:
+            self._heads[user_id] = (mtime, head)
+            self._heads.move_to_end(user_id)
+            while len(self._heads) > self.max_entries:
+                self._heads.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            heads = [h for _, h in self._heads.values() if h is not None]
+        return {"entries": len(self._heads), "heads": len(heads), "bytes": sum(h.nbytes for h in heads)}
+
+
+def load_base_head(model_path: str = MODEL_PATH) -> PersonalHead:
+    """通用模型 checkpoint 中的 fc 層 (個人化微調的起點)"""
+    import torch
+
+    checkpoint = torch.load(model_path, map_location="cpu")
+    state_dict = checkpoint["state_dict"] if "state_dict" in checkpoint else checkpoint
+    # fc 可能是 Linear 或 Sequential(Dropout, Linear)
+    prefix = "fc.1." if "fc.1.weight" in state_dict else "fc."
+    return PersonalHead(state_dict[prefix + "weight"].float().numpy(), state_dict[prefix + "bias"].float().numpy())
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_head_cache() -> PersonalHeadCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                head_dir = EMOTION_PERSONAL_HEAD_DIR or os.path.join(PROJECT_DIR, "models", "personal_heads")
+                _cache = PersonalHeadCache(head_dir, EMOTION_PERSONAL_HEAD_CACHE)
+    return _cache
+
+
+def get_personal_head(user_id: str):
+    """取得 user_id 的分類頭；EMOTION_PERSONAL_HEADS=0 或沒有時回傳 None"""
+    if not EMOTION_PERSONAL_HEADS or not user_id:
+        return None
+    return get_head_cache().get(user_id)
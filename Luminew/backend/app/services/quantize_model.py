@@ -0,0 +1,235 @@
+# quantize_model.py
+# 情緒模型 INT8 量化 (CPU 推論用)
+#
+# - static：FX graph mode 全模型量化 (conv/linear/relu 皆為 int8)，需要校準資料，加速最明顯
+# - dynamic：只量化 Linear 層，不需要校準資料 (沒有設定校準資料夾時的退路)
+#
+# 轉換結果以 TorchScript 存在原始 checkpoint 旁邊 (test_best_.pth -> test_best_.int8.pt)，
+# 並記錄來源 checkpoint 的大小 / 修改時間與量化方式 / 校準資料夾，任一項改變後會自動重新轉換。
+#
+# 指令 (在 Luminew/backend 目錄下)：
+#   python -m app.services.quantize_model --mode static --calib-dir data/calib --eval-dir data/holdout
+# 校準 / 驗證資料夾格式：<dir>/<類別名稱>/*.jpg，內容為已裁切的人臉 (校準資料夾可不分類別)
+
+import argparse
+import copy
+import json
+import os
+import time
+import cv2
+import torch
+import torch.nn as nn
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+from app.core.config import EMOTION_INT8_CALIB_DIR
+from app.services.emotion_model import CLASSES, MODEL_PATH, build_fp32_model
+from app.services.preprocess import FaceBatchBuffer, resize_face
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+_SIGNATURE_FILE = "signature.json"
+
+
+def int8_path(model_path: str = MODEL_PATH) -> str:
+    return os.path.splitext(model_path)[0] + ".int8.pt"
+
+
+def select_engine() -> str:
+    """選擇可用的量化後端 (x86 / fbgemm 用於 Intel/AMD，qnnpack 用於 ARM)"""
+    supported = torch.backends.quantized.supported_engines
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in supported:
+            torch.backends.quantized.engine = engine
+            return engine
+    raise RuntimeError(f"此 PyTorch 不支援量化後端: {supported}")
+
+
+def _signature(model_path: str, engine: str, mode: str, calib_dir: str = "") -> dict:
+    stat = os.stat(model_path)
+    return {
+        "source": os.path.basename(model_path),
+        "size": stat.st_size,
+        "mtime": int(stat.st_mtime),
+        "engine": engine,
+        "torch": torch.__version__,
+        # 設定了校準資料 (或換了資料夾) 後不可沿用 dynamic / 舊校準資料的結果
+        "mode": mode,
+        "calib_dir": os.path.abspath(calib_dir) if mode == "static" else "",
+    }
+
+
+# ---------------------------
+# 資料
+# ---------------------------
+def iter_face_images(image_dir: str):
+    """走訪資料夾，產出 (BGR 影像, 類別索引)；不在 CLASSES 內的資料夾標為 -1"""
+    for root, _, files in os.walk(image_dir):
+        label_name = os.path.basename(root)
+        label = CLASSES.index(label_name) if label_name in CLASSES else -1
+        for f in sorted(files):
+            if not f.lower().endswith(IMAGE_EXTS):
+                continue
+            img = cv2.imread(os.path.join(root, f))
+            if img is not None:
+                yield img, label
+
+
+def iter_batches(image_dir: str, batch_size: int = 32, max_batches: int = 0):
+    """產出 (輸入張量, 標籤列表)，前處理與線上服務相同"""
+    buffer = FaceBatchBuffer(batch_size, pin_memory=False)
+    faces, labels, count = [], [], 0
+    for img, label in iter_face_images(image_dir):
+        faces.append(resize_face(img))
+        labels.append(label)
+        if len(faces) == batch_size:
+            yield buffer.load(faces).clone(), labels
+            faces, labels = [], []
+            count += 1
+            if max_batches and count >= max_batches:
+                return
+    if faces:
+        yield buffer.load(faces).clone(), labels
+
+
+# ---------------------------
+# 量化
+# ---------------------------
+def quantize_static(fp32_model: nn.Module, calib_dir: str, engine: str, max_batches: int = 32) -> nn.Module:
+    """FX graph mode 靜態量化：插入 observer -> 用校準資料跑一輪 -> 轉成 int8"""
+    example = torch.randn(1, 3, 224, 224)
+    prepared = prepare_fx(copy.deepcopy(fp32_model).cpu().eval(), get_default_qconfig_mapping(engine), (example,))
+
+    seen = 0
+    with torch.no_grad():
+        for batch, _ in iter_batches(calib_dir, max_batches=max_batches):
+            prepared(batch)
+            seen += len(batch)
+    if seen == 0:
+        raise RuntimeError(f"校準資料夾沒有可用的人臉圖片: {calib_dir}")
+    print(f"📐 已用 {seen} 張人臉完成校準")
+    return convert_fx(prepared)
+
+
+def quantize_dynamic_model(fp32_model: nn.Module) -> nn.Module:
+    return quantize_dynamic(copy.deepcopy(fp32_model).cpu().eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def save_int8(model: nn.Module, path: str, signature: dict):
+    """以 TorchScript 存檔 (載入時不需要重建量化圖)"""
+    with torch.no_grad():
+        scripted = torch.jit.trace(model, torch.randn(1, 3, 224, 224))
+    scripted = torch.jit.freeze(scripted.eval())
+    # 先寫暫存檔再改名：其他行程 (process 模式的子行程) 不會讀到寫到一半的檔案
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        torch.jit.save(scripted, tmp_path, _extra_files={_SIGNATURE_FILE: json.dumps(signature)})
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    print(f"💾 INT8 模型已存檔: {path}")
+
+
+def load_cached(path: str, signature: dict):
+    """讀取快取的 INT8 模型；不存在、來源 checkpoint 或量化設定 (mode / 校準資料夾) 已變更時回傳 None"""
+    if not os.path.exists(path):
+        return None
+    extra = {_SIGNATURE_FILE: ""}
+    model = torch.jit.load(path, map_location="cpu", _extra_files=extra)
+    cached = json.loads(extra[_SIGNATURE_FILE] or "{}")
+    if cached != signature:
+        print("♻️ checkpoint 或量化設定已更新，重新產生 INT8 模型")
+        return None
+    return model
+
+
+def load_or_quantize(model_path: str = MODEL_PATH, calib_dir: str = EMOTION_INT8_CALIB_DIR,
+                     mode: str = None, force: bool = False):
+    """取得 INT8 模型：優先讀快取，否則轉換並快取 (有校準資料用 static，否則 dynamic)"""
+    engine = select_engine()
+    if mode is None:
+        mode = "static" if calib_dir and os.path.isdir(calib_dir) else "dynamic"
+    signature = _signature(model_path, engine, mode, calib_dir)
+    path = int8_path(model_path)
+
+    if not force:
+        cached = load_cached(path, signature)
+        if cached is not None:
+            return cached
+
+    fp32_model = build_fp32_model(model_path)
+    if mode == "static":
+        model = quantize_static(fp32_model, calib_dir, engine)
+    else:
+        print("⚠️ 未設定校準資料 (EMOTION_INT8_CALIB_DIR)，使用 dynamic 量化 (只量化 Linear 層)")
+        model = quantize_dynamic_model(fp32_model)
+
+    save_int8(model, path, signature)
+    return load_cached(path, signature)
+
+
+# ---------------------------
+# 準確度檢查
+# ---------------------------
+def evaluate(fp32_model: nn.Module, int8_model, eval_dir: str, batch_size: int = 32) -> dict:
+    """在 held-out 資料上比較 fp32 / int8：準確率、預測一致率、機率差、延遲"""
+    fp32_model = fp32_model.cpu().eval()
+    total = labeled = agree = 0
+    correct = {"fp32": 0, "int8": 0}
+    seconds = {"fp32": 0.0, "int8": 0.0}
+    prob_diff = 0.0
+
+    with torch.no_grad():
+        for batch, labels in iter_batches(eval_dir, batch_size=batch_size):
+            t0 = time.perf_counter()
+            p32 = torch.softmax(fp32_model(batch), dim=1)
+            t1 = time.perf_counter()
+            p8 = torch.softmax(int8_model(batch), dim=1)
+            t2 = time.perf_counter()
+            seconds["fp32"] += t1 - t0
+            seconds["int8"] += t2 - t1
+
+            pred32, pred8 = p32.argmax(dim=1), p8.argmax(dim=1)
+            agree += int((pred32 == pred8).sum())
+            prob_diff += float((p32 - p8).abs().sum(dim=1).sum())
+            total += len(labels)
+            for i, label in enumerate(labels):
+                if label < 0:
+                    continue
+                labeled += 1
+                correct["fp32"] += int(pred32[i] == label)
+                correct["int8"] += int(pred8[i] == label)
+
+    if total == 0:
+        raise RuntimeError(f"驗證資料夾沒有可用的人臉圖片: {eval_dir}")
+    return {
+        "images": total,
+        "fp32_accuracy": correct["fp32"] / labeled if labeled else None,
+        "int8_accuracy": correct["int8"] / labeled if labeled else None,
+        "agreement": agree / total,
+        "mean_prob_l1_diff": prob_diff / total,
+        "fp32_ms_per_image": seconds["fp32"] * 1000 / total,
+        "int8_ms_per_image": seconds["int8"] * 1000 / total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="情緒模型 INT8 量化與準確度檢查")
+    parser.add_argument("--model", default=MODEL_PATH, help="fp32 checkpoint 路徑")
+    parser.add_argument("--mode", choices=["static", "dynamic"], default=None,
+                        help="量化方式 (預設：有校準資料用 static，否則 dynamic)")
+    parser.add_argument("--calib-dir", default=EMOTION_INT8_CALIB_DIR, help="校準用人臉圖片資料夾")
+    parser.add_argument("--eval-dir", default="", help="held-out 驗證資料夾 (<dir>/<類別>/*.jpg)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--force", action="store_true", help="忽略快取重新轉換")
+    args = parser.parse_args()
+
+    int8_model = load_or_quantize(args.model, args.calib_dir, mode=args.mode, force=args.force)
+
+    if args.eval_dir:
+        report = evaluate(build_fp32_model(args.model), int8_model, args.eval_dir, args.batch_size)
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,7 @@ import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import traceback
+from app.core import metrics
 
 load_dotenv()
 
@@ -23,6 +24,7 @@ DEFAULT_QUESTIONS = [
 
 # ★★★ 建立共用的 ThreadPoolExecutor ★★★
 executor = ThreadPoolExecutor(max_workers=4)
+metrics.register_queue("questions", lambda: metrics.executor_queue_depth(executor))
 
 
 def _process_pdf_and_call_openai_sync(pdf_path: str, interview_type: str) -> dict:
@@ -42,12 +44,13 @@ def _process_pdf_and_call_openai_sync(pdf_path: str, interview_type: str) -> dic
         print("📄 讀取 PDF...")
         try:
             from PyPDF2 import PdfReader
-            reader = PdfReader(pdf_path)
-            text = ""
-            for page in reader.pages:
-                t = page.extract_text()
-                if t:
-                    text += t + "\n"
+            with metrics.span("pdf_extract"):
+                reader = PdfReader(pdf_path)
+                text = ""
+                for page in reader.pages:
+                    t = page.extract_text()
+                    if t:
+                        text += t + "\n"
             print(f"📄 提取 {len(text)} 字")
         except Exception as e:
             print(f"⚠️ PDF 讀取失敗: {e}")
@@ -86,7 +89,7 @@ def _process_pdf_and_call_openai_sync(pdf_path: str, interview_type: str) -> dic
 只回傳 JSON 陣列：["問題1", "問題2", "問題3", "問題4", "問題5"]"""
         
         # 使用同步 httpx（在線程中執行所以不會阻塞主程式）
-        with httpx.Client(timeout=60.0) as client:
+        with metrics.span("llm_questions"), httpx.Client(timeout=60.0) as client:
             resp = client.post(
                 "https://api.openai.com/v1/chat/completions",
                 headers={
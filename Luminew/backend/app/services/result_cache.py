@@ -0,0 +1,192 @@
+# result_cache.py
+# 影片分析結果的磁碟快取
+#
+# 學生常常重複上傳同一支影片 (網路重試、切換 save_video)，每次都會重新解碼、推論並呼叫 OpenAI。
+# 上傳時邊寫檔邊計算 sha256 (見 HashingWriter)，以「影片 hash + 模型版本」為 key 存放
+# emotions / timeline / ai_analysis：
+#   - 模型版本由 checkpoint 內容與會影響結果的分析設定組成，換模型或改設定後舊結果自動失效
+#   - TTL：超過 EMOTION_CACHE_TTL_HOURS 的結果視為過期
+#   - LRU：以檔案修改時間記錄最後使用時間，超過 EMOTION_CACHE_MAX_ENTRIES 時刪除最久沒用的
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from app.core.config import (
+    EMOTION_CACHE,
+    EMOTION_CACHE_DIR,
+    EMOTION_CACHE_MAX_ENTRIES,
+    EMOTION_CACHE_TTL_HOURS,
+    EMOTION_MODEL_VERSION,
+    EMOTION_ENGINE,
+    EMOTION_MODEL_PRECISION,
+    EMOTION_FACE_DETECTOR,
+    EMOTION_FACE_TRACKING,
+    EMOTION_TRACK_REDETECT,
+    EMOTION_TRACK_PADDING,
+    EMOTION_SAMPLE_FPS,
+    VIDEO_DECODER,
+    EMOTION_DECODE_WIDTH,
+)
+from app.services.emotion_model import PROJECT_DIR, MODEL_PATH, onnx_path, torchscript_path
+
+# 結果格式或分析邏輯改變時遞增，讓舊快取失效
+CACHE_FORMAT = 1
+# 快取的欄位 (video_url 依每次請求的 save_video 重新產生)
+CACHED_FIELDS = ("emotions", "timeline", "timeline_id", "ai_analysis")
+
+_file_hashes = {}
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """計算檔案 sha256 (依路徑 / 大小 / 修改時間記住結果，checkpoint 不會每次重算)"""
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime)
+    if key not in _file_hashes:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                h.update(chunk)
+        _file_hashes[key] = h.hexdigest()
+    return _file_hashes[key]
+
+
+def model_version() -> str:
+    """目前模型 + 分析設定的版本字串"""
+    if EMOTION_MODEL_VERSION:
+        return EMOTION_MODEL_VERSION
+
+    engine = EMOTION_ENGINE.lower()
+    weights = {"onnx": onnx_path(), "torchscript": torchscript_path()}.get(engine, MODEL_PATH)
+    if not os.path.exists(weights):
+        # 匯出檔不存在時引擎會退回 torch
+        weights = MODEL_PATH
+    parts = {
+        "format": CACHE_FORMAT,
+        "weights": file_sha256(weights) if os.path.exists(weights) else "missing",
+        "engine": engine,
+        "precision": EMOTION_MODEL_PRECISION.lower(),
+        "detector": EMOTION_FACE_DETECTOR.lower(),
+        "tracking": [EMOTION_FACE_TRACKING, EMOTION_TRACK_REDETECT, EMOTION_TRACK_PADDING],
+        "sample_fps": EMOTION_SAMPLE_FPS,
+        # ffmpeg 與 cv2 的取樣時間點 / 縮放結果不同
+        "decoder": [VIDEO_DECODER.lower(), EMOTION_DECODE_WIDTH],
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class HashingWriter:
+    """上傳時邊寫檔邊計算 sha256，不需要再讀一次檔案"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "wb")
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def close(self) -> str:
+        """關閉檔案並回傳內容 hash"""
+        self._file.close()
+        return self._hash.hexdigest()
+
+
+class ResultCache:
+    """以 JSON 檔存放的分析結果快取 (多線程安全)"""
+
+    def __init__(self, cache_dir: str, max_entries: int = 500, ttl_seconds: float = 7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, content_hash: str, version: str) -> str:
+        return os.path.join(self.cache_dir, f"{content_hash}_{version}.json")
+
+    def get(self, content_hash: str, version: str = None):
+        """取得快取結果；不存在或已過期時回傳 None"""
+        path = self._path(content_hash, version or model_version())
+        with self._lock:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+
+            if time.time() - entry.get("created", 0) > self.ttl_seconds:
+                self._remove(path)
+                self.misses += 1
+                return None
+
+            # 更新最後使用時間 (LRU)
+            os.utime(path, None)
+            self.hits += 1
+            return entry["result"]
+
+    def put(self, content_hash: str, result: dict, version: str = None):
+        """存入分析結果 (只保留 CACHED_FIELDS)，必要時淘汰舊資料"""
+        entry = {
+            "created": time.time(),
+            "result": {k: result[k] for k in CACHED_FIELDS if k in result},
+        }
+        path = self._path(content_hash, version or model_version())
+        with self._lock:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            # 先寫暫存檔再改名，避免讀到寫一半的檔案
+            os.replace(tmp_path, path)
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                last_used = os.path.getmtime(path)
+            except OSError:
+                continue
+            # 超過 TTL 沒被使用的一定過期，直接刪除
+            if now - last_used > self.ttl_seconds:
+                self._remove(path)
+            else:
+                entries.append((last_used, path))
+
+        if len(entries) > self.max_entries:
+            entries.sort()
+            for _, path in entries[:len(entries) - self.max_entries]:
+                self._remove(path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_cache = None
+
+
+def get_result_cache():
+    """取得共用的快取實例；EMOTION_CACHE=0 時回傳 None"""
+    global _cache
+    if not EMOTION_CACHE:
+        return None
+    if _cache is None:
+        cache_dir = EMOTION_CACHE_DIR or os.path.join(PROJECT_DIR, "cache", "results")
+        _cache = ResultCache(cache_dir, EMOTION_CACHE_MAX_ENTRIES, EMOTION_CACHE_TTL_HOURS * 3600)
+    return _cache
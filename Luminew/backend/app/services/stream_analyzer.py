@@ -0,0 +1,223 @@
+# stream_analyzer.py
+# 邊上傳邊分析：收到一段就處理一段，隨時可以取出部分結果
+#
+# 兩種輸入：
+#   - fmp4：fragmented MP4 片段 (例如 MediaRecorder / 手機錄影邊錄邊傳)，交給 ffmpeg 解碼
+#   - jpeg：逐張 JPEG 畫面 (前端自行抽幀)，每個訊息一張
+# 偵測 / 推論 / 平滑與上傳整段影片時相同 (emotion_service 的函式)，
+# 結束時回傳與 /emotion/analyze 相同格式的結果。
+
+import asyncio
+import os
+import threading
+import time
+import uuid
+import cv2
+import numpy as np
+
+from app.core.config import EMOTION_BATCH_SIZE, EMOTION_STREAM_FPS, EMOTION_STREAM_PUSH_INTERVAL
+from app.services.emotion_model import CLASSES
+from app.services.emotion_service import (
+    executor,
+    get_video_storage_dir,
+    attach_ai_feedback,
+    limit_timeline,
+    _EmotionAccumulator,
+    _build_video_result,
+    _detect_face_crop,
+    _infer_batch,
+    _make_face_detector,
+)
+from app.services.preprocess import resize_face
+from app.services.video_decoder import FfmpegPipeDecoder
+
+STREAM_FORMATS = ("fmp4", "jpeg")
+# 與上傳整段影片時的 timeline 密度相近 (30fps 影片每秒一點)
+STREAM_TIMELINE_PERIOD = 1.0
+
+
+class StreamingAnalyzer:
+    """
+    逐幀接收畫面並累積情緒結果 (同步，請在 executor 中呼叫 feed)
+
+    feed() 只會在同一個線程呼叫；partial() 可以從其他線程 (event loop) 呼叫
+    """
+
+    def __init__(self, fps: float, batch_size: int = None, max_wait: float = EMOTION_STREAM_PUSH_INTERVAL):
+        self.fps = fps
+        self.batch_size = max(1, batch_size or EMOTION_BATCH_SIZE)
+        # 畫面進來得慢時，等待湊滿一批的上限 (秒)，避免部分結果延遲太久
+        self.max_wait = max_wait
+        self.accumulator = _EmotionAccumulator(fps, max(1, int(fps / 3)), timeline_period=STREAM_TIMELINE_PERIOD)
+        self._detect_faces = _make_face_detector()
+        self._pending = []
+        self._pending_since = 0.0
+        self._lock = threading.Lock()
+        self._sent_timeline = 0
+        self._sent_frames = 0
+        self._jpeg_count = 0
+        self.frames = 0
+        self.faces = 0
+
+    def feed(self, frame_count: int, frame):
+        self.frames += 1
+        face_crop = _detect_face_crop(frame, self._detect_faces)
+        if face_crop is not None:
+            self.faces += 1
+            try:
+                if not self._pending:
+                    self._pending_since = time.monotonic()
+                self._pending.append((frame_count, resize_face(face_crop)))
+            except Exception:
+                pass
+
+        if len(self._pending) >= self.batch_size or (
+                self._pending and time.monotonic() - self._pending_since >= self.max_wait):
+            self.flush()
+
+    def feed_jpeg(self, data: bytes):
+        """解碼一張 JPEG 並分析；無法解碼的資料直接略過"""
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return
+        self._jpeg_count += 1
+        self.feed(self._jpeg_count, frame)
+
+    def flush(self):
+        if not self._pending:
+            return
+        probs = _infer_batch([t for _, t in self._pending])
+        with self._lock:
+            for (idx, _), p in zip(self._pending, probs):
+                self.accumulator.add(idx, p)
+        self._pending.clear()
+
+    def partial(self):
+        """自上次呼叫後新增的 timeline 點與目前的平均分數；沒有新結果時回傳 None"""
+        with self._lock:
+            analyzed = self.accumulator.count
+            if analyzed == self._sent_frames:
+                return None
+            timeline = self.accumulator.timeline_since(self._sent_timeline)
+            self._sent_timeline += len(timeline)
+            self._sent_frames = analyzed
+            averages = self.accumulator.totals / analyzed
+        return {
+            "type": "partial",
+            "emotions": {cls: int(averages[i] * 100) for i, cls in enumerate(CLASSES)},
+            "timeline": timeline,
+            "analyzed_frames": analyzed,
+            "received_frames": self.frames,
+        }
+
+    def result(self, video_path: str = None, save_video: bool = False) -> dict:
+        """處理剩下的畫面並產生最終結果 (與 _analyze_video_sync 相同格式)"""
+        self.flush()
+        print(f"📊 [Stream] 分析完成：共 {self.frames} 幀，辨識 {self.faces} 幀")
+        return _build_video_result(self.accumulator, video_path, save_video)
+
+
+class StreamSession:
+    """
+    一次串流分析 (WebSocket 與 SSE 端點共用)
+
+    start() -> 多次 push(data) -> finish()；中途失敗或斷線時呼叫 abort()
+    """
+
+    def __init__(self, fmt: str = "fmp4", fps: float = 0, save_video: bool = False):
+        if fmt not in STREAM_FORMATS:
+            raise ValueError(f"format 必須是 {STREAM_FORMATS} 其中之一")
+        self.fmt = fmt
+        self.fps = fps or EMOTION_STREAM_FPS
+        # 只有 fmp4 有完整影片可以保存
+        self.save_video = save_video and fmt == "fmp4"
+        self.analyzer = None
+        self.decoder = None
+        self.video_path = None
+        self._video_file = None
+        self._reader = None
+        self._last_push = 0.0
+
+    async def start(self):
+        loop = asyncio.get_event_loop()
+        # 建立偵測器 (以及第一次使用時載入模型) 可能要一段時間，不在 event loop 上執行
+        self.analyzer = await loop.run_in_executor(executor, StreamingAnalyzer, self.fps)
+        if self.fmt == "fmp4":
+            self.decoder = FfmpegPipeDecoder(self.fps)
+            # 解碼 + 分析在背景線程持續進行，直到 ffmpeg 的輸出結束
+            self._reader = loop.run_in_executor(None, self._read_frames)
+            if self.save_video:
+                self.video_path = os.path.join(get_video_storage_dir(), f"{uuid.uuid4()}.mp4")
+                self._video_file = open(self.video_path, "wb")
+        print(f"📡 [Stream] 開始串流分析 (格式: {self.fmt}, {self.fps} fps)")
+
+    def _read_frames(self):
+        for frame_count, frame in self.decoder.frames():
+            self.analyzer.feed(frame_count, frame)
+
+    async def push(self, data: bytes):
+        """送入一段資料 (部分結果由 partials_while() 定時取出)"""
+        loop = asyncio.get_event_loop()
+        if self.fmt == "jpeg":
+            await loop.run_in_executor(executor, self.analyzer.feed_jpeg, data)
+        else:
+            if self._video_file:
+                self._video_file.write(data)
+            if not await loop.run_in_executor(None, self.decoder.write, data):
+                raise RuntimeError(f"影片解碼失敗: {self.decoder.wait()}")
+
+    async def partials_while(self, feeder: asyncio.Task):
+        """
+        feeder (持續 push 的 task) 執行期間，每 EMOTION_STREAM_PUSH_INTERVAL 秒產出一次新的部分結果
+
+        由計時驅動而不是等新資料到達：前端暫停上傳或 ffmpeg 還在緩衝時，已分析完的畫面照樣推送。
+        feeder 結束後重新拋出它的例外 (沒有例外則正常結束)
+        """
+        while not feeder.done():
+            await asyncio.wait({feeder}, timeout=EMOTION_STREAM_PUSH_INTERVAL)
+            update = self.poll()
+            if update:
+                yield update
+        feeder.result()
+
+    def poll(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_push < EMOTION_STREAM_PUSH_INTERVAL:
+            return None
+        update = self.analyzer.partial()
+        if update:
+            self._last_push = now
+        return update
+
+    async def finish(self) -> dict:
+        """輸入結束：等剩下的畫面分析完，回傳最終結果 (含 AI 評語)"""
+        loop = asyncio.get_event_loop()
+        if self.decoder:
+            self.decoder.close_input()
+            await self._reader
+            error = await loop.run_in_executor(None, self.decoder.wait)
+            if error:
+                print(f"⚠️ [Stream] ffmpeg: {error}")
+        if self._video_file:
+            self._video_file.close()
+
+        result = await loop.run_in_executor(executor, self.analyzer.result, self.video_path, self.save_video)
+        if "error" in result:
+            return result
+        return limit_timeline(await attach_ai_feedback(result))
+
+    async def abort(self):
+        """中斷串流：結束 ffmpeg 並刪除寫到一半的影片"""
+        if self.decoder:
+            self.decoder.kill()
+            if self._reader:
+                try:
+                    await self._reader
+                except Exception:
+                    pass
+        if self._video_file:
+            self._video_file.close()
+            try:
+                os.remove(self.video_path)
+            except OSError:
+                pass
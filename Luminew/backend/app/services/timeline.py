@@ -0,0 +1,143 @@
+# timeline.py
+# 情緒 timeline 的完整解析度保存與降取樣
+#
+# 分析時每個辨識到人臉的幀都會存下 (時間, 四種情緒分數)，放在 TimelineStore (.npz)；
+# 回傳給手機的 timeline 超過 max_points 時，用 LTTB (Largest-Triangle-Three-Buckets)
+# 從完整序列挑點：每個區間保留與前後點構成最大三角形的那一點，峰值與轉折不會被平均掉。
+# 需要細看某一段時，以 GET /emotion/timeline/{timeline_id}?start=&end= 取完整解析度。
+
+import os
+import time
+import uuid
+import numpy as np
+
+from app.core.config import EMOTION_TIMELINE_DIR, EMOTION_CACHE_TTL_HOURS
+from app.services.emotion_model import PROJECT_DIR, CLASSES
+
+# timeline 點的欄位縮寫 (與原本的 {"t", "c", "n", "p", "r"} 相同)
+POINT_KEYS = (("c", "confidence"), ("n", "nervous"), ("p", "passion"), ("r", "relaxed"))
+
+
+def lttb_indices(t: np.ndarray, values: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    LTTB 降取樣，回傳要保留的索引 (含第一與最後一點)
+
+    values 為 (N, K)：K 條序列共用同一組時間點，三角形面積取 K 條的總和，
+    因此挑出的點對四種情緒的轉折都有代表性。
+    """
+    n = len(t)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out <= 2:
+        return np.array([0, n - 1])[:max(n_out, 1)]
+
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    every = (n - 2) / (n_out - 2)
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        # 下一個區間的平均點 (最後一個區間的下一點就是最後一點)
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_t = t[end:next_end].mean()
+        avg_v = values[end:next_end].mean(axis=0)
+
+        area = np.abs((t[a] - avg_t) * (values[start:end] - values[a])
+                      - (t[a] - t[start:end])[:, None] * (avg_v - values[a])).sum(axis=1)
+        a = start + int(area.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def to_points(t: np.ndarray, values: np.ndarray) -> list:
+    """(時間, 0-1 分數) -> [{"t", "c", "n", "p", "r"}]，分數為 0-100 整數"""
+    percents = (values * 100).astype(np.int64)
+    columns = [(key, CLASSES.index(cls)) for key, cls in POINT_KEYS]
+    points = []
+    for ts, pct in zip(t.tolist(), percents):
+        point = {"t": round(ts, 2)}
+        for key, i in columns:
+            point[key] = int(pct[i])
+        points.append(point)
+    return points
+
+
+def downsample(t: np.ndarray, values: np.ndarray, max_points: int) -> list:
+    idx = lttb_indices(t, values, max_points)
+    return to_points(t[idx], values[idx])
+
+
+def points_to_series(points: list):
+    """timeline 點轉回 (時間, 0-1 分數) 陣列 (沒有完整序列時的備援)"""
+    t = np.array([p["t"] for p in points], dtype=np.float64)
+    values = np.zeros((len(points), len(CLASSES)), dtype=np.float64)
+    for key, cls in POINT_KEYS:
+        values[:, CLASSES.index(cls)] = [p[key] / 100 for p in points]
+    return t, values
+
+
+class TimelineStore:
+    """完整解析度 timeline 的磁碟保存 (<dir>/<timeline_id>.npz)"""
+
+    def __init__(self, store_dir: str, ttl_seconds: float):
+        self.store_dir = store_dir
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _path(self, timeline_id: str) -> str:
+        return os.path.join(self.store_dir, f"{timeline_id}.npz")
+
+    def save(self, t: np.ndarray, values: np.ndarray) -> str:
+        timeline_id = uuid.uuid4().hex
+        path = self._path(timeline_id)
+        # np.savez 會自動補 .npz，暫存檔名也要以 .npz 結尾
+        tmp_path = path[:-4] + ".tmp.npz"
+        np.savez(tmp_path, t=t.astype(np.float32), values=values.astype(np.float32))
+        os.replace(tmp_path, path)
+        self._prune()
+        return timeline_id
+
+    def load(self, timeline_id: str):
+        """回傳 (時間, 分數) 陣列；不存在時回傳 None"""
+        if not timeline_id.isalnum():
+            return None
+        try:
+            with np.load(self._path(timeline_id)) as data:
+                return data["t"].astype(np.float64), data["values"].astype(np.float64)
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def window(self, timeline_id: str, start: float = 0, end: float = None, max_points: int = 0):
+        """取 [start, end] 秒之間的點 (預設完整解析度)；timeline 不存在時回傳 None"""
+        series = self.load(timeline_id)
+        if series is None:
+            return None
+        t, values = series
+        lo = np.searchsorted(t, start, side="left")
+        hi = len(t) if end is None else np.searchsorted(t, end, side="right")
+        t, values = t[lo:hi], values[lo:hi]
+        if max_points and len(t) > max_points:
+            return downsample(t, values, max_points)
+        return to_points(t, values)
+
+    def _prune(self):
+        now = time.time()
+        for name in os.listdir(self.store_dir):
+            path = os.path.join(self.store_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl_seconds:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+_store = None
+
+
+def get_timeline_store() -> TimelineStore:
+    global _store
+    if _store is None:
+        store_dir = EMOTION_TIMELINE_DIR or os.path.join(PROJECT_DIR, "cache", "timelines")
+        _store = TimelineStore(store_dir, EMOTION_CACHE_TTL_HOURS * 3600)
+    return _store
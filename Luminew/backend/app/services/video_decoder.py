@@ -0,0 +1,225 @@
+# video_decoder.py
+# 影片取樣讀取：只解碼真正要分析的畫面
+#
+# cap.read() = grab() + retrieve()，其中 retrieve() 才會把畫面轉成 BGR 陣列。
+# 跳過的畫面只呼叫 grab() 前進，省下大部分色彩轉換與記憶體配置。
+#
+# FfmpegFileDecoder (VIDEO_DECODER=ffmpeg) 讓 ffmpeg 在解碼時就完成取樣 (fps=) 與縮放 (scale=)，
+# 手機 1080p 影片不必每幀都以原解析度轉成 BGR 再縮小。
+# FfmpegPipeDecoder 則用於邊上傳邊分析：影片片段透過 pipe 交給 ffmpeg 解碼。
+
+import json
+import subprocess
+import tempfile
+import numpy as np
+from app.core.config import FFMPEG_BIN, FFPROBE_BIN
+
+
+def iter_sampled_frames(cap, read_state: dict, fps: float, sample_fps: float = 0, stride: int = 3):
+    """
+    逐幀前進影片，只 retrieve 要分析的畫面，產出 (frame_count, frame)
+
+    - sample_fps <= 0：固定每 stride 幀取 1 幀 (frame_count % stride == 0)
+    - sample_fps > 0：依影片時間取樣，每秒約 sample_fps 幀，與影片 FPS 無關
+    - read_state["frames"] 會持續更新為目前已讀取的總幀數
+    """
+    use_time = sample_fps and sample_fps > 0
+    sample_period = 1.0 / sample_fps if use_time else 0.0
+    next_sample_t = 0.0
+
+    while True:
+        if not cap.grab():
+            break
+
+        read_state["frames"] += 1
+        frame_count = read_state["frames"]
+
+        if use_time:
+            t = (frame_count - 1) / fps
+            if t + 1e-9 < next_sample_t:
+                continue
+            # 以取樣點為基準往後推，避免累積誤差；落後太多時直接對齊目前時間
+            next_sample_t = max(next_sample_t + sample_period, t)
+        elif frame_count % stride != 0:
+            continue
+
+        ret, frame = cap.retrieve()
+        if not ret:
+            break
+        yield frame_count, frame
+
+
+def _read_exact(stream, buf: np.ndarray) -> bool:
+    """從 pipe 讀滿整個 buffer (原地寫入)；資料不足一幀時回傳 False"""
+    view = memoryview(buf).cast("B")
+    got, total = 0, len(view)
+    while got < total:
+        n = stream.readinto(view[got:])
+        if not n:
+            return False
+        got += n
+    return True
+
+
+def _stderr_tail(f, limit: int = 2000) -> str:
+    """讀出 ffmpeg 寫進暫存檔的錯誤訊息 (只保留最後一段，損壞的影片可能每幀都有錯誤訊息)"""
+    f.seek(0)
+    return f.read().decode(errors="ignore").strip()[-limit:]
+
+
+def probe_video(path: str, ffprobe_bin: str = None):
+    """以 ffprobe 取得 (寬, 高, 旋轉角度)"""
+    out = subprocess.run(
+        [ffprobe_bin or FFPROBE_BIN, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=width,height:stream_tags=rotate:stream_side_data=rotation",
+         "-of", "json", path],
+        capture_output=True, check=True,
+    ).stdout
+    stream = json.loads(out)["streams"][0]
+    rotation = int(stream.get("tags", {}).get("rotate", 0))
+    for side_data in stream.get("side_data_list", []):
+        if "rotation" in side_data:
+            rotation = int(side_data["rotation"])
+    return int(stream["width"]), int(stream["height"]), abs(rotation) % 360
+
+
+class FfmpegFileDecoder:
+    """
+    以 ffmpeg 子行程解碼影片檔，直接輸出取樣、縮放後的畫面
+
+    - 取樣：sample_fps > 0 時每秒 sample_fps 幀，否則 fps / stride (與 iter_sampled_frames 相同密度)
+    - 縮放：寬度縮到 width (不放大)，ffmpeg 會依旋轉資訊自動轉正
+    - 畫面讀進 pool_size 個預先配置的 buffer 輪流使用；同時被持有的畫面
+      (例如管線佇列中的) 不可超過 pool_size - 1 張
+    - gray=True 輸出單通道灰階 (只做偵測時使用；情緒模型需要彩色裁切)
+    - ffmpeg 以非 0 結束 (影片損壞 / 截斷 / 不支援) 時，frames() 在讀完畫面後拋出 RuntimeError
+    """
+
+    def __init__(self, path: str, fps: float, sample_fps: float = 0, stride: int = 3, width: int = 640,
+                 gray: bool = False, pool_size: int = 8, ffmpeg_bin: str = None):
+        src_w, src_h, rotation = probe_video(path)
+        if rotation in (90, 270):
+            src_w, src_h = src_h, src_w
+        out_w = min(width, src_w) // 2 * 2
+        out_h = max(2, int(round(src_h * out_w / src_w / 2)) * 2)
+
+        self.path = path
+        self.fps = fps
+        self.stride = stride
+        self.sample_fps = sample_fps if sample_fps and sample_fps > 0 else 0
+        self.rate = self.sample_fps or fps / stride
+        self.size = (out_w, out_h)
+        self.gray = gray
+        self.ffmpeg_bin = ffmpeg_bin or FFMPEG_BIN
+        shape = (out_h, out_w) if gray else (out_h, out_w, 3)
+        self._pool = [np.empty(shape, dtype=np.uint8) for _ in range(max(2, pool_size))]
+
+    def _frame_count(self, k: int) -> int:
+        """第 k 張輸出畫面對應的原始幀號 (與 iter_sampled_frames 的 frame_count 一致)"""
+        if self.sample_fps:
+            return int(round(k * self.fps / self.sample_fps)) + 1
+        return (k + 1) * self.stride
+
+    def frames(self, read_state: dict):
+        """產出 (frame_count, frame)；read_state["frames"] 更新為目前對應的原始幀號"""
+        out_w, out_h = self.size
+        # stderr 寫到暫存檔 (pipe 沒人讀會塞滿卡住 ffmpeg)，失敗時拿來回報錯誤
+        stderr = tempfile.TemporaryFile()
+        proc = subprocess.Popen(
+            [self.ffmpeg_bin, "-v", "error", "-i", self.path, "-an", "-sn",
+             "-vf", f"fps={self.rate},scale={out_w}:{out_h}",
+             "-f", "rawvideo", "-pix_fmt", "gray" if self.gray else "bgr24", "pipe:1"],
+            stdout=subprocess.PIPE, stderr=stderr, bufsize=self._pool[0].nbytes,
+        )
+        try:
+            k = 0
+            while True:
+                buf = self._pool[k % len(self._pool)]
+                if not _read_exact(proc.stdout, buf):
+                    break
+                frame_count = self._frame_count(k)
+                read_state["frames"] = frame_count
+                k += 1
+                yield frame_count, buf
+            # 輸出結束不代表解碼成功：損壞 / 截斷 / 不支援的影片不能當成正常結果 (也不能進結果快取)
+            returncode = proc.wait()
+            if returncode != 0:
+                raise RuntimeError(f"ffmpeg 解碼失敗 ({k} 張畫面後): {_stderr_tail(stderr) or f'exit code {returncode}'}")
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+            stderr.close()
+
+
+class FfmpegPipeDecoder:
+    """
+    邊收邊解碼：把逐段收到的影片資料 (fragmented MP4 等可串流的格式) 寫進 ffmpeg 的 stdin，
+    從 stdout 讀出固定大小的 BGR 畫面
+
+    - fps 濾鏡在 ffmpeg 內完成取樣，Python 端只拿到要分析的畫面
+    - 畫面等比例縮放後補黑邊成 size x size，不需要事先知道影片解析度 (手機直式影片也適用)
+    - write() 與 frames() 必須在不同線程呼叫，否則 pipe 塞滿時兩邊會互相等待
+    - stderr 寫到暫存檔而不是 pipe：沒有人讀的 pipe 塞滿後 ffmpeg 會卡住
+    """
+
+    def __init__(self, fps: float, size: int = 640, ffmpeg_bin: str = None):
+        self.fps = fps
+        self.size = size
+        self.frame_bytes = size * size * 3
+        vf = (f"fps={fps},scale={size}:{size}:force_original_aspect_ratio=decrease,"
+              f"pad={size}:{size}:(ow-iw)/2:(oh-ih)/2")
+        self._stderr = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(
+            [ffmpeg_bin or FFMPEG_BIN, "-loglevel", "error", "-i", "pipe:0",
+             "-an", "-vf", vf, "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self._stderr,
+        )
+
+    def write(self, chunk: bytes) -> bool:
+        """寫入一段影片資料；ffmpeg 已結束 (例如格式無法解析) 時回傳 False"""
+        try:
+            self.proc.stdin.write(chunk)
+            self.proc.stdin.flush()
+            return True
+        except (BrokenPipeError, ValueError):
+            return False
+
+    def close_input(self):
+        """資料已全部送出，讓 ffmpeg 把剩下的畫面解碼完"""
+        try:
+            self.proc.stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass
+
+    def frames(self):
+        """產出 (frame_count, frame)，frame_count 從 1 開始，以 self.fps 為時間基準"""
+        frame_count = 0
+        while True:
+            buf = bytearray(self.frame_bytes)
+            view = memoryview(buf)
+            got = 0
+            while got < self.frame_bytes:
+                n = self.proc.stdout.readinto(view[got:])
+                if not n:
+                    return
+                got += n
+            frame_count += 1
+            yield frame_count, np.frombuffer(buf, dtype=np.uint8).reshape(self.size, self.size, 3)
+
+    def wait(self) -> str:
+        """等待 ffmpeg 結束，失敗時回傳錯誤訊息 (成功回傳空字串)"""
+        returncode = self.proc.wait()
+        err = ""
+        if returncode != 0 and not self._stderr.closed:
+            err = _stderr_tail(self._stderr)
+        self._stderr.close()
+        if returncode == 0:
+            return ""
+        return err or f"ffmpeg exited with {returncode}"
+
+    def kill(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self._stderr.close()
@@ -0,0 +1,225 @@
+# video_pipeline.py
+# 影片分析管線：解碼 -> 人臉偵測 -> 批次推論 三段並行
+#
+#   [解碼線程] --decode_queue--> [偵測線程 x N] --detect_queue--> [推論 (呼叫端線程)]
+#
+# - 佇列都有上限，任何一段變慢時上游會自動等待，不會把整支影片塞進記憶體
+# - 偵測線程完成順序不固定，推論端用序號重新排序，平滑結果與單線程版本一致
+# - cv2 解碼 / detectMultiScale / torch 推論都會釋放 GIL，因此三段可以真正重疊
+
+import queue
+import threading
+import time
+
+_DONE = object()
+
+
+class _DepthStats:
+    """記錄單一佇列每次放入時的深度，用來調整佇列大小與線程數"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.samples = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, depth: int):
+        self.samples += 1
+        self.total += depth
+        if depth > self.max:
+            self.max = depth
+
+    def as_dict(self) -> dict:
+        avg = self.total / self.samples if self.samples else 0.0
+        return {"maxsize": self.maxsize, "avg": round(avg, 2), "max": self.max}
+
+
+class VideoAnalysisPipeline:
+    """
+    三段式影片分析管線
+
+    - frames: 產生 (frame_count, frame) 的迭代器，已經做好跳幀 (在解碼線程中迭代)
+    - make_detector: 每個偵測線程呼叫一次，回傳 detect(frame) -> 模型輸入或 None
+      (每個線程各自持有偵測器，避免共用 CascadeClassifier)
+    - infer_batch: 接收一批模型輸入，回傳同順序的機率
+    - on_result: 依畫面順序呼叫 on_result(frame_count, probs)
+    """
+
+    def __init__(self, frames, make_detector, infer_batch, on_result,
+                 batch_size: int = 16, detect_workers: int = 2, queue_size: int = 32):
+        self.frames = frames
+        self.make_detector = make_detector
+        self.infer_batch = infer_batch
+        self.on_result = on_result
+        self.batch_size = max(1, batch_size)
+        self.detect_workers = max(1, detect_workers)
+
+        self.decode_queue = queue.Queue(maxsize=queue_size)
+        self.detect_queue = queue.Queue(maxsize=queue_size)
+        self._decode_stats = _DepthStats(queue_size)
+        self._detect_stats = _DepthStats(queue_size)
+
+        self._stop = threading.Event()
+        self._error = None
+        self._error_lock = threading.Lock()
+
+        self.frames_decoded = 0
+        self.faces_detected = 0
+        self.stage_seconds = {"decode": 0.0, "detect": 0.0, "infer": 0.0}
+        self._stage_lock = threading.Lock()
+
+    # ---------------------------
+    # 公開介面
+    # ---------------------------
+    def queue_depths(self) -> dict:
+        """目前各段佇列深度 (可在執行中呼叫)"""
+        return {
+            "decode_queue": self.decode_queue.qsize(),
+            "detect_queue": self.detect_queue.qsize(),
+        }
+
+    def stats(self) -> dict:
+        """執行結束後的佇列深度統計與各段耗時"""
+        return {
+            "decode_queue": self._decode_stats.as_dict(),
+            "detect_queue": self._detect_stats.as_dict(),
+            "detect_workers": self.detect_workers,
+            "batch_size": self.batch_size,
+            "frames_decoded": self.frames_decoded,
+            "faces_detected": self.faces_detected,
+            "stage_seconds": {k: round(v, 3) for k, v in self.stage_seconds.items()},
+        }
+
+    def run(self):
+        """執行整條管線直到影片結束；任何一段出錯會停止全部並在此拋出"""
+        threads = [threading.Thread(target=self._decode_loop, name="pipeline-decode", daemon=True)]
+        for i in range(self.detect_workers):
+            threads.append(threading.Thread(target=self._detect_loop, name=f"pipeline-detect-{i}", daemon=True))
+        for t in threads:
+            t.start()
+
+        try:
+            self._infer_loop()
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._stop.set()
+            for t in threads:
+                t.join()
+
+        if self._error is not None:
+            raise self._error
+
+    # ---------------------------
+    # 內部工具
+    # ---------------------------
+    def _fail(self, error: BaseException):
+        with self._error_lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    def _put(self, q: queue.Queue, stats: _DepthStats, item) -> bool:
+        """有上限的 put；管線停止時放棄並回傳 False"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                stats.record(q.qsize())
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _add_time(self, stage: str, seconds: float):
+        with self._stage_lock:
+            self.stage_seconds[stage] += seconds
+
+    # ---------------------------
+    # 各段工作
+    # ---------------------------
+    def _decode_loop(self):
+        try:
+            seq = 0
+            iterator = iter(self.frames)
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                item = next(iterator, None)
+                self._add_time("decode", time.perf_counter() - t0)
+                if item is None:
+                    break
+                frame_count, frame = item
+                if not self._put(self.decode_queue, self._decode_stats, (seq, frame_count, frame)):
+                    return
+                seq += 1
+                self.frames_decoded = seq
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            for _ in range(self.detect_workers):
+                self._put(self.decode_queue, self._decode_stats, _DONE)
+
+    def _detect_loop(self):
+        try:
+            detect = self.make_detector()
+            while True:
+                item = self._get(self.decode_queue)
+                if item is _DONE:
+                    break
+                seq, frame_count, frame = item
+                t0 = time.perf_counter()
+                face_input = detect(frame)
+                self._add_time("detect", time.perf_counter() - t0)
+                if not self._put(self.detect_queue, self._detect_stats, (seq, frame_count, face_input)):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._put(self.detect_queue, self._detect_stats, _DONE)
+
+    def _infer_loop(self):
+        finished_workers = 0
+        next_seq = 0
+        reorder = {}
+        pending = []
+
+        def flush():
+            if not pending:
+                return
+            t0 = time.perf_counter()
+            probs = self.infer_batch([x for _, x in pending])
+            self._add_time("infer", time.perf_counter() - t0)
+            for (frame_count, _), p in zip(pending, probs):
+                self.on_result(frame_count, p)
+            pending.clear()
+
+        while finished_workers < self.detect_workers:
+            item = self._get(self.detect_queue)
+            if item is _DONE:
+                if self._stop.is_set():
+                    return
+                finished_workers += 1
+                continue
+
+            seq, frame_count, face_input = item
+            reorder[seq] = (frame_count, face_input)
+
+            # 依序號把已到齊的畫面送進批次
+            while next_seq in reorder:
+                frame_count, face_input = reorder.pop(next_seq)
+                next_seq += 1
+                if face_input is None:
+                    continue
+                self.faces_detected += 1
+                pending.append((frame_count, face_input))
+                if len(pending) >= self.batch_size:
+                    flush()
+
+        flush()
@@ -0,0 +1 @@
+# benchmarks: 效能量測腳本 (在 Luminew/backend 目錄下以 python -m benchmarks.<name> 執行)
@@ -0,0 +1,115 @@
+# bench_face_detector.py
+# 比較各人臉偵測後端在樣本影片上的速度與偵測率
+#
+# 用法 (在 Luminew/backend 目錄下)：
+#   python -m benchmarks.bench_face_detector                       # 使用 benchmarks/samples/ 內所有影片
+#   python -m benchmarks.bench_face_detector a.mp4 b.mp4 --backends haar yunet --stride 3
+#
+# 取樣與縮圖方式與 emotion_service 相同 (每 stride 幀取 1 幀、寬度縮到 640)，
+# 偵測率 = 找到至少一張臉的取樣幀 / 總取樣幀。
+
+import argparse
+import os
+import time
+import cv2
+
+from app.services.face_detector import BACKENDS, create_face_detector
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples")
+VIDEO_EXTS = (".mp4", ".avi", ".mov", ".mkv")
+
+
+def collect_videos(paths):
+    videos = []
+    for p in paths or [SAMPLES_DIR]:
+        if os.path.isdir(p):
+            videos += sorted(os.path.join(p, f) for f in os.listdir(p) if f.lower().endswith(VIDEO_EXTS))
+        elif os.path.isfile(p):
+            videos.append(p)
+    return videos
+
+
+def load_frames(video_path, stride, width, max_frames):
+    """先把取樣幀解碼好放在記憶體，讓計時只包含偵測本身"""
+    frames = []
+    cap = cv2.VideoCapture(video_path)
+    count = 0
+    while cap.grab():
+        count += 1
+        if count % stride != 0:
+            continue
+        ret, frame = cap.retrieve()
+        if not ret:
+            break
+        h, w = frame.shape[:2]
+        if w > width:
+            frame = cv2.resize(frame, (width, int(h * width / w)))
+        frames.append(frame)
+        if max_frames and len(frames) >= max_frames:
+            break
+    cap.release()
+    return frames
+
+
+def bench_backend(backend, frames):
+    detector = create_face_detector(backend)
+    if detector.name != backend:
+        return None
+
+    detector.detect(frames[0])  # 暖機 (DNN 第一次 forward 會比較慢)
+    hits = 0
+    t0 = time.perf_counter()
+    for frame in frames:
+        if len(detector.detect(frame)) > 0:
+            hits += 1
+    elapsed = time.perf_counter() - t0
+    return {
+        "frames": len(frames),
+        "hits": hits,
+        "ms_per_frame": elapsed * 1000 / len(frames),
+        "fps": len(frames) / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="人臉偵測後端效能比較")
+    parser.add_argument("videos", nargs="*", help="影片檔或資料夾 (預設 benchmarks/samples/)")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--stride", type=int, default=3, help="每幾幀取 1 幀")
+    parser.add_argument("--width", type=int, default=640, help="偵測前縮放的最大寬度")
+    parser.add_argument("--max-frames", type=int, default=0, help="每支影片最多取樣幾幀 (0 = 全部)")
+    args = parser.parse_args()
+
+    videos = collect_videos(args.videos)
+    if not videos:
+        print(f"⚠️ 找不到任何影片，請放到 {SAMPLES_DIR} 或在參數指定")
+        return
+
+    totals = {b: {"frames": 0, "hits": 0, "seconds": 0.0} for b in args.backends}
+    print(f"{'video':<32}{'backend':<8}{'frames':>8}{'detect%':>9}{'ms/frame':>10}{'fps':>8}")
+    for video in videos:
+        frames = load_frames(video, args.stride, args.width, args.max_frames)
+        if not frames:
+            print(f"⚠️ 無法讀取: {video}")
+            continue
+        for backend in args.backends:
+            r = bench_backend(backend, frames)
+            if r is None:
+                print(f"{os.path.basename(video)[:31]:<32}{backend:<8}  (模型不存在，略過)")
+                continue
+            totals[backend]["frames"] += r["frames"]
+            totals[backend]["hits"] += r["hits"]
+            totals[backend]["seconds"] += r["ms_per_frame"] * r["frames"] / 1000
+            print(f"{os.path.basename(video)[:31]:<32}{backend:<8}{r['frames']:>8}"
+                  f"{r['hits'] * 100 / r['frames']:>8.1f}%{r['ms_per_frame']:>10.2f}{r['fps']:>8.1f}")
+
+    print("\n=== 總計 ===")
+    for backend, t in totals.items():
+        if not t["frames"]:
+            continue
+        print(f"{backend:<8} 偵測率 {t['hits'] * 100 / t['frames']:5.1f}%  "
+              f"{t['seconds'] * 1000 / t['frames']:7.2f} ms/frame  {t['frames'] / t['seconds']:7.1f} fps")
+
+
+if __name__ == "__main__":
+    main()
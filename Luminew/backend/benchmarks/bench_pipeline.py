@@ -0,0 +1,240 @@
+# bench_pipeline.py
+# 整條 analyze_video 的效能量測：解碼器 / 偵測器 / 推論引擎 各種組合
+#
+# 用法 (在 Luminew/backend 目錄下)：
+#   python -m benchmarks.synthetic                                   # 先產生合成影片 (可選)
+#   python -m benchmarks.bench_pipeline                              # samples/ + synthetic/ 內所有影片
+#   python -m benchmarks.bench_pipeline a.mp4 --decoders opencv ffmpeg --detectors haar yunet \
+#       --engines torch onnx --repeat 3 --json bench.json
+#
+# 每個 (影片, 組合) 都在獨立的子行程執行：設定在 import 時讀取，且 peak RSS 才不會互相影響。
+# 完全離線：OpenAI 評語改成固定的 stub，結果快取關閉。
+# 報告：
+#   - fps：每秒分析的取樣幀數；x realtime：影片長度 / 處理時間
+#   - decode / detect / infer：各階段累計秒數 (管線模式下各階段重疊，總和會大於 wall time)
+#   - RSS：子行程 peak RSS
+#   - Δbase：與第一個組合的最終分數最大差 (百分點)；Δrun：同一組合重複執行間的最大差
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_face_detector import collect_videos, SAMPLES_DIR
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SYNTHETIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "synthetic")
+RESULT_PREFIX = "BENCH_RESULT "
+
+
+# ---------------------------
+# 子行程：實際執行分析
+# ---------------------------
+class _StageTimer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.seconds = {"decode": 0.0, "detect": 0.0, "infer": 0.0}
+        self.counts = {"decode": 0, "detect": 0, "infer": 0}
+
+    def add(self, stage: str, seconds: float, count: int = 1):
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.counts[stage] += count
+
+    def wrap(self, stage: str, fn, count=lambda args, result: 1):
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            result = fn(*args, **kwargs)
+            self.add(stage, time.perf_counter() - t0, count(args, result))
+            return result
+        return timed
+
+    def wrap_iter(self, stage: str, frames):
+        it = iter(frames)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            self.add(stage, time.perf_counter() - t0)
+            yield item
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 單位是 KB，macOS 是 bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_worker(video: str, repeat: int):
+    import asyncio
+    import cv2
+    from app.services import emotion_service as svc
+
+    cap = cv2.VideoCapture(video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    cap.release()
+
+    timer = _StageTimer()
+    open_frames = svc._open_frames
+    svc._open_frames = lambda *a, **kw: timer.wrap_iter("decode", open_frames(*a, **kw))
+    svc._detect_face_crop = timer.wrap("detect", svc._detect_face_crop)
+    svc._infer_batch = timer.wrap("infer", svc._infer_batch, count=lambda args, result: len(args[0]))
+    # 離線：不呼叫 OpenAI
+    svc._generate_ai_feedback_sync = lambda scores: {"overall_score": 0, "comment": "benchmark", "suggestion": ""}
+
+    t0 = time.perf_counter()
+    warm = svc.warmup()
+    load_seconds = time.perf_counter() - t0
+
+    runs = []
+    for _ in range(repeat):
+        timer.reset()
+        t0 = time.perf_counter()
+        # save_video=True：不刪除樣本影片；max_points=0：保留完整 timeline 方便比對
+        result = asyncio.run(svc.analyze_video(video, True, max_points=0))
+        wall = time.perf_counter() - t0
+        runs.append({
+            "wall": wall,
+            "stages": dict(timer.seconds),
+            "sampled_frames": timer.counts["decode"],
+            "faces": timer.counts["infer"],
+            "emotions": result.get("emotions"),
+            "error": result.get("error"),
+        })
+
+    print(RESULT_PREFIX + json.dumps({
+        "engine": warm.get("engine"),
+        "detector": warm.get("detector"),
+        "load_seconds": load_seconds,
+        "video_seconds": total_frames / fps if fps else 0,
+        "runs": runs,
+        "peak_rss_mb": _peak_rss_mb(),
+    }))
+
+
+# ---------------------------
+# 主行程：組合矩陣 + 報告
+# ---------------------------
+def _max_diff(a: dict, b: dict):
+    if not a or not b:
+        return None
+    return max(abs(a[k] - b.get(k, 0)) for k in a)
+
+
+def run_config(video: str, config: dict, repeat: int, timeline_dir: str):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "",
+        "EMOTION_CACHE": "0",
+        "EMOTION_EXECUTOR": "thread",
+        "EMOTION_TIMELINE_DIR": timeline_dir,
+    })
+    env.update(config)
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_pipeline", "--worker", video, "--repeat", str(repeat)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    print(proc.stderr[-2000:])
+    return None
+
+
+def summarize(report: dict, baseline: dict):
+    runs = report["runs"]
+    best = min(runs, key=lambda r: r["wall"])
+    emotions = runs[0]["emotions"]
+    repeat_diff = max((_max_diff(emotions, r["emotions"]) or 0) for r in runs) if emotions else None
+    return {
+        "fps": best["sampled_frames"] / best["wall"] if best["wall"] else 0.0,
+        "realtime": report["video_seconds"] / best["wall"] if best["wall"] else 0.0,
+        "wall": best["wall"],
+        "stages": best["stages"],
+        "faces": best["faces"],
+        "sampled_frames": best["sampled_frames"],
+        "emotions": emotions,
+        "error": runs[0]["error"],
+        "baseline_diff": _max_diff(emotions, baseline["runs"][0]["emotions"]) if baseline else None,
+        "repeat_diff": repeat_diff,
+        "peak_rss_mb": report["peak_rss_mb"],
+        "load_seconds": report["load_seconds"],
+    }
+
+
+def _fmt(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="analyze_video 效能量測 (離線)")
+    parser.add_argument("videos", nargs="*", help="影片檔或資料夾 (預設 samples/ 與 synthetic/)")
+    parser.add_argument("--decoders", nargs="+", default=["opencv"], choices=["opencv", "ffmpeg"])
+    parser.add_argument("--detectors", nargs="+", default=["haar"], choices=["haar", "ssd", "yunet"])
+    parser.add_argument("--engines", nargs="+", default=["torch"], choices=["torch", "torchscript", "onnx"])
+    parser.add_argument("--pipeline", nargs="+", default=["1"], choices=["0", "1"], help="EMOTION_PIPELINE")
+    parser.add_argument("--repeat", type=int, default=1, help="每個組合重複幾次 (取最快的一次)")
+    parser.add_argument("--json", default="", help="把完整結果寫到 JSON 檔")
+    parser.add_argument("--worker", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, max(1, args.repeat))
+        return
+
+    videos = collect_videos(args.videos or [SAMPLES_DIR, SYNTHETIC_DIR])
+    if not videos:
+        print(f"⚠️ 找不到任何影片，請執行 python -m benchmarks.synthetic 或把影片放到 {SAMPLES_DIR}")
+        return
+
+    configs = [
+        {"VIDEO_DECODER": d, "EMOTION_FACE_DETECTOR": f, "EMOTION_ENGINE": e, "EMOTION_PIPELINE": p}
+        for d, f, e, p in itertools.product(args.decoders, args.detectors, args.engines, args.pipeline)
+    ]
+
+    results = []
+    print(f"{'video':<28}{'decoder':<8}{'detect':<7}{'engine':<12}{'pipe':>5}{'fps':>8}{'x rt':>7}"
+          f"{'decode':>8}{'detect':>8}{'infer':>8}{'RSS MB':>8}{'Δbase':>7}{'Δrun':>6}  emotions")
+    with tempfile.TemporaryDirectory() as timeline_dir:
+        for video in videos:
+            baseline = None
+            for config in configs:
+                report = run_config(video, config, args.repeat, timeline_dir)
+                name = os.path.basename(video)[:27]
+                if report is None:
+                    print(f"{name:<28}{config['VIDEO_DECODER']:<8}{config['EMOTION_FACE_DETECTOR']:<7}"
+                          f"{config['EMOTION_ENGINE']:<12}  (執行失敗)")
+                    continue
+                baseline = baseline or report
+                s = summarize(report, baseline)
+                results.append({"video": video, "config": config, **s})
+                stages = s["stages"]
+                print(f"{name:<28}{config['VIDEO_DECODER']:<8}{report['detector'] or '-':<7}"
+                      f"{report['engine'] or '-':<12}{config['EMOTION_PIPELINE']:>5}{s['fps']:>8.1f}"
+                      f"{s['realtime']:>7.1f}{stages['decode']:>8.2f}{stages['detect']:>8.2f}{stages['infer']:>8.2f}"
+                      f"{_fmt(s['peak_rss_mb'], '.0f'):>8}{_fmt(s['baseline_diff'], 'd'):>7}"
+                      f"{_fmt(s['repeat_diff'], 'd'):>6}  {s['emotions'] or s['error']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 已寫入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
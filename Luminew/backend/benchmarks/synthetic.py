@@ -0,0 +1,99 @@
+# synthetic.py
+# 產生合成測試影片 (不同解析度 / fps / 長度)，給 bench_pipeline 使用
+#
+# 用法 (在 Luminew/backend 目錄下)：
+#   python -m benchmarks.synthetic                                   # 預設組合，輸出到 benchmarks/synthetic/
+#   python -m benchmarks.synthetic --sizes 720p 1080p_portrait --fps 30 60 --seconds 10 60
+#   python -m benchmarks.synthetic --face benchmarks/samples/face.jpg
+#
+# 畫面是移動的漸層背景 + 沿 Lissajous 路徑移動的人臉。
+# 有提供 --face (或 samples/face.jpg 存在) 時貼上真實人臉照片，偵測器才會穩定找到臉；
+# 否則畫一張卡通臉，只適合量測解碼 / 偵測的速度 (偵測率與情緒結果沒有參考價值)。
+
+import argparse
+import os
+import numpy as np
+import cv2
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(BENCH_DIR, "synthetic")
+DEFAULT_FACE = os.path.join(BENCH_DIR, "samples", "face.jpg")
+
+SIZES = {
+    "480p": (854, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1080p_portrait": (1080, 1920),
+}
+
+
+def _cartoon_face(size: int):
+    face = np.full((size, size, 3), 255, dtype=np.uint8)
+    c = size // 2
+    cv2.ellipse(face, (c, c), (int(size * 0.38), int(size * 0.48)), 0, 0, 360, (150, 180, 225), -1)
+    for dx in (-0.15, 0.15):
+        cv2.circle(face, (int(c + dx * size), int(c - 0.1 * size)), max(2, size // 20), (40, 40, 40), -1)
+    cv2.ellipse(face, (c, int(c + 0.2 * size)), (size // 7, size // 16), 0, 0, 180, (60, 60, 160), max(2, size // 40))
+    return face
+
+
+def _load_face(face_path: str, size: int):
+    img = cv2.imread(face_path) if face_path else None
+    if img is None:
+        return _cartoon_face(size), False
+    h, w = img.shape[:2]
+    scale = size / max(h, w)
+    return cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA), True
+
+
+def make_video(path: str, size, fps: float, seconds: float, face_path: str = None) -> bool:
+    """寫出一支合成影片，回傳是否使用了真實人臉"""
+    w, h = size
+    face, real_face = _load_face(face_path, int(min(w, h) * 0.4))
+    fh, fw = face.shape[:2]
+
+    xs = np.linspace(0, 255, w, dtype=np.float32)
+    ys = np.linspace(0, 255, h, dtype=np.float32)
+    base = (xs[None, :] * 0.6 + ys[:, None] * 0.4).astype(np.uint8)
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+    if not writer.isOpened():
+        raise RuntimeError(f"無法寫入影片: {path}")
+
+    frame = np.empty((h, w, 3), dtype=np.uint8)
+    total = int(round(fps * seconds))
+    for i in range(total):
+        t = i / fps
+        shifted = np.roll(base, int(t * 40) % w, axis=1)
+        frame[:, :, 0] = shifted
+        frame[:, :, 1] = 255 - shifted
+        frame[:, :, 2] = 128
+        # 人臉在畫面中央附近緩慢移動 (模擬面試時的頭部晃動)
+        x = int((w - fw) / 2 + (w - fw) * 0.2 * np.sin(t * 0.9))
+        y = int((h - fh) / 2 + (h - fh) * 0.15 * np.sin(t * 1.3))
+        frame[y:y + fh, x:x + fw] = face
+        writer.write(frame)
+    writer.release()
+    return real_face
+
+
+def main():
+    parser = argparse.ArgumentParser(description="產生合成測試影片")
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES), choices=list(SIZES))
+    parser.add_argument("--fps", nargs="+", type=float, default=[30])
+    parser.add_argument("--seconds", nargs="+", type=float, default=[10])
+    parser.add_argument("--face", default=DEFAULT_FACE, help="貼在畫面上的人臉照片")
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    for name in args.sizes:
+        for fps in args.fps:
+            for seconds in args.seconds:
+                path = os.path.join(args.output, f"synthetic_{name}_{fps:g}fps_{seconds:g}s.mp4")
+                real_face = make_video(path, SIZES[name], fps, seconds, args.face)
+                print(f"🎬 {path}{'' if real_face else ' (卡通臉)'}")
+
+
+if __name__ == "__main__":
+    main()
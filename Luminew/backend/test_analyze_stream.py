@@ -0,0 +1,159 @@
+# test_analyze_stream.py
+# 確認 POST /emotion/analyze_stream 真的收得到 chunked 上傳的內容 (透過真正的 uvicorn 伺服器，
+# TestClient 不會跑 StreamingResponse 的斷線偵測，測不出內容被搶走的問題)
+# 執行：python -m pytest test_analyze_stream.py  或  python test_analyze_stream.py
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+
+from app.core.upload_stream import RequestBodyReader, BodyStreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+CHUNKS = 40
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LiveServer:
+    """在背景線程跑 uvicorn (with LiveServer(app) as base_url: ...)"""
+
+    def __init__(self, app):
+        self.port = _free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            assert time.monotonic() < deadline, "uvicorn 沒有啟動"
+            time.sleep(0.05)
+        return f"http://127.0.0.1:{self.port}"
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def post_chunked(url: str, chunks, timeout: float = 60):
+    """以 chunked 上傳並解析 SSE，回傳 [(event, data)]"""
+    def body():
+        for chunk in chunks:
+            yield chunk
+            time.sleep(0.001)  # 讓伺服器在上傳途中就開始回應
+
+    events, event = [], None
+    with httpx.Client(timeout=timeout) as client:
+        with client.stream("POST", url, content=body()) as response:
+            assert response.status_code == 200
+            for line in response.iter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+
+def make_echo_app():
+    """和 analyze_stream 相同的讀取方式，每收到一段就回報累計的 bytes"""
+    app = FastAPI()
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        body = RequestBodyReader(request)
+
+        async def events():
+            total = 0
+            try:
+                async for chunk in body.chunks():
+                    total += len(chunk)
+                    yield f"event: partial\ndata: {json.dumps({'bytes': total})}\n\n"
+                yield f"event: result\ndata: {json.dumps({'bytes': total})}\n\n"
+            finally:
+                await body.close()
+
+        return BodyStreamingResponse(events(), body, media_type="text/event-stream")
+
+    return app
+
+
+def test_body_reaches_streaming_response():
+    payload = [bytes([i % 256]) * CHUNK_SIZE for i in range(CHUNKS)]
+    with LiveServer(make_echo_app()) as base_url:
+        events = post_chunked(f"{base_url}/echo", payload)
+
+    assert events[-1] == ("result", {"bytes": CHUNK_SIZE * CHUNKS})
+    # 上傳途中就有回應 (不是全部收完才處理)
+    assert len(events) > 2
+
+
+def test_analyze_stream_endpoint():
+    """完整端點：合成一支有人臉的 fragmented MP4，以 chunked 上傳 (需要 torch / cv2 / ffmpeg 與人臉照片)"""
+    import pytest
+    pytest.importorskip("torch")
+    pytest.importorskip("cv2")
+    from app.core.config import FFMPEG_BIN
+    from benchmarks.synthetic import make_video, DEFAULT_FACE
+    if shutil.which(FFMPEG_BIN) is None:
+        pytest.skip("找不到 ffmpeg")
+    if not os.path.exists(DEFAULT_FACE):
+        pytest.skip("沒有 benchmarks/samples/face.jpg，合成影片偵測不到人臉")
+    import subprocess
+    from app.main import app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mp4_path = os.path.join(tmp, "face.mp4")
+        fmp4_path = os.path.join(tmp, "face_frag.mp4")
+        make_video(mp4_path, (640, 480), 15, 3, DEFAULT_FACE)
+        subprocess.run([FFMPEG_BIN, "-v", "error", "-y", "-i", mp4_path, "-c", "copy",
+                        "-movflags", "frag_keyframe+empty_moov", fmp4_path], check=True)
+        with open(fmp4_path, "rb") as f:
+            data = f.read()
+
+    chunks = [data[i:i + 16 * 1024] for i in range(0, len(data), 16 * 1024)]
+    with LiveServer(app) as base_url:
+        events = post_chunked(f"{base_url}/emotion/analyze_stream?fps=5", chunks, timeout=300)
+
+    event, result = events[-1]
+    assert event == "result", result
+    assert sum(result["emotions"].values()) > 0
+
+
+def test_partials_are_timer_driven():
+    """上傳暫停時 (feeder 沒有新資料) 部分結果仍依 EMOTION_STREAM_PUSH_INTERVAL 送出"""
+    import asyncio
+    import pytest
+    pytest.importorskip("cv2")
+    from app.services.stream_analyzer import StreamSession
+
+    class CountingSession(StreamSession):
+        polls = 0
+
+        def poll(self, force: bool = False):
+            self.polls += 1
+            return {"type": "partial", "n": self.polls}
+
+    async def main():
+        session = CountingSession("jpeg")
+        stalled = asyncio.create_task(asyncio.sleep(1.6))  # 前端 1.6 秒沒有送資料
+        return [u async for u in session.partials_while(stalled)]
+
+    updates = asyncio.run(main())
+    assert len(updates) >= 3
+
+
+if __name__ == "__main__":
+    test_body_reaches_streaming_response()
+    print("✅ analyze_stream 收得到 chunked 上傳的內容")
@@ -0,0 +1,69 @@
+# test_preprocess.py
+# 確認 cv2/NumPy 前處理與原本的 torchvision transform 結果一致
+# 執行：python -m pytest test_preprocess.py  或  python test_preprocess.py
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from app.services.preprocess import FaceBatchBuffer, resize_face
+
+# 原本 emotion_service 使用的前處理
+reference_transform = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize([0.5]*3, [0.5]*3)
+])
+
+# 容許誤差 (正規化後數值範圍 [-1, 1])
+MEAN_TOLERANCE = 0.01
+MAX_TOLERANCE = 0.15
+
+
+def make_face_like_crop(w, h, seed=0):
+    """產生平滑、類似人臉裁切的 BGR 影像 (漸層 + 橢圓 + 模糊)"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    img = np.zeros((h, w, 3), dtype=np.float32)
+    for c in range(3):
+        img[..., c] = 60 + 120 * (xx / w) * rng.uniform(0.5, 1.0) + 60 * (yy / h) * rng.uniform(0.5, 1.0)
+    img = np.clip(img, 0, 255).astype(np.uint8)
+    cv2.ellipse(img, (w // 2, h // 2), (w // 3, h // 2 - 2), 0, 0, 360, (90, 140, 200), -1)
+    cv2.circle(img, (w // 3, h // 3), max(2, w // 12), (40, 40, 40), -1)
+    cv2.circle(img, (2 * w // 3, h // 3), max(2, w // 12), (40, 40, 40), -1)
+    return cv2.GaussianBlur(img, (5, 5), 0)
+
+
+def reference(face_crop):
+    rgb = cv2.cvtColor(face_crop, cv2.COLOR_BGR2RGB)
+    return reference_transform(Image.fromarray(rgb))
+
+
+def test_fast_preprocess_matches_torchvision():
+    sizes = [(96, 96), (150, 180), (224, 224), (320, 300), (480, 520)]  # 放大、不變、縮小
+    crops = [make_face_like_crop(w, h, seed=i) for i, (w, h) in enumerate(sizes)]
+
+    buffer = FaceBatchBuffer(len(crops))
+    batch = buffer.load([resize_face(c) for c in crops])
+    assert tuple(batch.shape) == (len(crops), 3, 224, 224)
+    assert batch.dtype == torch.float32
+
+    for i, crop in enumerate(crops):
+        diff = (batch[i] - reference(crop)).abs()
+        assert diff.mean().item() < MEAN_TOLERANCE, f"{sizes[i]} mean diff {diff.mean().item():.4f}"
+        assert diff.max().item() < MAX_TOLERANCE, f"{sizes[i]} max diff {diff.max().item():.4f}"
+
+
+def test_buffer_is_reused_between_batches():
+    buffer = FaceBatchBuffer(4)
+    first = buffer.load([resize_face(make_face_like_crop(200, 200))])
+    second = buffer.load([resize_face(make_face_like_crop(120, 120, seed=3))] * 2)
+    assert first.data_ptr() == second.data_ptr()
+    assert tuple(second.shape) == (2, 3, 224, 224)
+
+
+if __name__ == "__main__":
+    test_fast_preprocess_matches_torchvision()
+    test_buffer_is_reused_between_batches()
+    print("✅ 前處理結果與 torchvision transform 一致")
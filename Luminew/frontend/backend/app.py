@@ -12,6 +12,7 @@ import sys
 import traceback 
 from collections import deque 
 import uuid
+from face_detector import create_face_detector
 
 # 1. 載入環境變數 (讀取 .env)
 load_dotenv()
@@ -39,17 +40,9 @@ if OPENAI_API_KEY:
 else:
     print("❌ 錯誤：找不到 OPENAI_API_KEY，請檢查 .env 檔案")
 
-# 載入人臉辨識器 (優先讀取本地，讀不到才讀系統)
-HAAR_PATH = os.path.join(PROJECT_DIR, "haarcascade_frontalface_default.xml")
-if not os.path.exists(HAAR_PATH):
-    print(f"⚠️ 本地找不到 {HAAR_PATH}，嘗試使用 OpenCV 內建路徑...")
-    HAAR_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-
-print(f"📂 正在載入人臉辨識檔：{HAAR_PATH}")
-face_cascade = cv2.CascadeClassifier(HAAR_PATH)
-
-if face_cascade.empty():
-    print("❌ 嚴重錯誤：無法載入人臉辨識器 (xml 檔案損毀或路徑錯誤)")
+# 載入人臉辨識器 (EMOTION_FACE_DETECTOR: haar / ssd / yunet，DNN 模型缺少時自動退回 haar)
+face_detector = create_face_detector()
+print(f"📂 人臉偵測後端：{face_detector.name}")
 
 # 載入情緒模型 (ResNet18)
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -87,6 +80,106 @@ transform = transforms.Compose([
     transforms.Normalize([0.5]*3, [0.5]*3)
 ])
 
+# -----------------------------
+# 影片方向：每支影片只決定一次，而不是每幀都試三種角度
+# -----------------------------
+# 偵測前統一縮放的寬度 (比之前的 360 大一點，增加辨識率)
+DETECT_WIDTH = 480
+# 要嘗試的方向 (None 代表不轉)
+ROTATION_CANDIDATES = [None, cv2.ROTATE_90_CLOCKWISE, cv2.ROTATE_90_COUNTERCLOCKWISE]
+# 同一方向累積幾次偵測成功就鎖定
+ORIENTATION_LOCK_HITS = 3
+# 最多試探幾個取樣幀，之後改用目前命中最多的方向
+ORIENTATION_PROBE_FRAMES = 15
+
+# 容器旋轉資訊 (度，順時針) -> cv2.rotate 代碼
+_META_ROTATIONS = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+
+def orientation_from_metadata(cap):
+    """
+    從容器的 rotation metadata 決定方向
+
+    回傳 (已決定, rot_code)。OpenCV 預設會自動套用 metadata (ORIENTATION_AUTO)，
+    此時讀到的畫面已經是正的，直接鎖定為不旋轉；沒有 metadata 時回傳 (False, None)。
+    """
+    meta_prop = getattr(cv2, "CAP_PROP_ORIENTATION_META", None)
+    if meta_prop is None:
+        return False, None
+    degrees = int(cap.get(meta_prop)) % 360
+    if degrees == 0:
+        return False, None
+
+    auto_prop = getattr(cv2, "CAP_PROP_ORIENTATION_AUTO", None)
+    if auto_prop is not None and cap.get(auto_prop) != 0:
+        return True, None
+    return True, _META_ROTATIONS.get(degrees)
+
+
+def rotate_and_resize(frame, rot_code, target_w=DETECT_WIDTH):
+    """
+    旋轉 + 縮放到寬度 target_w，先縮小再旋轉 (旋轉的像素量少很多)
+
+    90 度旋轉時，旋轉後的寬度是原本的高度，所以縮放比例以原高度計算。
+    cv2.resize 會產生新陣列，不需要先 copy 原圖。
+    """
+    h, w = frame.shape[:2]
+    if rot_code in (cv2.ROTATE_90_CLOCKWISE, cv2.ROTATE_90_COUNTERCLOCKWISE):
+        new_long = int(w * target_w / h)
+        small = cv2.resize(frame, (new_long, target_w))
+    else:
+        small = cv2.resize(frame, (target_w, int(h * target_w / w)))
+
+    if rot_code is not None:
+        small = cv2.rotate(small, rot_code)
+    return small
+
+
+class OrientationLock:
+    """
+    每支影片的方向狀態
+
+    - metadata 有方向時直接鎖定
+    - 否則前幾個取樣幀照舊嘗試所有方向，某個方向命中 ORIENTATION_LOCK_HITS 次即鎖定
+    - 超過 ORIENTATION_PROBE_FRAMES 幀仍未鎖定時，鎖定目前命中最多的方向
+    鎖定後每幀只做一次縮放 + 偵測，成本不隨候選方向數增加
+    """
+
+    def __init__(self, cap):
+        self.locked, self.rot_code = orientation_from_metadata(cap)
+        self.source = "metadata" if self.locked else None
+        self.hits = {}
+        self.probed = 0
+
+    def candidates(self):
+        if self.locked:
+            return [self.rot_code]
+        return ROTATION_CANDIDATES
+
+    def record(self, rot_code):
+        """回報這一幀在哪個方向找到臉 (找不到傳 False)"""
+        if self.locked:
+            return
+        self.probed += 1
+        if rot_code is not False:
+            self.hits[rot_code] = self.hits.get(rot_code, 0) + 1
+            if self.hits[rot_code] >= ORIENTATION_LOCK_HITS:
+                self._lock(rot_code, "detection")
+                return
+        if self.probed >= ORIENTATION_PROBE_FRAMES and self.hits:
+            self._lock(max(self.hits, key=self.hits.get), "detection")
+
+    def _lock(self, rot_code, source):
+        self.locked = True
+        self.rot_code = rot_code
+        self.source = source
+        print(f"🧭 影片方向已鎖定: {rot_code} (依據: {source})")
+
+
 # -----------------------------
 # Route: 存取影片 (支援 Range Request，Android 需要)
 # -----------------------------
@@ -185,6 +278,9 @@ def analyze_video():
         # ★★★ 平滑隊列 ★★★
         smooth_queue = deque(maxlen=5) # 這裡直接宣告就好，不用 check locals
 
+        # ★★★ 影片方向 (metadata 或前幾次偵測結果決定，之後每幀沿用) ★★★
+        orientation = OrientationLock(cap)
+
         with torch.no_grad():
             while True:
                 ret, frame = cap.read()
@@ -195,43 +291,30 @@ def analyze_video():
                 if frame_count % 3 != 0: continue # 跳幀處理，加快速度 (每3幀取1幀)
 
                 # -------------------------------------------------------------
-                # 【暴力修正區塊】多角度人臉搜尋
-                # 我們不再猜測影片是否需要旋轉，而是直接嘗試三種角度：
-                # 1. 原始  2. 順時針90度  3. 逆時針90度
+                # 【方向判斷】每支影片只決定一次方向
+                # 方向未鎖定前才會嘗試三種角度：1. 原始  2. 順時針90度  3. 逆時針90度
                 # -------------------------------------------------------------
                 
                 found_face_info = None # 用來存 (正確角度的frame, faces)
+                found_rot = False
 
-                # 定義要嘗試的操作清單 (None代表不轉)
-                rotation_attempts = [None, cv2.ROTATE_90_CLOCKWISE, cv2.ROTATE_90_COUNTERCLOCKWISE]
-                
-                for rot_code in rotation_attempts:
-                    # 複製一份目前的 frame 來轉，避免汙染原圖
-                    temp_frame = frame.copy()
-                    
-                    if rot_code is not None:
-                        temp_frame = cv2.rotate(temp_frame, rot_code)
+                for rot_code in orientation.candidates():
+                    # 旋轉與縮放一次完成 (避免圖片太大 Haar 跑不動，也避免太小抓不到)
+                    temp_frame = rotate_and_resize(frame, rot_code)
                     
-                    # 統一縮放 (避免圖片太大 Haar 跑不動，也避免太小抓不到)
-                    # 這裡強制鎖定寬度 480 (比之前的 360 大一點，增加辨識率)
-                    target_w = 480
-                    h_curr, w_curr, _ = temp_frame.shape
-                    scale = target_w / w_curr
-                    new_h = int(h_curr * scale)
-                    temp_frame = cv2.resize(temp_frame, (target_w, new_h))
-                    
-                    gray = cv2.cvtColor(temp_frame, cv2.COLOR_BGR2GRAY)
-                    
-                    # ★★★ 使用與你 PC 版完全相同的參數 (1.1, 8) ★★★
+                    # ★★★ Haar 後端使用與你 PC 版完全相同的參數 (1.1, 8) ★★★
                     # 這能確保只要 PC 版能抓到，Server 版就能抓到
-                    faces = face_cascade.detectMultiScale(gray, 1.1, 8)
+                    faces = face_detector.detect(temp_frame)
                     
                     if len(faces) > 0:
                         # 找到了！記錄下來並跳出迴圈
                         found_face_info = (temp_frame, faces)
+                        found_rot = rot_code
                         break 
+
+                orientation.record(found_rot)
                 
-                # 如果轉了三圈還是沒臉，就放棄這一幀
+                # 如果所有候選方向都沒臉，就放棄這一幀
                 if found_face_info is None:
                     continue
 
@@ -0,0 +1,31 @@
+# fileName: backend/face_detector.py
+# 人臉偵測後端：與 FastAPI 服務共用 Luminew/backend/app/services/face_detector.py，不另外維護一份
+#
+# 以檔案路徑載入共用模組：不能把 Luminew/backend 加進 sys.path，
+# 那裡的 app 套件 (沒有 __init__.py) 會被本目錄的 app.py 蓋掉。
+# 設定由環境變數 EMOTION_FACE_DETECTOR / EMOTION_DNN_CONFIDENCE 傳入；
+# DNN 模型檔放在 Luminew/backend/models (或以 SSD_PROTOTXT_PATH / SSD_MODEL_PATH / YUNET_MODEL_PATH 指定)
+
+import importlib.util
+import os
+
+SHARED_PATH = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "backend", "app", "services", "face_detector.py"))
+
+_spec = importlib.util.spec_from_file_location("luminew_face_detector", SHARED_PATH)
+_shared = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_shared)
+
+BACKENDS = _shared.BACKENDS
+FaceDetector = _shared.FaceDetector
+HaarFaceDetector = _shared.HaarFaceDetector
+SsdFaceDetector = _shared.SsdFaceDetector
+YuNetFaceDetector = _shared.YuNetFaceDetector
+
+
+def create_face_detector(backend: str = None) -> FaceDetector:
+    """依名稱 (預設讀 EMOTION_FACE_DETECTOR) 建立偵測器；DNN 模型缺少時退回 Haar"""
+    return _shared.create_face_detector(
+        backend or os.getenv("EMOTION_FACE_DETECTOR", "haar"),
+        float(os.getenv("EMOTION_DNN_CONFIDENCE", "0.6")),
+    )